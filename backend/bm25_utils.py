@@ -0,0 +1,206 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+
+# Persisted next to ./chroma_db
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "bm25_index.db")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Terms whose idf is below this (they occur in almost every chunk) add
+# nothing to the ranking and are skipped at query time
+BM25_MIN_IDF = float(os.getenv("BM25_MIN_IDF", "0.01"))
+
+# Keeps identifiers such as "AB-1234", "v2.1" or "section_4" as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+# Words that say nothing about a question's topic; in a small corpus they
+# may be rare enough to look informative, so coverage() ignores them
+STOPWORDS = frozenset(
+    "a about an and any are as at be been but by can could did do does for from had has have how i if in is it "
+    "its me my of on or our s should so tell than that the their them then there these they this to was we were "
+    "what when where which who whom why will with would you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+class BM25Index:
+    """In-process inverted index with BM25 scoring over chunk ids.
+
+    Postings live in memory (term -> {chunk_id: term frequency}) and every
+    change is written through to a SQLite file, so the index is loaded
+    rather than rebuilt on start. Chunk text is not stored; callers map the
+    returned ids back to documents."""
+
+    def __init__(self, path: str = BM25_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS bm25_chunks
+                              (chunk_id TEXT PRIMARY KEY,
+                               file_id INTEGER,
+                               length INTEGER) WITHOUT ROWID''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_bm25_chunks_file_id ON bm25_chunks (file_id)')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS bm25_postings
+                              (term TEXT,
+                               chunk_id TEXT,
+                               tf INTEGER,
+                               PRIMARY KEY (term, chunk_id)) WITHOUT ROWID''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_bm25_postings_chunk ON bm25_postings (chunk_id)')
+        self._conn.commit()
+
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.lengths: Dict[str, int] = {}
+        self.file_ids: Dict[str, int] = {}
+        self.total_length = 0
+        # Per-chunk length normalization, recomputed lazily after changes
+        self._norms = None
+        self._load()
+
+    def _load(self):
+        for chunk_id, file_id, length in self._conn.execute('SELECT chunk_id, file_id, length FROM bm25_chunks'):
+            self.lengths[chunk_id] = length
+            self.file_ids[chunk_id] = file_id
+            self.total_length += length
+        for term, chunk_id, tf in self._conn.execute('SELECT term, chunk_id, tf FROM bm25_postings'):
+            self.postings[term][chunk_id] = tf
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, chunk_ids: List[str], texts: List[str], file_ids: List[Optional[int]]):
+        """Index chunks, replacing any earlier version with the same id."""
+        with self._lock:
+            self._remove([chunk_id for chunk_id in chunk_ids if chunk_id in self.lengths])
+            self._norms = None
+            chunk_rows, posting_rows = [], []
+            for chunk_id, text, file_id in zip(chunk_ids, texts, file_ids):
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                self.lengths[chunk_id] = length
+                self.file_ids[chunk_id] = file_id
+                self.total_length += length
+                chunk_rows.append((chunk_id, file_id, length))
+                for term, tf in terms.items():
+                    self.postings[term][chunk_id] = tf
+                    posting_rows.append((term, chunk_id, tf))
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO bm25_chunks VALUES (?, ?, ?)', chunk_rows)
+                self._conn.executemany('INSERT OR REPLACE INTO bm25_postings VALUES (?, ?, ?)', posting_rows)
+
+    def delete(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            self._remove([chunk_id for chunk_id in chunk_ids if chunk_id in self.lengths])
+
+    def delete_file(self, file_id: int):
+        with self._lock:
+            self._remove([chunk_id for chunk_id, fid in self.file_ids.items() if fid == file_id])
+
+    def clear(self):
+        with self._lock:
+            self.postings.clear()
+            self.lengths.clear()
+            self.file_ids.clear()
+            self.total_length = 0
+            self._norms = None
+            with self._conn:
+                self._conn.execute('DELETE FROM bm25_postings')
+                self._conn.execute('DELETE FROM bm25_chunks')
+
+    def _remove(self, chunk_ids: List[str]):
+        if not chunk_ids:
+            return
+        self._norms = None
+        removed = set(chunk_ids)
+        for chunk_id in removed:
+            self.total_length -= self.lengths.pop(chunk_id)
+            self.file_ids.pop(chunk_id, None)
+        # Only the terms of the removed chunks need their postings touched
+        rows = []
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows += self._conn.execute(
+                f'SELECT term, chunk_id FROM bm25_postings WHERE chunk_id IN ({placeholders})', batch
+            ).fetchall()
+        for term, chunk_id in rows:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(chunk_id, None)
+                if not docs:
+                    del self.postings[term]
+        with self._conn:
+            self._conn.executemany('DELETE FROM bm25_postings WHERE chunk_id = ?', [(c,) for c in removed])
+            self._conn.executemany('DELETE FROM bm25_chunks WHERE chunk_id = ?', [(c,) for c in removed])
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Return the k best (chunk_id, score) pairs for the query."""
+        with self._lock:
+            n = len(self.lengths)
+            if not n:
+                return []
+            if self._norms is None:
+                avg_length = self.total_length / n or 1.0
+                self._norms = {chunk_id: self.k1 * (1 - self.b + self.b * length / avg_length)
+                               for chunk_id, length in self.lengths.items()}
+            norms = self._norms
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                if idf < BM25_MIN_IDF:
+                    continue
+                weight = idf * (self.k1 + 1)
+                for chunk_id, tf in docs.items():
+                    scores[chunk_id] += weight * tf / (tf + norms[chunk_id])
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def idf(self, term: str) -> float:
+        """BM25 idf of a term. A term the index has never seen is weighted like
+        one that occurs once, so unknown words do not outweigh rare known ones."""
+        with self._lock:
+            n = len(self.lengths)
+            df = max(1, len(self.postings.get(term, ())))
+        return math.log(1 + (max(n, df) - df + 0.5) / (df + 0.5))
+
+    def coverage(self, query: str, texts: List[str]) -> Optional[float]:
+        """Share of the query's idf weight whose terms occur in `texts`: near 1
+        when the informative query terms all appear, near 0 when only common
+        words do. None for a query without indexable terms."""
+        found = set()
+        for text in texts:
+            found.update(tokenize(text))
+        total = matched = 0.0
+        for term in set(tokenize(query)) - STOPWORDS:
+            weight = self.idf(term)
+            if weight < BM25_MIN_IDF:
+                continue
+            total += weight
+            if term in found:
+                matched += weight
+        return matched / total if total else None
+
+    def stats(self) -> dict:
+        return {"chunks": len(self.lengths), "terms": len(self.postings)}
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
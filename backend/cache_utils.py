@@ -0,0 +1,425 @@
+from collections import OrderedDict
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+from pydantic_models import DEFAULT_TENANT_ID
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "20000"))
+# Memory budget for embeddings of recent search queries
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", str(16 * 2**20)))
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping with hit/miss counters.
+
+    With max_bytes, entries are also evicted once the sum of sizeof(value)
+    exceeds it."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes and len(self._data) > 1):
+                evicted, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self.bytes -= self._sizes.pop(key, 0)
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def discard_where(self, predicate) -> int:
+        """Drop every entry whose key matches predicate; returns how many."""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+                self.bytes -= self._sizes.pop(key)
+            return len(keys)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingCacheStore:
+    """SQLite-backed store of float32 vectors keyed by (model_id, dimensions, sha256).
+
+    A connection is opened lazily per process so the store can be shared with
+    worker processes."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS embedding_cache
+                            (model_id TEXT,
+                             dimensions INTEGER,
+                             text_hash TEXT,
+                             vector BLOB,
+                             PRIMARY KEY (model_id, dimensions, text_hash)) WITHOUT ROWID''')
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, model_id: str, dimensions: int, hashes: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f'SELECT text_hash, vector FROM embedding_cache '
+                    f'WHERE model_id = ? AND dimensions = ? AND text_hash IN ({placeholders})',
+                    (model_id, dimensions, *chunk)
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model_id: str, dimensions: int, items: dict):
+        if not items:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                'INSERT OR REPLACE INTO embedding_cache (model_id, dimensions, text_hash, vector) VALUES (?, ?, ?, ?)',
+                [(model_id, dimensions, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items.items()]
+            )
+            conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of any Embeddings implementation.
+
+    Chunks are looked up by sha256 of their text in an in-memory LRU, then in
+    the persistent store; only the remaining texts reach the wrapped model."""
+
+    def __init__(self, embeddings: Embeddings, dimensions: int,
+                 store: Optional[EmbeddingCacheStore] = None,
+                 memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+        self.store = store if store is not None else EmbeddingCacheStore()
+        self.memory = LRUCache(memory_entries)
+        # A Python list of floats costs about 32 bytes per element
+        self.queries = LRUCache(max_entries=memory_entries, max_bytes=QUERY_EMBEDDING_CACHE_MAX_BYTES,
+                                sizeof=lambda vector: 56 + 32 * len(vector))
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def model_id(self) -> str:
+        # Read when first needed: a local model's id means reading its files
+        return getattr(self.embeddings, "model_id", type(self.embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_sha256(text) for text in texts]
+        vectors = {}
+        for h in set(hashes):
+            vector = self.memory.get(h)
+            if vector is not None:
+                vectors[h] = vector
+
+        pending = [h for h in set(hashes) if h not in vectors]
+        if pending:
+            from_disk = self.store.get_many(self.model_id, self.dimensions, pending)
+            self.disk_hits += len(from_disk)
+            vectors.update(from_disk)
+
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in vectors and h not in missing:
+                missing[h] = text
+        if missing:
+            self.misses += len(missing)
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), computed))
+            self.store.put_many(self.model_id, self.dimensions, fresh)
+            vectors.update(fresh)
+
+        for h in set(hashes):
+            if h not in self.memory:
+                self.memory.put(h, vectors[h])
+        return [vectors[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.queries.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.queries.put(text, vector)
+        return list(vector)
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        lookups = memory["hits"] + self.disk_hits + self.misses
+        return {
+            "model_id": self.model_id,
+            "dimensions": self.dimensions,
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (memory["hits"] + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": memory["entries"],
+            "query_cache": self.queries.stats(),
+        }
+
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.db")
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+# Web answers go stale; document and LLM answers live until the corpus changes
+ANSWER_CACHE_WEB_TTL = float(os.getenv("ANSWER_CACHE_WEB_TTL", "600"))
+# Cosine similarity above which a differently worded question reuses a cached
+# answer (0 = exact normalized matches only)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+class AnswerCache:
+    """Answers keyed by (tenant, model, corpus generation, normalized question).
+
+    An in-memory LRU sits in front of a SQLite table that survives restarts;
+    the table is trimmed to max_entries by last use. With an embeddings model
+    and a similarity threshold, a miss falls back to the most similar cached
+    question for the same tenant, model and corpus generation."""
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 web_ttl: float = ANSWER_CACHE_WEB_TTL, embeddings: Optional[Embeddings] = None,
+                 similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.path = path
+        self.max_entries = max_entries
+        self.web_ttl = web_ttl
+        self.embeddings = embeddings if similarity > 0 else None
+        self.similarity = similarity
+        self.memory = LRUCache(max_entries)
+        self._conn = None
+        self._lock = threading.Lock()
+        # (tenant_id, model, generation) -> {key: unit vector}, loaded on first use
+        self._vectors = {}
+        self.hits = {"memory": 0, "disk": 0, "similar": 0}
+        self.misses = 0
+        self.expired = 0
+        self.puts = 0
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS answer_cache
+                            (key TEXT PRIMARY KEY,
+                             model TEXT,
+                             corpus_generation INTEGER,
+                             question TEXT,
+                             answer TEXT,
+                             source TEXT,
+                             expires_at REAL,
+                             last_used REAL,
+                             embedding BLOB,
+                             tenant_id TEXT NOT NULL DEFAULT 'default')''')
+            if 'tenant_id' not in [row[1] for row in conn.execute('PRAGMA table_info(answer_cache)')]:
+                conn.execute("ALTER TABLE answer_cache ADD COLUMN tenant_id TEXT NOT NULL DEFAULT 'default'")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_answer_cache_last_used ON answer_cache (last_used)')
+            conn.execute('DROP INDEX IF EXISTS idx_answer_cache_model_generation')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_answer_cache_tenant_model_generation '
+                         'ON answer_cache (tenant_id, model, corpus_generation)')
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, generation: int, question: str, tenant_id: str = DEFAULT_TENANT_ID) -> str:
+        # Default-tenant keys keep their pre-tenant form, so existing entries stay valid
+        namespace = model if tenant_id == DEFAULT_TENANT_ID else f"{tenant_id}\x00{model}"
+        return text_sha256(f"{namespace}\x00{generation}\x00{normalize_question(question)}")
+
+    def _embed(self, question: str):
+        vector = np.asarray(self.embeddings.embed_query(normalize_question(question)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _vector_index(self, tenant_id: str, model: str, generation: int) -> dict:
+        index = self._vectors.get((tenant_id, model, generation))
+        if index is None:
+            # Entries of older generations can never match again
+            self._vectors = {k: v for k, v in self._vectors.items() if k[:2] != (tenant_id, model)}
+            rows = self._connection().execute(
+                'SELECT key, embedding FROM answer_cache '
+                'WHERE tenant_id = ? AND model = ? AND corpus_generation = ? AND embedding IS NOT NULL',
+                (tenant_id, model, generation)
+            ).fetchall()
+            index = {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+            self._vectors[(tenant_id, model, generation)] = index
+        return index
+
+    def get(self, model: str, generation: int, question: str, tenant_id: str = DEFAULT_TENANT_ID) -> Optional[dict]:
+        """Return {"answer", "source"} for a cached answer, or None."""
+        key = self.make_key(model, generation, question, tenant_id)
+        now = time.time()
+        entry = self.memory.get(key)
+        origin = "memory"
+        with self._lock:
+            if entry is None:
+                entry = self._load(key)
+                origin = "disk"
+                if entry is not None:
+                    self.memory.put(key, entry)
+            if entry is None and self.embeddings is not None:
+                key, entry = self._nearest(tenant_id, model, generation, question)
+                origin = "similar"
+            if entry is not None and entry["expires_at"] is not None and entry["expires_at"] <= now:
+                self.expired += 1
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits[origin] += 1
+            # Recency on disk only needs to be coarse; avoid a write per hit
+            if now - entry.get("last_used", 0) > 60:
+                entry["last_used"] = now
+                self._connection().execute('UPDATE answer_cache SET last_used = ? WHERE key = ?', (now, key))
+                self._connection().commit()
+        return {"answer": entry["answer"], "source": entry["source"]}
+
+    def _load(self, key: str) -> Optional[dict]:
+        row = self._connection().execute(
+            'SELECT answer, source, expires_at FROM answer_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"answer": row[0], "source": row[1], "expires_at": row[2]}
+
+    def _nearest(self, tenant_id: str, model: str, generation: int, question: str):
+        index = self._vector_index(tenant_id, model, generation)
+        if not index:
+            return None, None
+        keys = list(index)
+        scores = np.stack([index[k] for k in keys]) @ self._embed(question)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None, None
+        key = keys[best]
+        return key, self._load(key)
+
+    def _drop(self, key: str):
+        self.memory.pop(key)
+        for index in self._vectors.values():
+            index.pop(key, None)
+        self._connection().execute('DELETE FROM answer_cache WHERE key = ?', (key,))
+        self._connection().commit()
+
+    def put(self, model: str, generation: int, question: str, answer: str, source: str,
+            tenant_id: str = DEFAULT_TENANT_ID):
+        key = self.make_key(model, generation, question, tenant_id)
+        now = time.time()
+        expires_at = now + self.web_ttl if source == "web" else None
+        vector = self._embed(question) if self.embeddings is not None else None
+        entry = {"answer": answer, "source": source, "expires_at": expires_at, "last_used": now}
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO answer_cache '
+                '(key, model, corpus_generation, question, answer, source, expires_at, last_used, embedding, '
+                'tenant_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, model, generation, normalize_question(question), answer, source, expires_at, now,
+                 vector.tobytes() if vector is not None else None, tenant_id)
+            )
+            self.puts += 1
+            # Trim the table back to max_entries now and then, least recently used first
+            if self.puts % 100 == 0:
+                evicted = [row[0] for row in conn.execute(
+                    'SELECT key FROM answer_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?', (self.max_entries,)
+                )]
+                if evicted:
+                    conn.executemany('DELETE FROM answer_cache WHERE key = ?', [(k,) for k in evicted])
+                    for k in evicted:
+                        self.memory.pop(k)
+                        for index in self._vectors.values():
+                            index.pop(k, None)
+            conn.commit()
+            self.memory.put(key, entry)
+            if vector is not None and (tenant_id, model, generation) in self._vectors:
+                self._vectors[(tenant_id, model, generation)][key] = vector
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "similar_hits": self.hits["similar"],
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": memory["entries"],
+            "memory_evictions": memory["evictions"],
+        }
@@ -1,96 +1,493 @@
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredHTMLLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from typing import List
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
-from langchain_core.embeddings import Embeddings
-import hashlib
+from cache_utils import CachedEmbeddings, LRUCache, text_sha256
+from db_utils import bump_corpus_generation, get_corpus_generation
+from bm25_utils import BM25Index, BM25_INDEX_PATH, reciprocal_rank_fusion
+from embedding_utils import SimpleHashEmbeddings, create_embeddings
+from pydantic_models import DEFAULT_TENANT_ID
 import os
+import threading
+import weakref
 from dotenv import load_dotenv
 
 # Load the API key from .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-# Initialize text splitter
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len
-)
+# Chunks embedded and written to Chroma per batch while indexing
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+# Memory budget for cached search results (top-k chunks per query and corpus generation)
+RETRIEVAL_CACHE_MAX_BYTES = int(os.getenv("RETRIEVAL_CACHE_MAX_BYTES", str(64 * 2**20)))
+# Hybrid retrieval: BM25 and vector rankings (HYBRID_CANDIDATES deep each)
+# are fused with reciprocal rank fusion, 1 / (RRF_K + rank)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
 
 
-class SimpleHashEmbeddings(Embeddings):
-    """Simple hash-based embeddings that work 100% offline.
-    No downloads, no API calls, no SSL issues.
-    Good enough for a demo/learning project."""
+@lru_cache(maxsize=None)
+def get_text_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-    def __init__(self, dimensions: int = 384):
-        self.dimensions = dimensions
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len
+    )
 
-    def _hash_text(self, text: str) -> List[float]:
-        """Convert text to a fixed-size vector using hashing."""
-        vector = []
-        for i in range(self.dimensions):
-            h = hashlib.md5(f"{text}_{i}".encode()).hexdigest()
-            value = (int(h[:8], 16) / (2**32)) * 2 - 1  # normalize to [-1, 1]
-            vector.append(value)
-        # Normalize
-        magnitude = sum(v**2 for v in vector) ** 0.5
-        if magnitude > 0:
-            vector = [v / magnitude for v in vector]
-        return vector
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self._hash_text(text) for text in texts]
+# Collection metadata keys recording which embedder (and vector size) built
+# the stored vectors, and for the hash embedder, which scheme version
+EMBEDDER_KEY = "embedder"
+EMBEDDING_DIMENSIONS_KEY = "embedding_dimensions"
+EMBEDDING_VERSION_KEY = "hash_embedding_version"
 
-    def embed_query(self, text: str) -> List[float]:
-        return self._hash_text(text)
+# Collection used by the app (tenants get "<name>-<tenant_id>"); a different
+# embedder needs its own collection
+CHROMA_COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME", "langchain")
 
 
-# Use simple hash embeddings — NO downloads, NO API calls!
-embedding_function = SimpleHashEmbeddings(dimensions=384)
+class EmbeddingMismatchError(RuntimeError):
+    pass
 
-# Initialize Chroma vector store
-vectorstore = Chroma(
-    persist_directory="./chroma_db",
-    embedding_function=embedding_function
-)
 
+# Simple hash embeddings by default — NO downloads, NO API calls! (see EMBEDDING_BACKEND)
+base_embeddings = create_embeddings()
+hash_embeddings = base_embeddings if isinstance(base_embeddings, SimpleHashEmbeddings) else None
+
+# Chunks that were embedded before (same text, same model) are served from cache
+embedding_function = CachedEmbeddings(base_embeddings, dimensions=base_embeddings.dimensions)
+
+# Each tenant's documents live in their own collection (the default tenant
+# uses CHROMA_COLLECTION_NAME itself); at most this many collection handles,
+# with their BM25 indexes, are kept open
+TENANT_STORE_CACHE_SIZE = int(os.getenv("TENANT_STORE_CACHE_SIZE", "64"))
+
+_chroma_client = None
+_chroma_client_lock = threading.Lock()
+
+
+def get_chroma_client():
+    """The persistent Chroma client shared by every tenant's collection, created on first use."""
+    global _chroma_client
+    with _chroma_client_lock:
+        if _chroma_client is None:
+            import chromadb
+
+            _chroma_client = chromadb.PersistentClient(path="./chroma_db")
+        return _chroma_client
+
+
+def tenant_collection_name(tenant_id: str) -> str:
+    if tenant_id == DEFAULT_TENANT_ID:
+        return CHROMA_COLLECTION_NAME
+    return f"{CHROMA_COLLECTION_NAME}-{tenant_id}"
+
+
+def tenant_bm25_path(tenant_id: str) -> str:
+    if tenant_id == DEFAULT_TENANT_ID:
+        return BM25_INDEX_PATH
+    root, ext = os.path.splitext(BM25_INDEX_PATH)
+    return f"{root}-{tenant_id}{ext}"
+
+
+def unit_vector_relevance(distance: float) -> float:
+    """Relevance in [0, 1] from Chroma's default squared L2 distance. Every
+    embedder here returns unit vectors, so this is their cosine similarity,
+    with negative similarity clipped to 0."""
+    return min(1.0, max(0.0, 1.0 - distance / 2))
+
+
+class TenantStore:
+    """Open handle on one tenant's shard: its Chroma collection and BM25 index.
+
+    Opening a collection migrates old hash embeddings and checks which
+    embedder built it; the BM25 index is loaded on first use."""
+
+    def __init__(self, tenant_id: str):
+        from langchain_chroma import Chroma
+
+        self.tenant_id = tenant_id
+        self.collection_name = tenant_collection_name(tenant_id)
+        self.vectorstore = Chroma(
+            client=get_chroma_client(),
+            collection_name=self.collection_name,
+            embedding_function=embedding_function,
+            relevance_score_fn=unit_vector_relevance
+        )
+        migrate_hash_embeddings(self.vectorstore, tenant_id)
+        # Set when the collection was built by another embedder; searches and writes are refused
+        self.embedder_mismatch = check_collection_embedder(self.vectorstore, self.collection_name)
+        self._bm25_index = None
+        self._bm25_lock = threading.Lock()
+
+    def bm25_index(self) -> BM25Index:
+        """Load the BM25 index on first use, rebuilding it from Chroma if the two
+        disagree (e.g. a collection indexed before BM25 existed)."""
+        with self._bm25_lock:
+            if self._bm25_index is None:
+                index = BM25Index(tenant_bm25_path(self.tenant_id))
+                collection = self.vectorstore._collection
+                if len(index) != collection.count():
+                    print(f"Rebuilding BM25 index from {collection.count()} Chroma chunks...")
+                    index.clear()
+                    offset = 0
+                    while True:
+                        batch = collection.get(limit=1000, offset=offset, include=["documents", "metadatas"])
+                        if not batch["ids"]:
+                            break
+                        index.add(batch["ids"], batch["documents"],
+                                  [(metadata or {}).get("file_id") for metadata in batch["metadatas"]])
+                        offset += len(batch["ids"])
+                self._bm25_index = index
+            return self._bm25_index
+
+    def ensure_embedder_matches(self):
+        if self.embedder_mismatch:
+            raise EmbeddingMismatchError(self.embedder_mismatch)
+
+
+# Recently used handles; a handle evicted while a request or ingestion job
+# still holds it stays reachable through _live_stores, so a tenant never has
+# two BM25 indexes in memory at once
+tenant_stores = LRUCache(max_entries=TENANT_STORE_CACHE_SIZE)
+_live_stores = weakref.WeakValueDictionary()
+_tenant_stores_lock = threading.Lock()
+
+
+def tenant_collection_exists(tenant_id: str) -> bool:
+    try:
+        get_chroma_client().get_collection(tenant_collection_name(tenant_id))
+    except Exception:
+        return False
+    return True
+
+
+def get_tenant_store(tenant_id: str = DEFAULT_TENANT_ID, create: bool = True) -> Optional[TenantStore]:
+    """The tenant's open shard. With create=False (read paths) a tenant that
+    has never indexed anything gets None instead of a new, empty collection
+    and BM25 file."""
+    store = tenant_stores.get(tenant_id)
+    if store is None:
+        with _tenant_stores_lock:
+            store = _live_stores.get(tenant_id)
+            if store is None:
+                if not create and not tenant_collection_exists(tenant_id):
+                    return None
+                store = TenantStore(tenant_id)
+                _live_stores[tenant_id] = store
+            tenant_stores.put(tenant_id, store)
+    return store
+
+
+def get_vectorstore(tenant_id: str = DEFAULT_TENANT_ID):
+    return get_tenant_store(tenant_id).vectorstore
+
+
+def get_bm25_index(tenant_id: str = DEFAULT_TENANT_ID) -> BM25Index:
+    return get_tenant_store(tenant_id).bm25_index()
+
+
+def vectorstore_ready() -> bool:
+    return DEFAULT_TENANT_ID in _live_stores
+
+
+def bm25_ready() -> bool:
+    store = _live_stores.get(DEFAULT_TENANT_ID)
+    return store is not None and store._bm25_index is not None
+
+
+def tenant_store_stats() -> dict:
+    stores = list(_live_stores.values())
+    return {
+        **tenant_stores.stats(),
+        "open": len(stores),
+        "mismatched_tenants": sorted(store.tenant_id for store in stores if store.embedder_mismatch),
+    }
+
+
+def _set_collection_metadata(collection, updates: dict):
+    # hnsw:* settings cannot be passed to modify() once the collection exists
+    metadata = {k: v for k, v in (collection.metadata or {}).items() if not k.startswith("hnsw:")}
+    metadata.update(updates)
+    collection.modify(metadata=metadata)
+
+
+def migrate_hash_embeddings(vectorstore, tenant_id: str = DEFAULT_TENANT_ID, batch_size: int = 512) -> int:
+    """Re-embed every stored chunk if the collection was built with another
+    hash embedding version. Returns the number of re-embedded chunks."""
+    collection = vectorstore._collection
+    metadata = dict(collection.metadata or {})
+    stored_embedder = metadata.get(EMBEDDER_KEY, "simple-hash")
+    if hash_embeddings is None or not stored_embedder.startswith("simple-hash"):
+        return 0
+    stored_version = metadata.get(EMBEDDING_VERSION_KEY, 1)
+    if stored_version == hash_embeddings.version and EMBEDDING_VERSION_KEY in metadata:
+        return 0
+
+    migrated = 0
+    if stored_version != hash_embeddings.version:
+        print(f"Migrating Chroma embeddings from v{stored_version} to v{hash_embeddings.version}...")
+        offset = 0
+        while True:
+            batch = collection.get(limit=batch_size, offset=offset, include=["documents"])
+            if not batch["ids"]:
+                break
+            embeddings = hash_embeddings.embed_batch([doc or "" for doc in batch["documents"]])
+            collection.update(ids=batch["ids"], embeddings=embeddings)
+            migrated += len(batch["ids"])
+            offset += batch_size
+        print(f"Re-embedded {migrated} chunks")
+        _corpus_changed(tenant_id)
+
+    _set_collection_metadata(collection, {
+        EMBEDDING_VERSION_KEY: hash_embeddings.version,
+        EMBEDDER_KEY: hash_embeddings.model_id,
+        EMBEDDING_DIMENSIONS_KEY: hash_embeddings.dimensions,
+    })
+    return migrated
+
+
+def check_collection_embedder(vectorstore, collection_name: str) -> Optional[str]:
+    """Compare the embedder recorded on the collection with the configured
+    one. An empty or unrecorded collection is (re)claimed by the configured
+    embedder; a collection built by another one is left untouched and the
+    returned message describes the conflict."""
+    collection = vectorstore._collection
+    metadata = collection.metadata or {}
+    configured = (embedding_function.model_id, embedding_function.dimensions)
+    stored = metadata.get(EMBEDDER_KEY)
+    if stored is None and collection.count():
+        # Collections from before the record existed were built by the hash embedder
+        stored = f"simple-hash-v{metadata.get(EMBEDDING_VERSION_KEY, 1)}"
+        metadata = {**metadata, EMBEDDING_DIMENSIONS_KEY: 384}
+    if stored is None or not collection.count():
+        _set_collection_metadata(collection, {EMBEDDER_KEY: configured[0], EMBEDDING_DIMENSIONS_KEY: configured[1]})
+        return None
+    if (stored, metadata.get(EMBEDDING_DIMENSIONS_KEY)) != configured:
+        mismatch = (
+            f"Collection '{collection_name}' was built with {stored} "
+            f"({metadata.get(EMBEDDING_DIMENSIONS_KEY)} dims), but the configured embedder is "
+            f"{configured[0]} ({configured[1]} dims). Re-index into another CHROMA_COLLECTION_NAME."
+        )
+        print(mismatch)
+        return mismatch
+    return None
+
+
+def embedder_status() -> dict:
+    """The configured embedder, and whether the default tenant's collection
+    (once open) was built by another one."""
+    default_store = _live_stores.get(DEFAULT_TENANT_ID)
+    return {
+        "embedder": embedding_function.model_id,
+        "dimensions": embedding_function.dimensions,
+        "loaded": getattr(base_embeddings, "loaded", True),
+        "mismatch": default_store.embedder_mismatch if default_store is not None else None,
+    }
+
+
+def _hits_size(hits) -> int:
+    return sum(200 + len(doc.page_content) + sum(len(str(v)) for v in doc.metadata.values()) for doc, _ in hits)
+
+
+retrieval_cache = LRUCache(max_entries=100_000, max_bytes=RETRIEVAL_CACHE_MAX_BYTES, sizeof=_hits_size)
+
+
+def _corpus_changed(tenant_id: str = DEFAULT_TENANT_ID):
+    """Record that a tenant's indexed content changed: bumps its corpus
+    generation and drops this process's cached search results for it."""
+    bump_corpus_generation(tenant_id)
+    retrieval_cache.discard_where(lambda key: key[0] == tenant_id)
+
+
+def hybrid_search_with_scores(query: str, k: int = 2,
+                              tenant_id: str = DEFAULT_TENANT_ID) -> List[Tuple[Document, Optional[float]]]:
+    """Fuse the vector and BM25 rankings with reciprocal rank fusion. Each
+    document comes with its vector relevance score, or None if only the
+    keyword search found it."""
+    depth = max(k, HYBRID_CANDIDATES)
+    store = get_tenant_store(tenant_id, create=False)
+    if store is None:
+        return []
+    vectorstore = store.vectorstore
+    vector_hits = vectorstore.similarity_search_with_relevance_scores(query, k=depth)
+    by_id = {doc.id: doc for doc, _ in vector_hits}
+    scores = {doc.id: score for doc, score in vector_hits}
+    keyword_ids = [chunk_id for chunk_id, _ in store.bm25_index().search(query, depth)]
+    fused = reciprocal_rank_fusion([[doc.id for doc, _ in vector_hits], keyword_ids], k=RRF_K)[:k]
+
+    missing = [chunk_id for chunk_id in fused if chunk_id not in by_id]
+    if missing:
+        found = vectorstore.get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+            by_id[chunk_id] = Document(page_content=text or "", metadata=metadata or {}, id=chunk_id)
+    return [(by_id[chunk_id], scores.get(chunk_id)) for chunk_id in fused if chunk_id in by_id]
+
+
+def hybrid_search(query: str, k: int = 2, tenant_id: str = DEFAULT_TENANT_ID) -> List[Document]:
+    return [doc for doc, _ in hybrid_search_with_scores(query, k, tenant_id)]
+
+
+def warm_up_retrieval():
+    """Open the vector store and BM25 index and load the embedding model, so
+    the first question does not pay for it."""
+    get_vectorstore()
+    get_bm25_index()
+    base_embeddings.embed_documents(["warm up"])
+    get_text_splitter()
+
+
+def search_documents_with_scores(query: str, k: int = 2,
+                                 tenant_id: str = DEFAULT_TENANT_ID) -> List[Tuple[Document, Optional[float]]]:
+    """Top-k search (hybrid or vector only) in the tenant's collection only,
+    as (document, vector relevance score) pairs, cached per (tenant, corpus
+    generation, k, query)."""
+    store = get_tenant_store(tenant_id, create=False)
+    if store is None:
+        return []
+    store.ensure_embedder_matches()
+    key = (tenant_id, get_corpus_generation(tenant_id), k, query)
+    hits = retrieval_cache.get(key)
+    if hits is None:
+        if HYBRID_RETRIEVAL:
+            hits = tuple(hybrid_search_with_scores(query, k, tenant_id))
+        else:
+            hits = tuple(store.vectorstore.similarity_search_with_relevance_scores(query, k=k))
+        retrieval_cache.put(key, hits)
+    return list(hits)
+
+
+def search_documents(query: str, k: int = 2, tenant_id: str = DEFAULT_TENANT_ID) -> List[Document]:
+    return [doc for doc, _ in search_documents_with_scores(query, k, tenant_id)]
+
+
+def keyword_coverage(query: str, texts: List[str], tenant_id: str = DEFAULT_TENANT_ID) -> Optional[float]:
+    """How much of the query's informative vocabulary the texts contain (see
+    BM25Index.coverage); an embedder-independent relevance signal."""
+    store = get_tenant_store(tenant_id, create=False)
+    if store is None:
+        return None
+    return store.bm25_index().coverage(query, texts)
+
+
+def get_document_loader(file_path: str):
+    # Loaders (and the parsers behind them) are only needed once a file is ingested
+    from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredHTMLLoader
 
-def load_and_split_document(file_path: str) -> List[Document]:
     if file_path.endswith('.pdf'):
-        loader = PyPDFLoader(file_path)
+        return PyPDFLoader(file_path)
     elif file_path.endswith('.docx'):
-        loader = Docx2txtLoader(file_path)
+        return Docx2txtLoader(file_path)
     elif file_path.endswith('.html'):
-        loader = UnstructuredHTMLLoader(file_path)
-    else:
-        raise ValueError(f"Unsupported file type: {file_path}")
+        return UnstructuredHTMLLoader(file_path)
+    raise ValueError(f"Unsupported file type: {file_path}")
+
+
+def iter_split_batches(file_path: str, file_id: int,
+                       batch_size: int = INDEX_BATCH_SIZE) -> Iterator[Tuple[int, List[str], List[Document]]]:
+    """Stream a document as fixed-size batches of splits.
+
+    Pages come from the loader's lazy_load and are split as they arrive, so
+    only the current page and one batch of splits are held in memory.
+    Yields (pages_parsed, chunk_ids, splits)."""
+    seen = {}
+    pending = []
+    pages_parsed = 0
+    for page in get_document_loader(file_path).lazy_load():
+        pages_parsed += 1
+        for split in get_text_splitter().split_documents([page]):
+            split.metadata['file_id'] = file_id
+            pending.append(split)
+        while len(pending) >= batch_size:
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            yield pages_parsed, chunk_ids(file_id, batch, seen), batch
+    if pending:
+        yield pages_parsed, chunk_ids(file_id, pending, seen), pending
+
+
+def chunk_ids(file_id: int, splits: List[Document], seen: Optional[dict] = None) -> List[str]:
+    """Deterministic chunk ids: file_id + content hash (+ occurrence index for repeated text).
+
+    Pass the same `seen` dict when ids are computed over several batches of one file."""
+    seen = {} if seen is None else seen
+    ids = []
+    for split in splits:
+        digest = text_sha256(split.page_content)[:32]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{file_id}-{digest}-{occurrence}")
+    return ids
 
-    documents = loader.load()
-    return text_splitter.split_documents(documents)
 
+def write_embedded_chunks(ids: List[str], texts: List[str], metadatas: List[dict], embeddings,
+                          tenant_id: str = DEFAULT_TENANT_ID) -> int:
+    """Upsert chunks whose embeddings were computed elsewhere (e.g. in a worker process)."""
+    if not ids:
+        return 0
+    store = get_tenant_store(tenant_id)
+    store.ensure_embedder_matches()
+    bm25 = store.bm25_index()
+    store.vectorstore._collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+    bm25.add(ids, texts, [metadata.get("file_id") for metadata in metadatas])
+    _corpus_changed(tenant_id)
+    return len(ids)
 
-def index_document_to_chroma(file_path: str, file_id: int) -> bool:
+
+def update_document_in_chroma(file_path: str, file_id: int, tenant_id: str = DEFAULT_TENANT_ID):
+    """Re-index a new version of a document by diffing chunk ids.
+
+    Only chunks whose content is new are embedded and added, and only chunks
+    that disappeared are deleted. Returns the diff counts, or None on error."""
     try:
-        splits = load_and_split_document(file_path)
+        store = get_tenant_store(tenant_id)
+        store.ensure_embedder_matches()
+        vectorstore = store.vectorstore
+        bm25 = store.bm25_index()
+        existing_ids = set(vectorstore.get(where={"file_id": file_id}, include=[])['ids'])
+        new_ids = set()
+        added = 0
+        for _, ids, splits in iter_split_batches(file_path, file_id):
+            new_ids.update(ids)
+            to_add = [(chunk_id, split) for chunk_id, split in zip(ids, splits) if chunk_id not in existing_ids]
+            if to_add:
+                vectorstore.add_documents([split for _, split in to_add], ids=[chunk_id for chunk_id, _ in to_add])
+                bm25.add([chunk_id for chunk_id, _ in to_add],
+                         [split.page_content for _, split in to_add], [file_id] * len(to_add))
+                added += len(to_add)
 
-        for split in splits:
-            split.metadata['file_id'] = file_id
+        to_delete = list(existing_ids - new_ids)
+        if to_delete:
+            vectorstore.delete(ids=to_delete)
+            bm25.delete(to_delete)
+        if added or to_delete:
+            _corpus_changed(tenant_id)
 
-        vectorstore.add_documents(splits)
-        return True
+        print(f"Updated file_id {file_id}: {added} added, {len(to_delete)} deleted")
+        return {
+            "added": added,
+            "deleted": len(to_delete),
+            "unchanged": len(new_ids) - added,
+        }
     except Exception as e:
-        print(f"Error indexing document: {e}")
-        return False
+        print(f"Error updating document with file_id {file_id}: {e}")
+        return None
 
 
-def delete_doc_from_chroma(file_id: int):
+def delete_doc_from_chroma(file_id: int, tenant_id: str = DEFAULT_TENANT_ID):
     try:
+        store = get_tenant_store(tenant_id, create=False)
+        if store is None:
+            print(f"No collection for tenant {tenant_id}; nothing to delete for file_id {file_id}")
+            return True
+        vectorstore = store.vectorstore
+        bm25 = store.bm25_index()
         docs = vectorstore.get(where={"file_id": file_id})
         print(f"Found {len(docs['ids'])} document chunks for file_id {file_id}")
 
         vectorstore._collection.delete(where={"file_id": file_id})
+        bm25.delete_file(file_id)
+        _corpus_changed(tenant_id)
         print(f"Deleted all documents with file_id {file_id}")
 
         return True
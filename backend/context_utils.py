@@ -0,0 +1,136 @@
+from typing import List, Optional
+import os
+
+# Share of the prompt budget that chat history keeps even when retrieved
+# chunks could use all of it
+HISTORY_BUDGET_SHARE = float(os.getenv("HISTORY_BUDGET_SHARE", "0.3"))
+# Single history messages (long earlier answers) are cut to this many tokens
+HISTORY_MESSAGE_MAX_TOKENS = int(os.getenv("HISTORY_MESSAGE_MAX_TOKENS", "300"))
+# History messages considered at all, newest first
+HISTORY_MAX_MESSAGES = 8
+# Overlap shorter than this is not treated as splitter overlap
+MIN_CHUNK_OVERLAP = 30
+MAX_CHUNK_OVERLAP = 400
+# A chunk that only partly fits is kept if at least this much of it fits
+MIN_PARTIAL_CHUNK_TOKENS = 50
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) for budgeting prompt text."""
+    return (len(text or "") + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, preferring a whitespace boundary."""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4]
+    space = cut.rfind(" ")
+    if space > len(cut) * 0.8:
+        cut = cut[:space]
+    return cut.rstrip() + " ..."
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is also a prefix of right."""
+    for length in range(min(len(left), len(right), MAX_CHUNK_OVERLAP), MIN_CHUNK_OVERLAP - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def dedupe_chunks(chunks: List[str]) -> List[str]:
+    """Drop chunks contained in a better-ranked one and strip text they share
+    with it at either edge (the splitter overlaps neighbouring chunks)."""
+    kept = []
+    for chunk in chunks:
+        text = (chunk or "").strip()
+        if not text or any(text in other for other in kept):
+            continue
+        for other in kept:
+            head = _overlap(other, text)
+            if head:
+                text = text[head:].lstrip()
+            tail = _overlap(text, other)
+            if tail:
+                text = text[:-tail].rstrip()
+        if text:
+            kept.append(text)
+    return kept
+
+
+def _history_lines(chat_history) -> List[str]:
+    if not chat_history:
+        return []
+    if isinstance(chat_history, list) and isinstance(chat_history[0], dict):
+        return [f"{m.get('role', 'user')}: {m.get('content', '')}" for m in chat_history[-HISTORY_MAX_MESSAGES:]
+                if m.get("content")]
+    return [str(x) for x in chat_history[-HISTORY_MAX_MESSAGES:]]
+
+
+class PackedContext:
+    """History and retrieved-context text that fit a prompt token budget."""
+
+    def __init__(self, history_text: str, context_text: str, tokens: dict):
+        self.history_text = history_text
+        self.context_text = context_text
+        self.tokens = tokens
+
+
+def pack_context(budget: int, fixed_text: str, chat_history=None, chunks: Optional[List[str]] = None) -> PackedContext:
+    """Fit chat history and ranked chunks into `budget` tokens next to the
+    fixed prompt text (instructions and question), which is always kept.
+
+    Chunks are deduplicated, then the lowest-ranked ones are dropped (the
+    last one kept may be cut short). History keeps the newest messages, each
+    cut to HISTORY_MESSAGE_MAX_TOKENS, and gets at most HISTORY_BUDGET_SHARE
+    of the room unless the chunks leave more."""
+    fixed = estimate_tokens(fixed_text)
+    room = max(0, budget - fixed)
+    chunks = dedupe_chunks(chunks or [])
+
+    lines = [truncate_to_tokens(line, HISTORY_MESSAGE_MAX_TOKENS) for line in _history_lines(chat_history)]
+    history_wanted = sum(estimate_tokens(line) + 1 for line in lines)
+    chunks_wanted = sum(estimate_tokens(chunk) + 1 for chunk in chunks)
+    history_room = min(history_wanted, max(int(room * HISTORY_BUDGET_SHARE), room - chunks_wanted))
+    chunk_room = room - history_room
+
+    kept_chunks, used = [], 0
+    for chunk in chunks:
+        cost = estimate_tokens(chunk) + 1
+        if used + cost <= chunk_room:
+            kept_chunks.append(chunk)
+            used += cost
+            continue
+        partial = truncate_to_tokens(chunk, chunk_room - used - 2)
+        if estimate_tokens(partial) >= MIN_PARTIAL_CHUNK_TOKENS:
+            kept_chunks.append(partial)
+            used += estimate_tokens(partial) + 1
+        break
+
+    history_room = max(history_room, room - used)
+    kept_lines, history_used = [], 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if history_used + cost > history_room:
+            break
+        kept_lines.append(line)
+        history_used += cost
+    kept_lines.reverse()
+
+    return PackedContext(
+        history_text="\n".join(kept_lines),
+        context_text="\n\n".join(kept_chunks),
+        tokens={
+            "budget": budget,
+            "fixed": fixed,
+            "history": history_used,
+            "context": used,
+            "total": fixed + history_used + used,
+            "chunks_kept": len(kept_chunks),
+            "chunks_dropped": len(chunks) - len(kept_chunks),
+            "history_messages_kept": len(kept_lines),
+        },
+    )
@@ -1,15 +1,103 @@
 import sqlite3
+import os
+import queue
+import threading
 from datetime import datetime
+from pydantic_models import DEFAULT_TENANT_ID
 
 DB_NAME = "rag_app.db"
 
+# Idle connections kept open for reuse; extra connections are closed on release
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+_idle_connections = queue.LifoQueue()
+_pool_pid = os.getpid()
+_pool_lock = threading.Lock()
+
+# Tables are created on first use (or by init_db() at startup), not at import
+_schema_lock = threading.RLock()
+_schema_ready = False
+_schema_building = False
+
+
+def _open_connection():
+    conn = sqlite3.connect(DB_NAME, timeout=30, check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    # WAL lets readers run alongside the single writer instead of hitting
+    # "database is locked"; NORMAL sync is durable across app crashes in WAL mode.
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-16000')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
 
+class PooledConnection:
+    """A pooled sqlite3 connection. close() hands it back to the pool, so the
+    connection and its prepared statement cache are reused by the next caller."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        if os.getpid() == _pool_pid and _idle_connections.qsize() < DB_POOL_SIZE:
+            _idle_connections.put(conn)
+        else:
+            conn.close()
+
+
+def _reset_pool_after_fork():
+    global _idle_connections, _pool_pid
+    with _pool_lock:
+        if os.getpid() != _pool_pid:
+            _idle_connections = queue.LifoQueue()
+            _pool_pid = os.getpid()
+
+
+def get_db_connection():
+    if not _schema_ready:
+        init_db()
+    _reset_pool_after_fork()
+    try:
+        conn = _idle_connections.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+    return PooledConnection(conn)
+
+
+def close_db_pool():
+    """Close all idle connections (e.g. after changing DB_NAME)."""
+    global _schema_ready
+    while True:
+        try:
+            _idle_connections.get_nowait().close()
+        except queue.Empty:
+            break
+    # A different DB_NAME gets its tables on the next connection
+    _schema_ready = False
+
+
+def add_column_if_missing(conn, table, column, definition):
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        conn.commit()
+
+
 def create_application_logs():
     conn = get_db_connection()
     conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
@@ -18,7 +106,16 @@ def create_application_logs():
                      user_query TEXT,
                      gpt_response TEXT,
                      model TEXT,
-                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+                     route TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     tenant_id TEXT NOT NULL DEFAULT 'default')''')
+    # How the answer was routed (JSON): relevance gate scores and decision, speculative timings
+    add_column_if_missing(conn, 'application_logs', 'route', 'TEXT')
+    # A session's history is only read back for the tenant that wrote it
+    add_column_if_missing(conn, 'application_logs', 'tenant_id', "TEXT NOT NULL DEFAULT 'default'")
+    # History is always read per session, newest turns first
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_application_logs_session_created
+                    ON application_logs (session_id, created_at)''')
     conn.close()
 
 
@@ -27,47 +124,179 @@ def create_document_store():
     conn.execute('''CREATE TABLE IF NOT EXISTS document_store
                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
                      filename TEXT,
-                     upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+                     upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     content_sha256 TEXT,
+                     tenant_id TEXT NOT NULL DEFAULT 'default')''')
+    add_column_if_missing(conn, 'document_store', 'content_sha256', 'TEXT')
+    add_column_if_missing(conn, 'document_store', 'tenant_id', "TEXT NOT NULL DEFAULT 'default'")
+    # Duplicate checks and listings are per tenant
+    conn.execute('DROP INDEX IF EXISTS idx_document_store_sha256')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_document_store_tenant_sha256
+                    ON document_store (tenant_id, content_sha256)''')
+    conn.commit()
+    conn.close()
+
+
+def create_ingestion_jobs():
+    conn = get_db_connection()
+    conn.execute('''CREATE TABLE IF NOT EXISTS ingestion_jobs
+                    (id TEXT PRIMARY KEY,
+                     file_id INTEGER,
+                     filename TEXT,
+                     file_path TEXT,
+                     status TEXT,
+                     pages_parsed INTEGER DEFAULT 0,
+                     chunks_embedded INTEGER DEFAULT 0,
+                     chunks_written INTEGER DEFAULT 0,
+                     error TEXT,
+                     peak_rss_bytes INTEGER,
+                     tenant_id TEXT NOT NULL DEFAULT 'default',
+                     batch_id TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    add_column_if_missing(conn, 'ingestion_jobs', 'peak_rss_bytes', 'INTEGER')
+    add_column_if_missing(conn, 'ingestion_jobs', 'tenant_id', "TEXT NOT NULL DEFAULT 'default'")
+    add_column_if_missing(conn, 'ingestion_jobs', 'batch_id', 'TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_batch_id ON ingestion_jobs (batch_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_file_id ON ingestion_jobs (file_id)')
+    conn.commit()
+    conn.close()
+
+
+def create_corpus_state():
+    conn = get_db_connection()
+    conn.execute('''CREATE TABLE IF NOT EXISTS corpus_generations
+                    (tenant_id TEXT PRIMARY KEY,
+                     generation INTEGER NOT NULL) WITHOUT ROWID''')
+    # Carry over the single counter from before tenants had their own
+    has_legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'corpus_state'"
+    ).fetchone()
+    if has_legacy:
+        conn.execute('''INSERT OR IGNORE INTO corpus_generations (tenant_id, generation)
+                        SELECT ?, generation FROM corpus_state WHERE id = 1''', (DEFAULT_TENANT_ID,))
+        conn.execute('DROP TABLE corpus_state')
+    conn.commit()
     conn.close()
 
 
-def insert_application_logs(session_id, user_query, gpt_response, model):
+def insert_application_logs(session_id, user_query, gpt_response, model, tenant_id=DEFAULT_TENANT_ID):
     conn = get_db_connection()
     conn.execute(
-        'INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
-        (session_id, user_query, gpt_response, model)
+        'INSERT INTO application_logs (session_id, user_query, gpt_response, model, tenant_id) VALUES (?, ?, ?, ?, ?)',
+        (session_id, user_query, gpt_response, model, tenant_id)
     )
     conn.commit()
     conn.close()
 
 
-def get_chat_history(session_id):
+def insert_application_logs_batch(records):
+    """Insert many (session_id, user_query, gpt_response, model, created_at, route, tenant_id) rows in
+    one transaction."""
+    conn = get_db_connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at, route, '
+            'tenant_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            records
+        )
+    conn.close()
+
+
+def get_last_application_log_id():
+    conn = get_db_connection()
+    row = conn.execute('SELECT MAX(id) AS id FROM application_logs').fetchone()
+    conn.close()
+    return row['id'] or 0
+
+
+def get_chat_turns(session_id, max_turns=None, tenant_id=DEFAULT_TENANT_ID):
+    """The session's (id, user_query, gpt_response) rows for this tenant, oldest first.
+
+    With max_turns only the newest turns are fetched (LIMIT on the
+    (session_id, created_at) index)."""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        'SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at',
-        (session_id,)
-    )
+    if max_turns is None:
+        cursor.execute(
+            '''SELECT id, user_query, gpt_response FROM application_logs WHERE session_id = ? AND tenant_id = ?
+               ORDER BY created_at, id''',
+            (session_id, tenant_id)
+        )
+        rows = cursor.fetchall()
+    else:
+        cursor.execute(
+            '''SELECT id, user_query, gpt_response FROM application_logs WHERE session_id = ? AND tenant_id = ?
+               ORDER BY created_at DESC, id DESC LIMIT ?''',
+            (session_id, tenant_id, max_turns)
+        )
+        rows = cursor.fetchall()[::-1]
+    conn.close()
+    return [tuple(row) for row in rows]
+
+
+def get_chat_history(session_id, max_turns=None, tenant_id=DEFAULT_TENANT_ID):
+    """Return the session's messages for this tenant, oldest first; with
+    max_turns only the newest turns. (Token budgets are applied by the
+    caller, see ChatLogWriter.history.)"""
     messages = []
-    for row in cursor.fetchall():
+    for _, user_query, gpt_response in get_chat_turns(session_id, max_turns, tenant_id):
         messages.extend([
-            {"role": "human", "content": row['user_query']},
-            {"role": "ai", "content": row['gpt_response']}
+            {"role": "human", "content": user_query},
+            {"role": "ai", "content": gpt_response}
         ])
-    conn.close()
     return messages
 
 
-def insert_document_record(filename):
+def insert_document_record(filename, content_sha256=None, tenant_id=DEFAULT_TENANT_ID):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO document_store (filename) VALUES (?)', (filename,))
+    cursor.execute(
+        'INSERT INTO document_store (filename, content_sha256, tenant_id) VALUES (?, ?, ?)',
+        (filename, content_sha256, tenant_id)
+    )
     file_id = cursor.lastrowid
     conn.commit()
     conn.close()
     return file_id
 
 
+def get_document_record(file_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, filename, upload_timestamp, content_sha256, tenant_id FROM document_store WHERE id = ?',
+        (file_id,)
+    )
+    document = cursor.fetchone()
+    conn.close()
+    return dict(document) if document else None
+
+
+def get_document_by_sha256(content_sha256, tenant_id=DEFAULT_TENANT_ID):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''SELECT id, filename, upload_timestamp, content_sha256, tenant_id FROM document_store
+           WHERE tenant_id = ? AND content_sha256 = ? LIMIT 1''',
+        (tenant_id, content_sha256)
+    )
+    document = cursor.fetchone()
+    conn.close()
+    return dict(document) if document else None
+
+
+def update_document_record(file_id, filename, content_sha256=None):
+    conn = get_db_connection()
+    conn.execute(
+        'UPDATE document_store SET filename = ?, content_sha256 = ?, upload_timestamp = CURRENT_TIMESTAMP WHERE id = ?',
+        (filename, content_sha256, file_id)
+    )
+    conn.commit()
+    conn.close()
+    return True
+
+
 def delete_document_record(file_id):
     conn = get_db_connection()
     conn.execute('DELETE FROM document_store WHERE id = ?', (file_id,))
@@ -76,15 +305,138 @@ def delete_document_record(file_id):
     return True
 
 
-def get_all_documents():
+def get_all_documents(tenant_id=DEFAULT_TENANT_ID):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT id, filename, upload_timestamp FROM document_store ORDER BY upload_timestamp DESC')
+    cursor.execute(
+        'SELECT id, filename, upload_timestamp FROM document_store WHERE tenant_id = ? ORDER BY upload_timestamp DESC',
+        (tenant_id,)
+    )
     documents = cursor.fetchall()
     conn.close()
     return [dict(doc) for doc in documents]
 
 
-# Initialize the database tables
-create_application_logs()
-create_document_store()
\ No newline at end of file
+INGESTION_JOB_FIELDS = {"status", "pages_parsed", "chunks_embedded", "chunks_written", "error", "peak_rss_bytes"}
+
+
+def insert_ingestion_job(job_id, file_id, filename, file_path, tenant_id=DEFAULT_TENANT_ID):
+    conn = get_db_connection()
+    conn.execute(
+        'INSERT INTO ingestion_jobs (id, file_id, filename, file_path, status, tenant_id) VALUES (?, ?, ?, ?, ?, ?)',
+        (job_id, file_id, filename, file_path, "queued", tenant_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def insert_ingestion_jobs_batch(batch_id, jobs, tenant_id=DEFAULT_TENANT_ID):
+    """Insert the jobs of a bulk upload in one transaction; `jobs` holds
+    (job_id, file_id, filename, file_path) tuples."""
+    conn = get_db_connection()
+    conn.executemany(
+        'INSERT INTO ingestion_jobs (id, file_id, filename, file_path, status, tenant_id, batch_id) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(job_id, file_id, filename, file_path, "queued", tenant_id, batch_id)
+         for job_id, file_id, filename, file_path in jobs]
+    )
+    conn.commit()
+    conn.close()
+
+
+def update_ingestion_job(job_id, **fields):
+    update_ingestion_jobs([job_id], **fields)
+
+
+def update_ingestion_jobs(job_ids, **fields):
+    """Set the same fields on several jobs in one transaction."""
+    unknown = set(fields) - INGESTION_JOB_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown ingestion job fields: {', '.join(sorted(unknown))}")
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = get_db_connection()
+    conn.executemany(
+        f'UPDATE ingestion_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+        [(*fields.values(), job_id) for job_id in job_ids]
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_ingestion_job(job_id, tenant_id=DEFAULT_TENANT_ID):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM ingestion_jobs WHERE id = ? AND tenant_id = ?', (job_id, tenant_id))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+
+def get_latest_ingestion_job(file_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM ingestion_jobs WHERE file_id = ? ORDER BY rowid DESC LIMIT 1', (file_id,))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+
+def get_unfinished_ingestion_jobs():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM ingestion_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+    )
+    jobs = cursor.fetchall()
+    conn.close()
+    return [dict(job) for job in jobs]
+
+
+def get_ingestion_jobs_by_batch(batch_id, tenant_id=DEFAULT_TENANT_ID):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM ingestion_jobs WHERE batch_id = ? AND tenant_id = ? ORDER BY rowid',
+                   (batch_id, tenant_id))
+    jobs = cursor.fetchall()
+    conn.close()
+    return [dict(job) for job in jobs]
+
+
+def get_corpus_generation(tenant_id=DEFAULT_TENANT_ID):
+    """Counter bumped whenever a tenant's indexed content changes; caches of
+    answers or retrieval results built on the corpus are keyed by it."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT generation FROM corpus_generations WHERE tenant_id = ?', (tenant_id,)).fetchone()
+    conn.close()
+    return row['generation'] if row else 0
+
+
+def bump_corpus_generation(tenant_id=DEFAULT_TENANT_ID):
+    conn = get_db_connection()
+    with conn:
+        conn.execute('''INSERT INTO corpus_generations (tenant_id, generation) VALUES (?, 1)
+                        ON CONFLICT (tenant_id) DO UPDATE SET generation = generation + 1''', (tenant_id,))
+    conn.close()
+
+
+def init_db():
+    """Create and migrate the tables, once per process. Called by the app's
+    startup, and by the first get_db_connection() otherwise."""
+    global _schema_ready, _schema_building
+    with _schema_lock:
+        # The create_* functions below fetch connections themselves
+        if _schema_ready or _schema_building:
+            return
+        _schema_building = True
+        try:
+            create_application_logs()
+            create_document_store()
+            create_ingestion_jobs()
+            create_corpus_state()
+            _schema_ready = True
+        finally:
+            _schema_building = False
+
+
+def db_ready() -> bool:
+    return _schema_ready
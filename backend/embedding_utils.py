@@ -0,0 +1,304 @@
+from langchain_core.embeddings import Embeddings
+from typing import Callable, Dict, List, Optional
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Which embedder builds and queries the vector store: "hash" (offline demo
+# vectors), "sentence-transformers" or "onnx" (a model in a local directory)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hash")
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "")
+# Texts per inference batch, and CPU threads per process (0 = library default)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Longer texts are truncated to this many tokens by the ONNX backend
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "256"))
+# Output size of the model, when it cannot be read from its config files
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+
+# Version of the hash embedding scheme used for new vectors.
+#   1 = legacy md5-per-dimension vectors (bit-compatible with existing collections)
+#   2 = single shake_256 expansion per text (much faster, needs a migration)
+HASH_EMBEDDING_VERSION = int(os.getenv("HASH_EMBEDDING_VERSION", "1"))
+
+class SimpleHashEmbeddings(Embeddings):
+    """Simple hash-based embeddings that work 100% offline.
+    No downloads, no API calls, no SSL issues.
+    Good enough for a demo/learning project.
+
+    Texts are embedded in batches into a NumPy matrix: the hash bytes of
+    every text are unpacked in one call and normalized row-wise."""
+
+    def __init__(self, dimensions: int = 384, version: int = HASH_EMBEDDING_VERSION):
+        if version not in (1, 2):
+            raise ValueError(f"Unsupported hash embedding version: {version}")
+        self.dimensions = dimensions
+        self.version = version
+        self._suffixes = [f"_{i}".encode() for i in range(dimensions)]
+
+    @property
+    def model_id(self) -> str:
+        return f"simple-hash-v{self.version}"
+
+    def _hash_bytes(self, text: str) -> bytes:
+        """Return 4 hash bytes per dimension for a single text."""
+        encoded = text.encode()
+        if self.version == 2:
+            return hashlib.shake_256(b"documind-v2\x00" + encoded).digest(4 * self.dimensions)
+
+        # v1: md5(f"{text}_{i}") for every dimension. The text prefix is hashed
+        # once and the per-dimension suffix is fed to a copy of that state.
+        base = hashlib.md5(encoded)
+        out = bytearray()
+        for suffix in self._suffixes:
+            h = base.copy()
+            h.update(suffix)
+            out += h.digest()[:4]
+        return bytes(out)
+
+    def _embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a normalized float64 (n_texts, dimensions) matrix."""
+        if not texts:
+            return np.zeros((0, self.dimensions), dtype=np.float64)
+
+        raw = b"".join(self._hash_bytes(text) for text in texts)
+        words = np.frombuffer(raw, dtype=">u4").reshape(len(texts), self.dimensions)
+        matrix = (words / (2**32)) * 2 - 1  # normalize to [-1, 1]
+
+        if self.version == 1:
+            # Same float operations as the original per-text loop, so the
+            # resulting vectors are bit-identical to what is already stored.
+            magnitude = np.array([sum(v**2 for v in row) ** 0.5 for row in matrix.tolist()])
+        else:
+            magnitude = np.linalg.norm(matrix, axis=1)
+        magnitude[magnitude == 0] = 1.0
+        return matrix / magnitude[:, None]
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a float32 (n_texts, dimensions) matrix in one pass."""
+        return self._embed_matrix(texts).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_matrix([text])[0].tolist()
+
+
+def _local_model_dir(model_path: str) -> str:
+    if not model_path or not os.path.isdir(model_path):
+        raise ValueError(f"EMBEDDING_MODEL_PATH must be a local model directory, got {model_path!r}")
+    return os.path.abspath(model_path)
+
+
+# Files that decide what a local model outputs; they identify it
+WEIGHT_FILE_EXTENSIONS = (".safetensors", ".bin", ".onnx", ".onnx_data", ".pt")
+MODEL_FILE_EXTENSIONS = WEIGHT_FILE_EXTENSIONS + (".json", ".txt", ".model")
+# Bytes read from each end of a weight file
+WEIGHT_SAMPLE_BYTES = 1 << 20
+
+
+def model_fingerprint(model_dir: str) -> str:
+    """Short digest of a local model's tokenizer and config files and of the
+    size, head and tail of its weight files.
+
+    Part of the embedder's model_id, so two different models in directories
+    with the same name never share cached vectors or a collection, while the
+    same model copied elsewhere keeps its id. Weight files are sampled rather
+    than read whole, so this stays cheap for large models."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(model_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.endswith(MODEL_FILE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, model_dir).encode() + b"\x00")
+            with open(path, "rb") as f:
+                if not name.endswith(WEIGHT_FILE_EXTENSIONS):
+                    digest.update(f.read())
+                    continue
+                size = os.fstat(f.fileno()).st_size
+                digest.update(str(size).encode() + b"\x00")
+                digest.update(f.read(WEIGHT_SAMPLE_BYTES))
+                if size > WEIGHT_SAMPLE_BYTES:
+                    f.seek(max(WEIGHT_SAMPLE_BYTES, size - WEIGHT_SAMPLE_BYTES))
+                    digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_model_dimensions(model_dir: str) -> int:
+    """Embedding size from the model's config files, without loading weights."""
+    if EMBEDDING_DIMENSIONS:
+        return EMBEDDING_DIMENSIONS
+    # sentence-transformers layout: a Dense layer decides the output size, else the pooling layer
+    for module in reversed(_read_json(os.path.join(model_dir, "modules.json")) or []):
+        config = _read_json(os.path.join(model_dir, module.get("path", ""), "config.json"))
+        size = config.get("out_features") or config.get("word_embedding_dimension")
+        if size:
+            return int(size)
+    size = _read_json(os.path.join(model_dir, "config.json")).get("hidden_size")
+    if size:
+        return int(size)
+    raise ValueError(f"Cannot tell the embedding size of {model_dir}; set EMBEDDING_DIMENSIONS")
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """sentence-transformers model from a local directory, on CPU.
+
+    The model is loaded on first use, so importing this module (and starting
+    the API) stays fast; it never reaches out to the Hugging Face Hub."""
+
+    def __init__(self, model_path: str, batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS):
+        self.model_path = _local_model_dir(model_path)
+        self.batch_size = batch_size
+        self.threads = threads
+        self.dimensions = read_model_dimensions(self.model_path)
+        self._fingerprint = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_id(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = model_fingerprint(self.model_path)
+        return f"sentence-transformers:{os.path.basename(self.model_path)}@{self._fingerprint}"
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                os.environ.setdefault("HF_HUB_OFFLINE", "1")
+                os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+                import torch
+                from sentence_transformers import SentenceTransformer
+
+                if self.threads:
+                    torch.set_num_threads(self.threads)
+                self._model = SentenceTransformer(self.model_path, device="cpu")
+        return self._model
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        return self._load().encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                   convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_batch(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0].tolist()
+
+
+class OnnxEmbeddings(Embeddings):
+    """Transformer encoder exported to ONNX (model.onnx + tokenizer.json in a
+    local directory), run with ONNX Runtime on CPU with mean pooling.
+
+    Texts are sorted by length before batching so each batch pads to a
+    similar length. The session is created on first use."""
+
+    def __init__(self, model_path: str, batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS,
+                 max_tokens: int = EMBEDDING_MAX_TOKENS):
+        self.model_path = _local_model_dir(model_path)
+        self.batch_size = batch_size
+        self.threads = threads
+        self.max_tokens = max_tokens
+        self.dimensions = read_model_dimensions(self.model_path)
+        self._fingerprint = None
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_id(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = model_fingerprint(self.model_path)
+        return f"onnx:{os.path.basename(self.model_path)}@{self._fingerprint}"
+
+    @property
+    def loaded(self) -> bool:
+        return self._session is not None
+
+    def _load(self):
+        with self._lock:
+            if self._session is None:
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                onnx_file = os.path.join(self.model_path, "model.onnx")
+                if not os.path.exists(onnx_file):
+                    onnx_file = os.path.join(self.model_path, "onnx", "model.onnx")
+                options = onnxruntime.SessionOptions()
+                if self.threads:
+                    options.intra_op_num_threads = self.threads
+                    options.inter_op_num_threads = 1
+                tokenizer = Tokenizer.from_file(os.path.join(self.model_path, "tokenizer.json"))
+                tokenizer.enable_truncation(max_length=self.max_tokens)
+                tokenizer.enable_padding()
+                self._tokenizer = tokenizer
+                self._session = onnxruntime.InferenceSession(onnx_file, options, providers=["CPUExecutionProvider"])
+        return self._session, self._tokenizer
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        session, tokenizer = self._load()
+        input_names = {i.name for i in session.get_inputs()}
+        out = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encodings = tokenizer.encode_batch([texts[i] for i in batch])
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+            if "token_type_ids" in input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            hidden = session.run(None, {k: v for k, v in feeds.items() if k in input_names})[0]
+            if hidden.ndim == 3:
+                weights = mask[:, :, None].astype(np.float32)
+                hidden = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+            norms = np.linalg.norm(hidden, axis=1, keepdims=True)
+            out[batch] = hidden / np.maximum(norms, 1e-12)
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_batch(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0].tolist()
+
+
+EMBEDDING_BACKENDS: Dict[str, Callable[[], Embeddings]] = {
+    "hash": lambda: SimpleHashEmbeddings(dimensions=384),
+    "sentence-transformers": lambda: SentenceTransformerEmbeddings(EMBEDDING_MODEL_PATH),
+    "onnx": lambda: OnnxEmbeddings(EMBEDDING_MODEL_PATH),
+}
+
+
+def register_embedding_backend(name: str, factory: Callable[[], Embeddings]):
+    """Make another embedder selectable with EMBEDDING_BACKEND=name. The
+    embedder needs `model_id` and `dimensions` attributes."""
+    EMBEDDING_BACKENDS[name] = factory
+
+
+def create_embeddings(backend: Optional[str] = None) -> Embeddings:
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; choose from {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[backend]()
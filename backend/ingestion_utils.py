@@ -0,0 +1,428 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from chroma_utils import (
+    INDEX_BATCH_SIZE,
+    iter_split_batches,
+    embedding_function,
+    write_embedded_chunks,
+    delete_doc_from_chroma
+)
+from db_utils import (
+    insert_ingestion_job,
+    insert_ingestion_jobs_batch,
+    update_ingestion_job,
+    update_ingestion_jobs,
+    get_unfinished_ingestion_jobs,
+    delete_document_record
+)
+from pydantic_models import DEFAULT_TENANT_ID
+import hashlib
+import heapq
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import tempfile
+import threading
+import uuid
+
+# Number of worker processes doing the CPU-bound load/split/embed work
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+# Uploads are spooled here, one unique file each, until their job has finished
+UPLOAD_SCRATCH_DIR = os.getenv("UPLOAD_SCRATCH_DIR", "uploads")
+# Uploads larger than this are rejected while they are being streamed
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 2**20)))
+UPLOAD_CHUNK_BYTES = 2**20
+# Bulk uploads: workers embed chunks of consecutive documents together in
+# batches of this size, and Chroma is written this many chunks per upsert
+BULK_EMBED_BATCH_SIZE = int(os.getenv("BULK_EMBED_BATCH_SIZE", "256"))
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "2048"))
+
+_pool_lock = threading.Lock()
+_process_pool = None
+_manager = None
+_shutting_down = threading.Event()
+
+# One thread per running job: it feeds the worker's batches into Chroma, so
+# the vector store is only ever written from this process. Created by
+# start_ingestion() (or the first submitted job), dropped by shutdown_ingestion().
+_job_threads = None
+
+
+def _submit(fn, *args):
+    global _job_threads
+    with _pool_lock:
+        if _job_threads is None:
+            _job_threads = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+        return _job_threads.submit(fn, *args)
+
+
+def start_ingestion():
+    """Start the job threads; called on app startup, also after a
+    shutdown_ingestion() in the same process."""
+    global _job_threads
+    with _pool_lock:
+        _shutting_down.clear()
+        if _job_threads is None:
+            _job_threads = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+
+
+def _get_pool():
+    global _process_pool, _manager
+    with _pool_lock:
+        if _process_pool is None:
+            context = multiprocessing.get_context("spawn")
+            _manager = context.Manager()
+            _process_pool = ProcessPoolExecutor(max_workers=INGESTION_WORKERS, mp_context=context)
+        return _process_pool, _manager
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+def save_upload(source, filename: str):
+    """Stream an upload into a unique scratch file, hashing it on the way.
+
+    Returns (path, sha256 hex digest, size in bytes). The partial file is
+    removed if the upload exceeds MAX_UPLOAD_BYTES."""
+    os.makedirs(UPLOAD_SCRATCH_DIR, exist_ok=True)
+    extension = os.path.splitext(filename)[1].lower()
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=extension, dir=UPLOAD_SCRATCH_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := source.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLargeError(f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit.")
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def new_job_id() -> str:
+    return str(uuid.uuid4())
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS counter (VmHWM) for this process, where supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_bytes(field: str = "VmRSS") -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # No procfs: fall back to the process-lifetime peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def parse_and_embed(file_path: str, file_id: int, out) -> int:
+    """Runs in a worker process: stream a document page by page, embed
+    fixed-size batches of splits and send them to the `out` queue.
+
+    `out` is bounded, so a slow Chroma writer holds back parsing instead of
+    letting embedded batches pile up in memory."""
+    hwm_reset = _reset_peak_rss()
+    peak_rss = _rss_bytes()
+    chunks = 0
+    for pages_parsed, ids, splits in iter_split_batches(file_path, file_id, INDEX_BATCH_SIZE):
+        out.put(("pages", pages_parsed))
+        texts = [split.page_content for split in splits]
+        embeddings = embedding_function.embed_documents(texts)
+        out.put(("batch", ids, texts, [split.metadata for split in splits], embeddings))
+        chunks += len(ids)
+        peak_rss = max(peak_rss, _rss_bytes())
+
+    if hwm_reset:
+        peak_rss = max(peak_rss, _rss_bytes("VmHWM"))
+    out.put(("done", peak_rss))
+    return chunks
+
+
+def parse_and_embed_many(files, out, batch_size: int = BULK_EMBED_BATCH_SIZE) -> int:
+    """Runs in a worker process: parse the (file_path, file_id) pairs one
+    after another and embed their splits in batches that cross document
+    boundaries, so many small documents still make full embedding batches.
+
+    Sends ("batch", ...) messages like parse_and_embed, plus ("parsed",
+    file_id, pages, chunks) once all of a file's chunks are batched or sent,
+    or ("failed", file_id, error) for a file that could not be parsed."""
+    hwm_reset = _reset_peak_rss()
+    peak_rss = _rss_bytes()
+    pending = []
+    chunks = 0
+
+    def send(batch):
+        texts = [split.page_content for _, split in batch]
+        embeddings = embedding_function.embed_documents(texts)
+        out.put(("batch", [chunk_id for chunk_id, _ in batch], texts, [split.metadata for _, split in batch],
+                 embeddings))
+
+    for file_path, file_id in files:
+        pages = file_chunks = 0
+        try:
+            for pages, ids, splits in iter_split_batches(file_path, file_id, batch_size):
+                pending.extend(zip(ids, splits))
+                file_chunks += len(ids)
+                while len(pending) >= batch_size:
+                    send(pending[:batch_size])
+                    pending = pending[batch_size:]
+                    peak_rss = max(peak_rss, _rss_bytes())
+        except Exception as e:
+            pending = [(chunk_id, split) for chunk_id, split in pending if split.metadata["file_id"] != file_id]
+            out.put(("failed", file_id, str(e)))
+            continue
+        out.put(("parsed", file_id, pages, file_chunks))
+        chunks += file_chunks
+    if pending:
+        send(pending)
+
+    if hwm_reset:
+        peak_rss = max(peak_rss, _rss_bytes("VmHWM"))
+    out.put(("done", peak_rss))
+    return chunks
+
+
+def _discard_document(file_id: int, tenant_id: str = DEFAULT_TENANT_ID):
+    """Remove a document whose ingestion failed: its chunks, then its record."""
+    delete_doc_from_chroma(file_id, tenant_id)
+    delete_document_record(file_id)
+
+
+def _run_job(job_id: str, file_id: int, file_path: str, tenant_id: str = DEFAULT_TENANT_ID):
+    update_ingestion_job(job_id, status="running", pages_parsed=0, chunks_embedded=0, chunks_written=0, error=None)
+    try:
+        pool, manager = _get_pool()
+        batches = manager.Queue(maxsize=4)
+        future = pool.submit(parse_and_embed, file_path, file_id, batches)
+
+        embedded = written = 0
+        worker_finished = False
+        while True:
+            try:
+                message = batches.get(timeout=0.5)
+            except queue.Empty:
+                if worker_finished:
+                    raise RuntimeError("Ingestion worker exited without finishing the job")
+                if future.done():
+                    future.result()  # re-raises errors from the worker
+                    worker_finished = True
+                continue
+
+            kind = message[0]
+            if kind == "pages":
+                update_ingestion_job(job_id, pages_parsed=message[1])
+            elif kind == "batch":
+                _, ids, texts, metadatas, embeddings = message
+                embedded += len(ids)
+                update_ingestion_job(job_id, chunks_embedded=embedded)
+                written += write_embedded_chunks(ids, texts, metadatas, embeddings, tenant_id=tenant_id)
+                update_ingestion_job(job_id, chunks_written=written)
+            elif kind == "done":
+                peak_rss = message[1]
+                break
+
+        update_ingestion_job(job_id, status="completed", peak_rss_bytes=peak_rss)
+        print(f"Ingestion job {job_id} completed: {written} chunks for file_id {file_id}, "
+              f"peak RSS {peak_rss / 2**20:.1f} MiB")
+    except Exception as e:
+        if _shutting_down.is_set():
+            # Leave the job and its file in place; it is resumed on the next start
+            return
+        print(f"Ingestion job {job_id} failed: {e}")
+        update_ingestion_job(job_id, status="failed", error=str(e))
+        _discard_document(file_id, tenant_id)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def submit_ingestion_job(job_id: str, file_id: int, filename: str, file_path: str,
+                         tenant_id: str = DEFAULT_TENANT_ID) -> str:
+    insert_ingestion_job(job_id, file_id, filename, file_path, tenant_id)
+    _submit(_run_job, job_id, file_id, file_path, tenant_id)
+    return job_id
+
+
+class _BulkFile:
+    def __init__(self, job_id: str, file_id: int, file_path: str):
+        self.job_id = job_id
+        self.file_id = file_id
+        self.file_path = file_path
+        self.embedded = 0
+        self.written = 0
+        # Set once the worker has batched all of the file's chunks
+        self.chunks = None
+
+
+def _finish_bulk_file(entry: _BulkFile, tenant_id: str, error: str = None):
+    if error is None:
+        update_ingestion_job(entry.job_id, status="completed", chunks_written=entry.written)
+    else:
+        update_ingestion_job(entry.job_id, status="failed", error=error)
+        _discard_document(entry.file_id, tenant_id)
+    if os.path.exists(entry.file_path):
+        os.remove(entry.file_path)
+
+
+def _run_bulk_bundle(entries, tenant_id: str = DEFAULT_TENANT_ID):
+    """Ingest a bundle of bulk-uploaded files with one worker process.
+
+    Embedded batches are buffered and written BULK_WRITE_BATCH_SIZE chunks
+    per Chroma upsert; a file is marked completed once all of its chunks
+    are written."""
+    files = {entry.file_id: entry for entry in entries}
+    open_files = dict(files)
+    buffer = ([], [], [], [])
+    peak_rss = None
+
+    def flush():
+        ids, texts, metadatas, embeddings = buffer
+        if not ids:
+            return
+        write_embedded_chunks(ids, texts, metadatas, embeddings, tenant_id=tenant_id)
+        counts = Counter(metadata["file_id"] for metadata in metadatas)
+        for file_id, count in counts.items():
+            files[file_id].written += count
+        for values in buffer:
+            values.clear()
+        for file_id in counts:
+            entry = open_files.get(file_id)
+            if entry is None:
+                continue
+            if entry.chunks is not None and entry.written >= entry.chunks:
+                _finish_bulk_file(open_files.pop(file_id), tenant_id)
+            else:
+                update_ingestion_job(entry.job_id, chunks_written=entry.written)
+
+    update_ingestion_jobs([entry.job_id for entry in entries], status="running", pages_parsed=0,
+                          chunks_embedded=0, chunks_written=0, error=None)
+    try:
+        pool, manager = _get_pool()
+        batches = manager.Queue(maxsize=4)
+        future = pool.submit(parse_and_embed_many, [(entry.file_path, entry.file_id) for entry in entries], batches)
+
+        worker_finished = False
+        while True:
+            try:
+                message = batches.get(timeout=0.5)
+            except queue.Empty:
+                if worker_finished:
+                    raise RuntimeError("Ingestion worker exited without finishing the batch")
+                if future.done():
+                    future.result()
+                    worker_finished = True
+                continue
+
+            kind = message[0]
+            if kind == "batch":
+                _, ids, texts, metadatas, embeddings = message
+                for values, new in zip(buffer, (ids, texts, metadatas, embeddings)):
+                    values.extend(new)
+                for file_id, count in Counter(metadata["file_id"] for metadata in metadatas).items():
+                    files[file_id].embedded += count
+                    update_ingestion_job(files[file_id].job_id, chunks_embedded=files[file_id].embedded)
+                if len(buffer[0]) >= BULK_WRITE_BATCH_SIZE:
+                    flush()
+            elif kind == "parsed":
+                _, file_id, pages, chunks = message
+                entry = open_files[file_id]
+                entry.chunks = chunks
+                update_ingestion_job(entry.job_id, pages_parsed=pages)
+                if entry.written >= chunks:
+                    _finish_bulk_file(open_files.pop(file_id), tenant_id)
+            elif kind == "failed":
+                _, file_id, error = message
+                # Drop its buffered chunks; chunks already written are deleted with the document
+                keep = [i for i, metadata in enumerate(buffer[2]) if metadata["file_id"] != file_id]
+                for values in buffer:
+                    values[:] = [values[i] for i in keep]
+                print(f"Ingestion job {files[file_id].job_id} failed: {error}")
+                _finish_bulk_file(open_files.pop(file_id), tenant_id, error)
+            elif kind == "done":
+                peak_rss = message[1]
+                break
+
+        flush()
+        if open_files:
+            raise RuntimeError("Ingestion worker finished without reporting every file")
+        update_ingestion_jobs([entry.job_id for entry in entries], peak_rss_bytes=peak_rss)
+        print(f"Bulk ingestion of {len(entries)} files completed: "
+              f"{sum(entry.written for entry in entries)} chunks, peak RSS {peak_rss / 2**20:.1f} MiB")
+    except Exception as e:
+        if _shutting_down.is_set():
+            # Unfinished files are resumed one by one on the next start
+            return
+        print(f"Bulk ingestion of {len(open_files)} files failed: {e}")
+        for entry in list(open_files.values()):
+            _finish_bulk_file(entry, tenant_id, str(e))
+
+
+def bundle_files(files, bundles: int):
+    """Split (item, size) pairs into at most `bundles` lists of roughly
+    equal total size, largest items first."""
+    heap = [(0, i, []) for i in range(max(1, min(bundles, len(files))))]
+    for item, size in sorted(files, key=lambda pair: pair[1], reverse=True):
+        total, i, items = heapq.heappop(heap)
+        items.append(item)
+        heapq.heappush(heap, (total + size, i, items))
+    return [items for _, _, items in sorted(heap, key=lambda entry: entry[1]) if items]
+
+
+def submit_bulk_ingestion(batch_id: str, files, tenant_id: str = DEFAULT_TENANT_ID) -> int:
+    """Queue a bulk upload: `files` holds (job_id, file_id, filename,
+    file_path, size) tuples. They are spread over INGESTION_WORKERS bundles,
+    each parsed and embedded by one worker process. Returns the bundle count."""
+    insert_ingestion_jobs_batch(batch_id, [file[:4] for file in files], tenant_id)
+    entries = [(_BulkFile(job_id, file_id, file_path), size) for job_id, file_id, _, file_path, size in files]
+    bundles = bundle_files(entries, INGESTION_WORKERS)
+    for bundle in bundles:
+        _submit(_run_bulk_bundle, bundle, tenant_id)
+    return len(bundles)
+
+
+def resume_ingestion_jobs() -> int:
+    """Re-queue jobs left queued/running by a previous process; fail the ones
+    whose uploaded file is gone. Returns the number of resumed jobs."""
+    resumed = 0
+    for job in get_unfinished_ingestion_jobs():
+        if job["file_path"] and os.path.exists(job["file_path"]):
+            update_ingestion_job(job["id"], status="queued")
+            _submit(_run_job, job["id"], job["file_id"], job["file_path"], job["tenant_id"])
+            resumed += 1
+        else:
+            update_ingestion_job(job["id"], status="failed", error="Uploaded file missing after restart")
+            # On an ingestion thread: opening the vector store must not hold up startup
+            _submit(_discard_document, job["file_id"], job["tenant_id"])
+    if resumed:
+        print(f"Resumed {resumed} ingestion jobs")
+    return resumed
+
+
+def shutdown_ingestion():
+    global _job_threads, _process_pool, _manager
+    _shutting_down.set()
+    with _pool_lock:
+        if _job_threads is not None:
+            _job_threads.shutdown(wait=False, cancel_futures=True)
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+        if _manager is not None:
+            _manager.shutdown()
+        _job_threads = _process_pool = _manager = None
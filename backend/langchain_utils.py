@@ -1,31 +1,97 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
-from langchain_community.utilities import SerpAPIWrapper
-from chroma_utils import vectorstore
+from chroma_utils import search_documents_with_scores, keyword_coverage, embedding_function
+from cache_utils import AnswerCache, normalize_question
+from db_utils import get_corpus_generation
+from context_utils import pack_context
+from search_utils import web_search_client
+from llm_utils import DispatchedLLM, HedgedLLM, LLMOverloadedError, LLM_HEDGING, backup_model, llm_dispatcher
+from pydantic_models import ModelName, DEFAULT_TENANT_ID
 from dotenv import load_dotenv
+from functools import wraps
+import asyncio
+import httpx
+import logging
 import os
 import re
+import threading
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
+OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+# Shared connection pool to the LLM gateway: total connections, and how many
+# idle ones are kept alive for reuse
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+
+# Chunks retrieved per question
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "2"))
+
+# Prompt token budget for models without their own; PROMPT_TOKEN_BUDGET caps every model's
+DEFAULT_PROMPT_TOKEN_BUDGET = 4000
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0")) or None
+
+
+def prompt_token_budget(model) -> int:
+    try:
+        budget = ModelName(model).prompt_token_budget
+    except ValueError:
+        budget = DEFAULT_PROMPT_TOKEN_BUDGET
+    return min(budget, PROMPT_TOKEN_BUDGET) if PROMPT_TOKEN_BUDGET else budget
+
+# Relevance gate: retrieved chunks that look unrelated to the question are
+# not sent to the LLM just to get "NOT FOUND" back; the question goes
+# straight to web search or the general fallback.
+#   off     - always ask the LLM (scores are still recorded)
+#   vector  - skip when the best vector relevance is below RELEVANCE_THRESHOLD
+#   keyword - skip when the chunks' query-term coverage is below KEYWORD_COVERAGE_THRESHOLD
+#   either  - skip only when both are below their thresholds
+RELEVANCE_GATE_POLICIES = ("off", "vector", "keyword", "either")
+RELEVANCE_GATE = os.getenv("RELEVANCE_GATE", "either")
+if RELEVANCE_GATE not in RELEVANCE_GATE_POLICIES:
+    raise ValueError(f"Unknown RELEVANCE_GATE {RELEVANCE_GATE!r}; choose from {', '.join(RELEVANCE_GATE_POLICIES)}")
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.35"))
+KEYWORD_COVERAGE_THRESHOLD = float(os.getenv("KEYWORD_COVERAGE_THRESHOLD", "0.3"))
+
+
+def passes_relevance_gate(relevance, coverage, policy=None) -> bool:
+    """Whether retrieved chunks are worth an LLM call. A missing score (chunks
+    found by keyword search only, or a query without indexable terms) never
+    causes a skip."""
+    policy = policy or RELEVANCE_GATE
+    vector_ok = relevance is None or relevance >= RELEVANCE_THRESHOLD
+    keyword_ok = coverage is None or coverage >= KEYWORD_COVERAGE_THRESHOLD
+    if policy == "vector":
+        return vector_ok
+    if policy == "keyword":
+        return keyword_ok
+    if policy == "either":
+        return vector_ok or keyword_ok
+    return True
+
 
 @tool
-def document_search(q: str):
+def document_search(q: str, tenant_id: str = DEFAULT_TENANT_ID):
     """Searches your uploaded documents and returns relevant content."""
-    docs = retriever.invoke(q)
-    return "\n\n".join([doc.page_content for doc in docs if doc.page_content])
+    hits = [(doc, score) for doc, score in search_documents_with_scores(q, k=RETRIEVER_K, tenant_id=tenant_id)
+            if doc.page_content]
+    # Ranked chunk texts (the chain packs them into the prompt budget) and
+    # the scores the relevance gate decides on
+    chunks = [doc.page_content for doc, _ in hits]
+    scores = [score for _, score in hits if score is not None]
+    return {
+        "chunks": chunks,
+        "scores": [score for _, score in hits],
+        "relevance": max(scores) if scores else None,
+        "keyword_coverage": keyword_coverage(q, chunks, tenant_id) if chunks else None,
+    }
 
 @tool
 def web_search(q: str):
     """Live search for current events, weather, or today's date."""
     print(f"web_search called with: {q}")
-    wrapper = SerpAPIWrapper()
-    result = wrapper.run(q)
-
-    # Ensure result is a string (SerpAPIWrapper can return non-string in some setups)
-    if not isinstance(result, str):
-        result = str(result)
+    # Cached per normalized query; identical searches in flight are coalesced
+    result = web_search_client.search(q)
 
     # Prevent huge tool output from breaking/overloading the LLM prompt
     return result[:4000]
@@ -48,126 +114,586 @@ LIVE_KEYWORDS = [
     "killed", "killing", "died", "dead", "death", "martyred", "martyr",
 ]
 
-def _history_to_text(chat_history) -> str:
-    """Converts DB chat_history into a readable text block for the LLM."""
-    if not chat_history:
-        return ""
-
-    # If already list[dict] with role/content
-    if isinstance(chat_history, list) and chat_history and isinstance(chat_history[0], dict):
-        lines = []
-        for m in chat_history[-8:]:
-            role = m.get("role", "user")
-            content = m.get("content", "")
-            if content:
-                lines.append(f"{role}: {content}")
-        return "\n".join(lines)
-
-    # Otherwise stringify safely
-    try:
-        return "\n".join([str(x) for x in chat_history[-8:]])
-    except Exception:
-        return str(chat_history)
+# Long-lived HTTP clients shared by every model's ChatOpenAI, so connections
+# (and TLS sessions) to OpenRouter are reused across requests.
+_http_clients = None
+# The warm-up thread and request handlers may build the clients, models and
+# chains at the same time; each is built once
+_build_lock = threading.RLock()
+
+
+def build_once(factory):
+    """Cache factory(*args) like lru_cache, but build each value only once
+    when several threads ask for it at the same time. Hits take no lock."""
+    built = {}
+
+    @wraps(factory)
+    def get(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        value = built.get(key)
+        if value is None:
+            with _build_lock:
+                value = built.get(key)
+                if value is None:
+                    value = built[key] = factory(*args, **kwargs)
+        return value
+
+    get.cache_clear = built.clear
+    return get
+
+
+def get_http_clients():
+    global _http_clients
+    with _build_lock:
+        if _http_clients is None:
+            limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE)
+            _http_clients = (
+                httpx.Client(limits=limits, timeout=LLM_REQUEST_TIMEOUT),
+                httpx.AsyncClient(limits=limits, timeout=LLM_REQUEST_TIMEOUT),
+            )
+        return _http_clients
+
+
+def llm_clients_ready() -> bool:
+    return _http_clients is not None
+
+
+@build_once
+def get_llm(model):
+    # langchain_openai (and the openai SDK) take seconds to import; they are
+    # loaded with the first model instead of at startup
+    from langchain_openai import ChatOpenAI
 
-def get_rag_chain(model="nvidia/nemotron-nano-9b-v2:free"):
-    llm = ChatOpenAI(
+    http_client, http_async_client = get_http_clients()
+    return ChatOpenAI(
         model=model,
         openai_api_key=os.getenv("OPENROUTER_API_KEY"),
-        openai_api_base="https://openrouter.ai/api/v1",
-        request_timeout=120
+        openai_api_base=OPENROUTER_API_BASE,
+        request_timeout=LLM_REQUEST_TIMEOUT,
+        # Retries are left to the dispatcher, which frees the model's slot while backing off
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client
     )
 
-    class AgentRAGChain:
-        def invoke(self, inputs):
-            user_q = inputs["input"]
-            normalized_q = user_q.lower().strip()
 
-            chat_history = inputs.get("chat_history", [])
-            history_text = _history_to_text(chat_history)
+async def aclose_llm_clients():
+    global _http_clients
+    get_rag_chain.cache_clear()
+    get_llm.cache_clear()
+    if _http_clients is not None:
+        http_client, http_async_client = _http_clients
+        _http_clients = None
+        http_client.close()
+        await http_async_client.aclose()
 
-            print("User asked:", user_q)
 
-            # 1) Greeting
-            if is_greeting(normalized_q) or normalized_q in ["how are you?", "what's up?", "are you there?"]:
-                return {"answer": "Hello! How can I assist you today?", "source": "greeting"}
+# Streamed document answers are held back until this many characters have
+# arrived, so a "NOT FOUND" reply is never shown to the user
+NOT_FOUND_PROBE_CHARS = 24
 
-            # 2) Documents first (RAG)
-            print("Trying PDF/doc search...")
+# Speculative routing: for live questions, build the document- and
+# web-grounded answers concurrently instead of one after the other
+SPECULATIVE_ROUTING = os.getenv("SPECULATIVE_ROUTING", "true").lower() in ("1", "true", "yes")
+# Per-stage time budgets (seconds) for a speculative candidate: the search,
+# then the LLM answer built on it
+ROUTE_SEARCH_TIMEOUT = float(os.getenv("ROUTE_SEARCH_TIMEOUT", "10"))
+ROUTE_LLM_TIMEOUT = float(os.getenv("ROUTE_LLM_TIMEOUT", "60"))
+
+
+def _event(kind, **fields):
+    return {"type": kind, **fields}
+
+
+def _note_served(served, message):
+    """Record which model produced `message` (and how, if it was hedged)."""
+    metadata = getattr(message, "response_metadata", None) or {}
+    if served is None or "model_name" not in metadata:
+        return
+    served["model"] = metadata["model_name"]
+    if "hedge" in metadata:
+        served["hedge"] = metadata["hedge"]
+
+
+async def _within(agen, timeout):
+    """Re-yield from an async generator, raising TimeoutError once `timeout`
+    seconds have passed in total."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        while True:
             try:
-                doc_answer = document_search(user_q)
-            except Exception as e:
-                print("document_search failed:", e)
-                doc_answer = ""
-
-            print("Doc search result:", (doc_answer[:1200] + "...") if doc_answer else "(empty)")
-
-            if doc_answer and doc_answer.strip():
-                check_prompt = (
-                    "You are a helpful document assistant. Answer ONLY using the document extract.\n"
-                    "Use chat history only to resolve references (he/it/that), but do NOT invent facts.\n"
-                    f"Chat history:\n{history_text}\n\n"
-                    "If the answer is not present in the document extract, reply ONLY with: NOT FOUND.\n\n"
-                    f"Document Extract:\n'''\n{doc_answer}\n'''\n\n"
-                    f"User question: {user_q}\n"
-                )
-                try:
-                    llm_result = llm.invoke(check_prompt)
-                    content = getattr(llm_result, "content", None) or str(llm_result)
-                    print("Doc LLM result:", content)
-                    if "NOT FOUND" not in content.upper():
-                        return {"answer": content.strip(), "source": "document"}
-                except Exception as e:
-                    print(f"PDF LLM check failed: {e}")
-
-            # 3) Live/current → web search
-            if any(kw in normalized_q for kw in LIVE_KEYWORDS):
-                try:
-                    tool_data = web_search(user_q)
-                except Exception as e:
-                    print("web_search failed:", e)
-                    return {"answer": f"Sorry, web search failed: {e}", "source": "web"}
-
-                tool_data = (tool_data or "")[:4000]
-
-                web_prompt = (
-                    "You are a helpful assistant.\n"
-                    "Use the chat history to understand follow-up questions.\n"
-                    f"Chat history:\n{history_text}\n\n"
-                    f"User question: {user_q}\n\n"
-                    "Web results (may be noisy):\n"
-                    f"{tool_data}\n\n"
-                    "Task:\n"
-                    "- Provide a short, direct answer.\n"
-                    "- If user asks a follow-up like 'tell me in celsius', use the previous temperature from chat history.\n"
-                    "- If results are contradictory or not clearly verified, say you cannot confirm.\n"
-                )
-                try:
-                    llm_result = llm.invoke(web_prompt)
-                    content = getattr(llm_result, "content", None) or str(llm_result)
-                    return {"answer": content.strip(), "source": "web"}
-                except Exception as e:
-                    print(f"Web LLM error: {e}")
-                    # IMPORTANT: don't dump raw tool data to the user
-                    return {
-                        "answer": "I found web results but couldn't summarize them right now. Please try again.",
-                        "source": "web"
-                    }
-
-            # 4) General LLM fallback (conversational)
-            print("Trying direct LLM fallback...")
-            fallback_prompt = (
-                "You are a helpful assistant.\n"
-                "Use chat history to answer follow-up questions.\n"
-                f"Chat history:\n{history_text}\n\n"
-                f"User question: {user_q}\n"
+                item = await asyncio.wait_for(agen.__anext__(), deadline - loop.time())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        await agen.aclose()
+
+
+# Prompt templates: {history} and {context} are filled by the context packer
+DOCUMENT_PROMPT = (
+    "You are a helpful document assistant. Answer ONLY using the document extract.\n"
+    "Use chat history only to resolve references (he/it/that), but do NOT invent facts.\n"
+    "Chat history:\n{history}\n\n"
+    "If the answer is not present in the document extract, reply ONLY with: NOT FOUND.\n\n"
+    "Document Extract:\n'''\n{context}\n'''\n\n"
+    "User question: {question}\n"
+)
+
+WEB_PROMPT = (
+    "You are a helpful assistant.\n"
+    "Use the chat history to understand follow-up questions.\n"
+    "Chat history:\n{history}\n\n"
+    "User question: {question}\n\n"
+    "Web results (may be noisy):\n"
+    "{context}\n\n"
+    "Task:\n"
+    "- Provide a short, direct answer.\n"
+    "- If user asks a follow-up like 'tell me in celsius', use the previous temperature from chat history.\n"
+    "- If results are contradictory or not clearly verified, say you cannot confirm.\n"
+)
+
+FALLBACK_PROMPT = (
+    "You are a helpful assistant.\n"
+    "Use chat history to answer follow-up questions.\n"
+    "Chat history:\n{history}\n\n"
+    "User question: {question}\n"
+)
+
+
+def build_prompt(template, budget, user_q, chat_history, chunks=None, label="prompt"):
+    """Fill a prompt template with as much history and context as fit the budget."""
+    packed = pack_context(budget, template.format(history="", context="", question=user_q), chat_history, chunks)
+    logging.info(f"Prompt tokens ({label}): {packed.tokens}")
+    return template.format(history=packed.history_text, context=packed.context_text, question=user_q)
+
+
+class RoutingStats:
+    """Counters for speculative routing (which path won and the latency saved
+    compared with running the same paths one after the other) and for the
+    relevance gate (document LLM calls made and skipped)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.speculative_requests = 0
+        self.wins = {}
+        self.total_saved_ms = 0.0
+        self.gate_decisions = {}
+        self.documents_answered = 0
+
+    def record(self, winner, saved_ms):
+        with self._lock:
+            self.speculative_requests += 1
+            self.wins[winner] = self.wins.get(winner, 0) + 1
+            self.total_saved_ms += saved_ms
+
+    def record_gate(self, retrieval):
+        with self._lock:
+            decision = retrieval["decision"]
+            self.gate_decisions[decision] = self.gate_decisions.get(decision, 0) + 1
+            if retrieval.get("answered"):
+                self.documents_answered += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self.speculative_requests
+            return {
+                "speculative_requests": n,
+                "wins": dict(self.wins),
+                "total_latency_saved_ms": self.total_saved_ms,
+                "avg_latency_saved_ms": self.total_saved_ms / n if n else 0.0,
+                "relevance_gate": {
+                    "policy": RELEVANCE_GATE,
+                    "decisions": dict(self.gate_decisions),
+                    "llm_calls_saved": self.gate_decisions.get("skipped", 0),
+                    "documents_answered": self.documents_answered,
+                },
+            }
+
+
+routing_stats = RoutingStats()
+
+
+class AgentRAGChain:
+    """Docs-first routing chain. Async only: its LLM client keeps pooled
+    connections that belong to the running event loop.
+
+    astream() yields events: one "source" once the route is decided, "token"
+    events with answer text, then "done" with the full answer."""
+
+    def __init__(self, llm, speculative=SPECULATIVE_ROUTING, prompt_budget=DEFAULT_PROMPT_TOKEN_BUDGET):
+        self.llm = llm
+        self.speculative = speculative
+        self.prompt_budget = prompt_budget
+
+    async def ainvoke(self, inputs):
+        async for event in self.astream(inputs, stream=False):
+            if event["type"] == "done":
+                return {key: value for key, value in event.items() if key != "type"}
+
+    async def _generate(self, prompt, stream, served=None):
+        """Yield the answer text: whole (stream=False) or token by token.
+
+        `served`, if given, is filled with the model that answered (and the
+        hedge details, for a hedged model)."""
+        if served is not None:
+            served.clear()
+        if not stream:
+            result = await self.llm.ainvoke(prompt)
+            _note_served(served, result)
+            yield getattr(result, "content", None) or str(result)
+            return
+        chunks = self.llm.astream(prompt)
+        try:
+            async for chunk in chunks:
+                if chunk.content:
+                    _note_served(served, chunk)
+                    yield chunk.content
+        finally:
+            await chunks.aclose()
+
+    async def _answer(self, source, prompt, stream, error_answer, llm_timeout=None, served=None):
+        """Emit source, tokens and done for one LLM answer."""
+        yield _event("source", source=source)
+        answer = ""
+        failed = False
+        pieces = self._generate(prompt, stream, served)
+        if llm_timeout is not None:
+            pieces = _within(pieces, llm_timeout)
+        try:
+            async for piece in pieces:
+                if not answer:
+                    piece = piece.lstrip()
+                answer += piece
+                if piece:
+                    yield _event("token", content=piece)
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            print(f"{source} LLM error: {e!r}")
+            failed = True
+            if not answer:
+                answer = error_answer(e)
+                yield _event("token", content=answer)
+        finally:
+            # Ends the upstream stream (and frees its dispatcher slot) if the
+            # consumer stops early, instead of at garbage collection
+            await pieces.aclose()
+        if failed:
+            yield _event("done", answer=answer.strip(), source=source, error=True)
+        else:
+            yield _event("done", answer=answer.strip(), source=source)
+
+    async def _document_answer(self, user_q, chat_history, stream, search_timeout=None, llm_timeout=None,
+                               tenant_id=DEFAULT_TENANT_ID, retrieval=None, served=None):
+        """Yield the document-grounded answer's text, from the tenant's documents
+        only. Yields nothing when they do not hold the answer, the relevance
+        gate rules them out or a stage fails.
+
+        `retrieval`, if given, is filled with the scores and gate decision."""
+        retrieval = {} if retrieval is None else retrieval
+        retrieval.update(policy=RELEVANCE_GATE, relevance=None, keyword_coverage=None, chunks=0)
+        print("Trying PDF/doc search...")
+        try:
+            found = await asyncio.wait_for(
+                document_search.ainvoke({"q": user_q, "tenant_id": tenant_id}), search_timeout
             )
+        except Exception as e:
+            print("document_search failed:", repr(e))
+            retrieval["decision"] = "search_failed"
+            return
+
+        doc_chunks = found["chunks"]
+        retrieval.update(relevance=found["relevance"], keyword_coverage=found["keyword_coverage"],
+                         chunks=len(doc_chunks))
+        doc_answer = "\n\n".join(doc_chunks)
+        print("Doc search result:", (doc_answer[:1200] + "...") if doc_answer else "(empty)")
+        if not doc_answer.strip():
+            retrieval["decision"] = "no_chunks"
+            return
+        if not passes_relevance_gate(found["relevance"], found["keyword_coverage"]):
+            print(f"Relevance gate: skipping the document check (relevance {found['relevance']}, "
+                  f"keyword coverage {found['keyword_coverage']})")
+            retrieval["decision"] = "skipped"
+            return
+        retrieval.update(decision="checked", answered=False)
+
+        prompt = build_prompt(DOCUMENT_PROMPT, self.prompt_budget, user_q, chat_history, doc_chunks, "document")
+        pieces = self._generate(prompt, stream, served)
+        if llm_timeout is not None:
+            pieces = _within(pieces, llm_timeout)
+        buffered = ""
+        committed = False
+        try:
+            async for piece in pieces:
+                buffered += piece
+                if committed:
+                    yield piece
+                elif len(buffered.strip()) >= NOT_FOUND_PROBE_CHARS:
+                    if "NOT FOUND" in buffered.upper():
+                        break
+                    committed = True
+                    retrieval["answered"] = True
+                    yield buffered.lstrip()
+            print("Doc LLM result:", buffered)
+            if not committed and buffered.strip() and "NOT FOUND" not in buffered.upper():
+                retrieval["answered"] = True
+                yield buffered.strip()
+        except LLMOverloadedError:
+            # Every other route would wait on the same model
+            raise
+        except Exception as e:
+            print(f"PDF LLM check failed: {e!r}")
+        finally:
+            # On NOT FOUND the loop stops early: end the upstream stream now
+            await pieces.aclose()
+
+    async def _web_answer(self, user_q, chat_history, stream, search_timeout=None, llm_timeout=None, served=None):
+        try:
+            tool_data = await asyncio.wait_for(web_search.ainvoke(user_q), search_timeout)
+        except Exception as e:
+            print("web_search failed:", repr(e))
+            answer = f"Sorry, web search failed: {str(e) or 'timed out'}"
+            yield _event("source", source="web")
+            yield _event("token", content=answer)
+            yield _event("done", answer=answer, source="web", error=True)
+            return
+
+        tool_data = (tool_data or "")[:4000]
+        prompt = build_prompt(WEB_PROMPT, self.prompt_budget, user_q, chat_history, [tool_data], "web")
+        # IMPORTANT: don't dump raw tool data to the user if summarizing fails
+        async for event in self._answer(
+            "web", prompt, stream,
+            lambda e: "I found web results but couldn't summarize them right now. Please try again.",
+            llm_timeout=llm_timeout, served=served
+        ):
+            yield event
+
+    async def astream(self, inputs, stream=True):
+        """Route the question; the "done" event carries the relevance gate's
+        scores and decision as "retrieval" when the documents were searched,
+        and the model that answered as "model" (with "hedge" details for a
+        hedged model)."""
+        retrieval, served = {}, {}
+        async for event in self._route(inputs, stream, retrieval, served):
+            if event["type"] == "done":
+                if retrieval:
+                    routing_stats.record_gate(retrieval)
+                    event = {**event, "retrieval": dict(retrieval)}
+                if served:
+                    event = {**event, **served}
+            yield event
+
+    async def _route(self, inputs, stream, retrieval, served):
+        user_q = inputs["input"]
+        normalized_q = user_q.lower().strip()
+
+        chat_history = inputs.get("chat_history", [])
+        tenant_id = inputs.get("tenant_id", DEFAULT_TENANT_ID)
+
+        print("User asked:", user_q)
+
+        # 1) Greeting
+        if is_greeting(normalized_q) or normalized_q in ["how are you?", "what's up?", "are you there?"]:
+            answer = "Hello! How can I assist you today?"
+            yield _event("source", source="greeting")
+            yield _event("token", content=answer)
+            yield _event("done", answer=answer, source="greeting")
+            return
+
+        # Past this point answering takes a model call: turn the request away
+        # now if the model's queue is full
+        check_admission = getattr(self.llm, "check_admission", None)
+        if check_admission is not None:
+            check_admission()
+
+        is_live = any(kw in normalized_q for kw in LIVE_KEYWORDS)
+        if is_live and self.speculative:
+            async for event in self._speculative(user_q, chat_history, stream, tenant_id, retrieval, served):
+                yield event
+            return
+
+        # 2) Documents first (RAG)
+        answer = ""
+        async for piece in self._document_answer(user_q, chat_history, stream, tenant_id=tenant_id,
+                                                 retrieval=retrieval, served=served):
+            if not answer:
+                yield _event("source", source="document")
+            answer += piece
+            yield _event("token", content=piece)
+        if answer:
+            yield _event("done", answer=answer.strip(), source="document")
+            return
+
+        # 3) Live/current → web search
+        if is_live:
+            async for event in self._web_answer(user_q, chat_history, stream, served=served):
+                yield event
+            return
+
+        # 4) General LLM fallback (conversational)
+        print("Trying direct LLM fallback...")
+        fallback_prompt = build_prompt(FALLBACK_PROMPT, self.prompt_budget, user_q, chat_history, label="llm")
+        async for event in self._answer(
+            "llm", fallback_prompt, stream,
+            lambda e: f"Sorry, something went wrong: {e}",
+            served=served
+        ):
+            yield event
+
+    async def _speculative(self, user_q, chat_history, stream, tenant_id=DEFAULT_TENANT_ID, retrieval=None,
+                           served=None):
+        """Start the document and web answers together and commit to the first
+        one, in priority order, that produces an answer; the others are cancelled."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        timing = {}
+
+        async def run(name, agen, out):
             try:
-                result = llm.invoke(fallback_prompt)
-                content = getattr(result, "content", None) or str(result)
-                print("Direct LLM result:", content)
-                return {"answer": content.strip(), "source": "llm"}
+                async for item in agen:
+                    await out.put(item)
+            except LLMOverloadedError as e:
+                await out.put(e)
             except Exception as e:
-                print(f"Agent fallback error: {e}")
-                return {"answer": f"Sorry, something went wrong: {e}", "source": "llm"}
+                print(f"Speculative {name} path failed: {e!r}")
+            finally:
+                timing[name] = (loop.time() - started) * 1000
+                await out.put(None)
+
+        doc_out, web_out = asyncio.Queue(), asyncio.Queue()
+        # Each path notes its own model; only the winner's is reported
+        doc_served, web_served = {}, {}
+        doc_task = asyncio.create_task(run("document", self._document_answer(
+            user_q, chat_history, stream, ROUTE_SEARCH_TIMEOUT, ROUTE_LLM_TIMEOUT, tenant_id, retrieval, doc_served),
+            doc_out))
+        web_task = asyncio.create_task(run("web", self._web_answer(
+            user_q, chat_history, stream, ROUTE_SEARCH_TIMEOUT, ROUTE_LLM_TIMEOUT, web_served), web_out))
+        try:
+            first = await doc_out.get()
+            if isinstance(first, LLMOverloadedError):
+                raise first
+            if first is not None:
+                # The document path has the answer: the web path is not needed
+                web_task.cancel()
+                verdict_ms = (loop.time() - started) * 1000
+                yield _event("source", source="document")
+                answer = ""
+                piece = first
+                while piece is not None:
+                    answer += piece
+                    yield _event("token", content=piece)
+                    piece = await doc_out.get()
+                winner, saved_ms = "document", 0.0
+                stages = {"document": timing.get("document"), "web": None}
+                done = _event("done", answer=answer.strip(), source="document")
+            else:
+                verdict_ms = timing["document"]
+                done = None
+                while (event := await web_out.get()) is not None:
+                    if isinstance(event, LLMOverloadedError):
+                        raise event
+                    if event["type"] == "done":
+                        done = event
+                    else:
+                        yield event
+                if done is None:
+                    answer = "Sorry, web search failed. Please try again."
+                    yield _event("token", content=answer)
+                    done = _event("done", answer=answer, source="web", error=True)
+                web_ms = timing["web"]
+                winner = "web"
+                # Run one after the other, the web path would only have started at verdict_ms
+                saved_ms = max(0.0, verdict_ms + web_ms - (loop.time() - started) * 1000)
+                stages = {"document": verdict_ms, "web": web_ms}
+
+            route = {
+                "mode": "speculative",
+                "winner": winner,
+                "document_verdict_ms": verdict_ms,
+                "stage_ms": stages,
+                "latency_saved_ms": saved_ms,
+            }
+            if served is not None:
+                served.update(doc_served if winner == "document" else web_served)
+            routing_stats.record(winner, saved_ms)
+            print(f"Speculative routing: {winner} won, saved {saved_ms:.0f} ms")
+            yield {**done, "route": route}
+        finally:
+            for task in (doc_task, web_task):
+                task.cancel()
+
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Follow-up questions lean on chat history ("what about it?"), so their
+# answers are not cached under the question text alone
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|that|this|those|these|they|them|their|he|she|him|her|his|previous|same|again|else)\b"
+    r"|^(and|so|but|also|what about|how about|tell me in)\b"
+)
+
+
+def is_standalone_question(question, chat_history) -> bool:
+    if not chat_history:
+        return True
+    return not FOLLOW_UP_PATTERN.search(normalize_question(question))
+
+
+class CachedAnswerChain:
+    """Answer cache in front of a chain. A hit is replayed as the same
+    source/token/done events without retrieval or any LLM call."""
+
+    def __init__(self, chain, cache, model):
+        self.chain = chain
+        self.cache = cache
+        self.model = model
+
+    async def ainvoke(self, inputs):
+        async for event in self.astream(inputs, stream=False):
+            if event["type"] == "done":
+                return {key: value for key, value in event.items() if key != "type"}
+
+    def _lookup(self, question, tenant_id):
+        generation = get_corpus_generation(tenant_id)
+        return generation, self.cache.get(self.model, generation, question, tenant_id)
+
+    async def astream(self, inputs, stream=True):
+        question = inputs["input"]
+        tenant_id = inputs.get("tenant_id", DEFAULT_TENANT_ID)
+        cacheable = is_standalone_question(question, inputs.get("chat_history"))
+        if cacheable:
+            # SQLite reads (and the odd write), kept off the event loop
+            generation, hit = await asyncio.to_thread(self._lookup, question, tenant_id)
+            if hit is not None:
+                print("Answer cache hit:", question)
+                yield _event("source", source=hit["source"])
+                yield _event("token", content=hit["answer"])
+                yield _event("done", answer=hit["answer"], source=hit["source"], cached=True)
+                return
+
+        async for event in self.chain.astream(inputs, stream=stream):
+            if (event["type"] == "done" and cacheable and event["answer"]
+                    and event["source"] != "greeting" and not event.get("error")):
+                await asyncio.to_thread(self.cache.put, self.model, generation, question, event["answer"],
+                                        event["source"], tenant_id)
+            yield event
+
+
+answer_cache = AnswerCache(embeddings=embedding_function) if ANSWER_CACHE_ENABLED else None
+
 
-    return AgentRAGChain()
\ No newline at end of file
+@build_once
+def get_rag_chain(model="nvidia/nemotron-nano-9b-v2:free", hedging=None):
+    """The chain answering with `model`. With hedging (LLM_HEDGING by default)
+    slow or failing calls are raced against, or handed to, a backup model;
+    prompts keep `model`'s token budget."""
+    llm = DispatchedLLM(get_llm(model), model, llm_dispatcher)
+    backup = backup_model(model) if (LLM_HEDGING if hedging is None else hedging) else None
+    if backup:
+        llm = HedgedLLM(llm, DispatchedLLM(get_llm(backup), backup, llm_dispatcher))
+    chain = AgentRAGChain(llm, prompt_budget=prompt_token_budget(model))
+    if answer_cache is not None:
+        return CachedAnswerChain(chain, answer_cache, model)
+    return chain
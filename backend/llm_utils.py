@@ -0,0 +1,555 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional
+from langchain_core.messages import AIMessage, AIMessageChunk
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+
+# Requests sent to one model at the same time; further requests wait in the
+# model's queue, in arrival order
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Requests allowed to wait per model; beyond that (or after waiting
+# LLM_QUEUE_TIMEOUT seconds) they are rejected with HTTP 429
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "15"))
+# Retries of rate-limited, overloaded or timed-out calls, with exponential
+# backoff and full jitter (seconds) so retries from a burst do not line up
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+# Hedged requests: when the chosen model has not produced its first token by
+# the LLM_HEDGE_PERCENTILE-th percentile of its recent first-token latencies,
+# the prompt also goes to a backup model and whichever answers first is used.
+# A failed call fails over to the backup at once.
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+# Backups in order of preference; a model's backup is the first one that is not itself
+LLM_BACKUP_MODELS = [m.strip() for m in os.getenv(
+    "LLM_BACKUP_MODELS", "qwen/qwen3-4b:free,nvidia/nemotron-nano-9b-v2:free").split(",") if m.strip()]
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Latencies kept per model, and how many are needed before the percentile is
+# trusted; until then the deadline is LLM_HEDGE_DELAY seconds. The deadline
+# is never shorter than LLM_HEDGE_MIN_DELAY.
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# openai SDK errors without a status code that are worth retrying
+RETRYABLE_ERRORS = {"APITimeoutError", "APIConnectionError", "ConnectTimeout", "ReadTimeout", "ConnectError"}
+
+
+class LLMOverloadedError(Exception):
+    """A model's queue is full, or a request waited too long for a slot."""
+
+    def __init__(self, model: str, reason: str, retry_after: int):
+        super().__init__(f"Model {model} is overloaded ({reason}); retry in {retry_after}s.")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, LLMOverloadedError):
+        return False
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    return isinstance(error, asyncio.TimeoutError) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_after_header(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: Exception = None, base: float = None, cap: float = None) -> float:
+    """Full-jitter exponential backoff, at least as long as a Retry-After
+    header on the error asks for (up to `cap`)."""
+    base = LLM_RETRY_BASE_DELAY if base is None else base
+    cap = LLM_RETRY_MAX_DELAY if cap is None else cap
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    requested = retry_after_header(error) if error is not None else None
+    return min(cap, max(delay, requested or 0.0))
+
+
+_END = object()
+
+
+class _Flight:
+    """One upstream call and the requests sharing its output."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        # Cancelled calls have no result to share: their joiners start over
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.subscribers: set = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        for chunk in self.chunks:
+            queue.put_nowait(chunk)
+        if self.done:
+            queue.put_nowait(_END)
+        self.subscribers.add(queue)
+        return queue
+
+    def publish(self, item):
+        if item is not _END:
+            self.chunks.append(item)
+        for queue in self.subscribers:
+            queue.put_nowait(item)
+
+
+@dataclass
+class ModelState:
+    """Slots, wait queue, in-flight calls and counters for one model."""
+    active: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+    inflight: Dict[str, _Flight] = field(default_factory=dict)
+    requests: int = 0
+    coalesced: int = 0
+    upstream_calls: int = 0
+    retries: int = 0
+    errors: int = 0
+    rejected: int = 0
+    queue_timeouts: int = 0
+    waited: int = 0
+    total_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+    max_queue_depth: int = 0
+    upstream_ms: float = 0.0
+    upstream_done: int = 0
+
+
+class LLMDispatcher:
+    """Admission control in front of the LLM gateway, per model.
+
+    At most `max_concurrency` calls per model are upstream at once; the rest
+    wait in a bounded FIFO queue and are rejected with LLMOverloadedError
+    when it is full or their wait exceeds `queue_timeout`. Identical prompts
+    to the same model share one upstream call while it is in flight, and
+    retryable failures are retried with jittered backoff, releasing the slot
+    while backing off.
+
+    Async only: slots and flights belong to the running event loop."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, retries: int = LLM_RETRIES):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self._models: Dict[str, ModelState] = {}
+
+    def _state(self, model: str) -> ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = ModelState()
+        return state
+
+    def _overloaded(self, model: str, state: ModelState, reason: str) -> LLMOverloadedError:
+        avg_upstream_s = state.upstream_ms / state.upstream_done / 1000 if state.upstream_done else 1.0
+        return LLMOverloadedError(model, reason, max(1, math.ceil(avg_upstream_s)))
+
+    def check_admission(self, model: str):
+        """Raise LLMOverloadedError right away if a new request to `model`
+        could not even join its queue."""
+        state = self._state(model)
+        if state.active >= self.max_concurrency and len(state.waiters) >= self.max_queue:
+            state.rejected += 1
+            raise self._overloaded(model, state, "queue full")
+
+    async def _acquire(self, model: str, state: ModelState):
+        if state.active < self.max_concurrency and not state.waiters:
+            state.active += 1
+            return
+        if len(state.waiters) >= self.max_queue:
+            state.rejected += 1
+            raise self._overloaded(model, state, "queue full")
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        state.max_queue_depth = max(state.max_queue_depth, len(state.waiters))
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release(state)
+            elif waiter in state.waiters:
+                state.waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                state.queue_timeouts += 1
+                raise self._overloaded(model, state, f"waited {self.queue_timeout:g}s") from None
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - start) * 1000
+            state.waited += 1
+            state.total_wait_ms += wait_ms
+            state.max_wait_ms = max(state.max_wait_ms, wait_ms)
+
+    def _release(self, state: ModelState):
+        # Hand the slot to the longest waiter still waiting, if any
+        while state.waiters:
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        state.active -= 1
+
+    async def _call(self, llm, model: str, state: ModelState, prompt, stream: bool, retries: int):
+        """Yield the answer text of one upstream call, retrying failures that
+        happen before any text has arrived."""
+        for attempt in range(retries + 1):
+            await self._acquire(model, state)
+            emitted = False
+            start = time.perf_counter()
+            try:
+                state.upstream_calls += 1
+                if stream:
+                    async for chunk in llm.astream(prompt):
+                        if chunk.content:
+                            emitted = True
+                            yield chunk.content
+                else:
+                    result = await llm.ainvoke(prompt)
+                    yield getattr(result, "content", None) or str(result)
+                state.upstream_ms += (time.perf_counter() - start) * 1000
+                state.upstream_done += 1
+                return
+            except Exception as e:
+                state.errors += 1
+                if emitted or attempt == retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt, e)
+                state.retries += 1
+                print(f"LLM call to {model} failed ({e!r}); retry {attempt + 1} in {delay:.2f}s")
+            finally:
+                self._release(state)
+            await asyncio.sleep(delay)
+
+    async def _run(self, llm, model: str, state: ModelState, key: str, flight: _Flight, stream: bool,
+                   retries: int):
+        try:
+            async for text in self._call(llm, model, state, key, stream, retries):
+                flight.publish(text)
+        except asyncio.CancelledError:
+            flight.cancelled = True
+            raise
+        except BaseException as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if state.inflight.get(key) is flight:
+                del state.inflight[key]
+            flight.publish(_END)
+
+    async def generate(self, llm, model: str, prompt: str, stream: bool = True, retries: int = None):
+        """Yield the answer text for `prompt`: token by token with stream=True,
+        else in one piece (a request joining a streamed call gets its text so
+        far at once, then the rest as it arrives).
+
+        `retries` overrides the dispatcher's retry count for a new call; a
+        request joining an identical call in flight shares its retries."""
+        retries = self.retries if retries is None else retries
+        state = self._state(model)
+        state.requests += 1
+        while True:
+            flight = state.inflight.get(prompt)
+            if flight is None:
+                flight = state.inflight[prompt] = _Flight()
+                flight.task = asyncio.create_task(self._run(llm, model, state, prompt, flight, stream, retries))
+            else:
+                state.coalesced += 1
+            queue = flight.subscribe()
+            received = False
+            try:
+                while (item := await queue.get()) is not _END:
+                    received = True
+                    yield item
+                if flight.cancelled:
+                    if not received:
+                        continue
+                    raise RuntimeError(f"The call to {model} was cancelled while streaming its answer.")
+                if flight.error is not None:
+                    raise flight.error
+                return
+            finally:
+                flight.subscribers.discard(queue)
+                if not flight.subscribers and not flight.done:
+                    # Nobody wants the answer any more (client gone, NOT FOUND
+                    # probe, losing speculative path): stop the upstream call,
+                    # taking it out of inflight first so no new request joins it
+                    if state.inflight.get(prompt) is flight:
+                        del state.inflight[prompt]
+                    flight.task.cancel()
+
+    def stats(self) -> dict:
+        models = {}
+        for model, state in list(self._models.items()):
+            models[model] = {
+                "in_flight": state.active,
+                "queue_depth": len(state.waiters),
+                "max_queue_depth": state.max_queue_depth,
+                "requests": state.requests,
+                "coalesced": state.coalesced,
+                "upstream_calls": state.upstream_calls,
+                "retries": state.retries,
+                "errors": state.errors,
+                "queued": state.waited,
+                "rejected": state.rejected,
+                "queue_timeouts": state.queue_timeouts,
+                "avg_wait_ms": state.total_wait_ms / state.waited if state.waited else 0.0,
+                "max_wait_ms": state.max_wait_ms,
+                "avg_upstream_ms": state.upstream_ms / state.upstream_done if state.upstream_done else 0.0,
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "models": models,
+        }
+
+
+class DispatchedLLM:
+    """A chat model whose ainvoke/astream go through the dispatcher. Replies
+    name the model in response_metadata["model_name"]."""
+
+    def __init__(self, llm, model: str, dispatcher: LLMDispatcher):
+        self.llm = llm
+        self.model = model
+        self.dispatcher = dispatcher
+
+    def check_admission(self):
+        self.dispatcher.check_admission(self.model)
+
+    def pieces(self, prompt, stream: bool, retries: int = None):
+        return self.dispatcher.generate(self.llm, self.model, prompt, stream, retries)
+
+    async def ainvoke(self, prompt):
+        pieces = [piece async for piece in self.pieces(prompt, stream=False)]
+        return AIMessage(content="".join(pieces), response_metadata={"model_name": self.model})
+
+    async def astream(self, prompt):
+        pieces = self.pieces(prompt, stream=True)
+        try:
+            async for piece in pieces:
+                yield AIMessageChunk(content=piece, response_metadata={"model_name": self.model})
+        finally:
+            await pieces.aclose()
+
+
+def backup_model(model: str, backups: Iterable[str] = None) -> Optional[str]:
+    return next((backup for backup in (backups or LLM_BACKUP_MODELS) if backup != model), None)
+
+
+def percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class LatencyTracker:
+    """Recent first-token latencies (seconds) per model, and the hedging
+    deadline derived from them."""
+
+    def __init__(self, window: int = LLM_HEDGE_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def samples(self, model: str) -> List[float]:
+        with self._lock:
+            return list(self._samples.get(model, ()))
+
+    def deadline(self, model: str) -> float:
+        samples = self.samples(model)
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, percentile(samples, LLM_HEDGE_PERCENTILE))
+
+
+class HedgeStats:
+    """Per primary model: how often the backup was asked (hedge trigger rate),
+    failovers, which model won, and first-token latency percentiles of the
+    answers served.
+
+    The primary's own tail cannot be observed here (a slow call is cancelled
+    once the backup answers), so the tail-latency improvement is measured
+    against the primary alone by benchmarks/bench_hedge.py."""
+
+    def __init__(self, tracker: LatencyTracker, window: int = LLM_HEDGE_WINDOW):
+        self.tracker = tracker
+        self.window = window
+        self._lock = threading.Lock()
+        self._models: Dict[str, dict] = {}
+        self._served: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, hedge: dict, first_token_seconds: Optional[float]):
+        with self._lock:
+            counts = self._models.setdefault(model, {"requests": 0, "hedged": 0, "failovers": 0,
+                                                     "backup_wins": 0, "failed": 0})
+            counts["requests"] += 1
+            counts["hedged"] += hedge["hedged"]
+            counts["failovers"] += hedge["failover"]
+            counts["backup_wins"] += hedge["winner"] == "backup"
+            counts["failed"] += hedge["winner"] is None
+            if first_token_seconds is not None:
+                self._served.setdefault(model, deque(maxlen=self.window)).append(first_token_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = {model: (dict(counts), list(self._served.get(model, ())))
+                        for model, counts in self._models.items()}
+        models = {}
+        for model, (counts, served) in snapshot.items():
+            models[model] = {
+                **counts,
+                "hedge_rate": counts["hedged"] / counts["requests"],
+                "failover_rate": counts["failovers"] / counts["requests"],
+                "deadline_ms": self.tracker.deadline(model) * 1000,
+                "first_token_ms": {f"p{pct}": percentile(served, pct) * 1000 if served else None
+                                   for pct in (50, 95, 99)},
+            }
+        return {"enabled": LLM_HEDGING, "percentile": LLM_HEDGE_PERCENTILE, "models": models}
+
+
+first_token_latency = LatencyTracker()
+hedge_stats = HedgeStats(first_token_latency)
+
+
+async def _first_piece(pieces):
+    try:
+        return await pieces.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class HedgedLLM:
+    """A primary model backed by a second one. If the primary has produced
+    nothing by its deadline the same prompt goes to the backup too, and the
+    first to answer is streamed while the other is cancelled; if the primary
+    fails first, the backup takes over. Replies name the model that answered
+    and carry the hedge details in response_metadata["hedge"]."""
+
+    def __init__(self, primary: DispatchedLLM, backup: DispatchedLLM,
+                 tracker: LatencyTracker = first_token_latency, stats: HedgeStats = hedge_stats):
+        self.primary = primary
+        self.backup = backup
+        self.tracker = tracker
+        self.stats = stats
+
+    def check_admission(self):
+        # The backup only stands in for calls the primary has already taken
+        self.primary.check_admission()
+
+    async def _race(self, prompt, stream: bool, hedge: dict):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = self.tracker.deadline(self.primary.model)
+        hedge.update(primary=self.primary.model, backup=self.backup.model, deadline_ms=deadline * 1000,
+                     hedged=False, failover=False, winner=None)
+        generators, firsts = {}, {}
+
+        def launch(role):
+            if role == "primary":
+                # No retries: a failed call goes to the backup straight away
+                generators[role] = self.primary.pieces(prompt, stream, retries=0)
+            else:
+                generators[role] = self.backup.pieces(prompt, stream)
+            firsts[asyncio.create_task(_first_piece(generators[role]))] = role
+
+        launch("primary")
+        winner, first, error = None, None, None
+        try:
+            timeout = deadline
+            while winner is None:
+                done, _ = await asyncio.wait(list(firsts), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                timeout = None
+                if not done:
+                    print(f"No first token from {self.primary.model} after {deadline:.2f}s; "
+                          f"hedging with {self.backup.model}")
+                    hedge["hedged"] = True
+                    launch("backup")
+                    continue
+                for task in sorted(done, key=lambda t: firsts[t] != "primary"):
+                    role = firsts.pop(task)
+                    try:
+                        piece = task.result()
+                    except Exception as e:
+                        print(f"Hedged {role} call to {getattr(self, role).model} failed: {e!r}")
+                        error = e
+                        if role == "primary" and "backup" not in generators:
+                            hedge["failover"] = True
+                            launch("backup")
+                        continue
+                    if winner is None:
+                        winner, first = role, piece
+                    else:
+                        firsts[task] = role
+                if winner is None and not firsts:
+                    self.stats.record(self.primary.model, hedge, None)
+                    raise error
+            first_token = loop.time() - started
+            hedge["winner"] = winner
+            hedge["first_token_ms"] = first_token * 1000
+            self.tracker.record(getattr(self, winner).model, first_token)
+            if winner == "backup" and not hedge["failover"]:
+                # All that is known is that the primary missed its deadline;
+                # recording the later, cancelled time would ratchet it upwards
+                self.tracker.record(self.primary.model, deadline)
+            self.stats.record(self.primary.model, hedge, first_token)
+        finally:
+            for task in firsts:
+                task.cancel()
+            await asyncio.gather(*firsts, return_exceptions=True)
+            for role, pieces in generators.items():
+                if role != winner:
+                    await pieces.aclose()
+
+        pieces = generators[winner]
+        try:
+            if first is not None:
+                yield first
+            async for piece in pieces:
+                yield piece
+        finally:
+            await pieces.aclose()
+
+    def _metadata(self, hedge: dict) -> dict:
+        return {"model_name": getattr(self, hedge["winner"]).model, "hedge": hedge}
+
+    async def ainvoke(self, prompt):
+        hedge = {}
+        pieces = [piece async for piece in self._race(prompt, False, hedge)]
+        return AIMessage(content="".join(pieces), response_metadata=self._metadata(hedge))
+
+    async def astream(self, prompt):
+        hedge = {}
+        pieces = self._race(prompt, True, hedge)
+        try:
+            async for piece in pieces:
+                yield AIMessageChunk(content=piece, response_metadata=self._metadata(hedge))
+        finally:
+            await pieces.aclose()
+
+
+llm_dispatcher = LLMDispatcher()
@@ -0,0 +1,192 @@
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+from db_utils import insert_application_logs_batch, get_chat_turns, get_last_application_log_id
+from context_utils import estimate_tokens
+from pydantic_models import DEFAULT_TENANT_ID
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+# A flush is triggered when this many records are buffered...
+LOG_FLUSH_BATCH_SIZE = int(os.getenv("LOG_FLUSH_BATCH_SIZE", "64"))
+# ...or when the oldest buffered record is this old (seconds)
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+# Writers block once this many records are waiting (backpressure)
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+
+
+def setup_logging(filename: str, level=logging.INFO) -> QueueListener:
+    """Route logging through a queue so file writes happen on a background thread."""
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, logging.FileHandler(filename))
+    logging.basicConfig(level=level, handlers=[QueueHandler(log_queue)])
+    listener.start()
+    return listener
+
+
+class ChatLogWriter:
+    """Buffers chat log records and writes them to application_logs from a
+    background thread, many rows per transaction."""
+
+    def __init__(self, batch_size: int = LOG_FLUSH_BATCH_SIZE, interval: float = LOG_FLUSH_INTERVAL,
+                 max_queue: int = LOG_QUEUE_MAX):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self._buffer = deque()
+        self._inflight = []
+        # Rows of the batch being written get ids above this one
+        self._inflight_after_id = None
+        self._cond = threading.Condition()
+        # One flush at a time; history reads never wait for it
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+        self.records_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.max_queue_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, session_id, user_query, gpt_response, model, route=None, tenant_id=DEFAULT_TENANT_ID):
+        """Queue a chat turn; `route` (a dict, stored as JSON) says how its answer was routed.
+
+        Blocks while max_queue records are waiting, so async callers run it
+        in a worker thread."""
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        route = json.dumps(route) if route else None
+        self.start()
+        with self._cond:
+            while len(self._buffer) >= self.max_queue:
+                self._cond.wait()
+            self._buffer.append((session_id, user_query, gpt_response, model, created_at, route, tenant_id))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._buffer))
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def history(self, session_id, max_turns=None, max_tokens=None, tenant_id=DEFAULT_TENANT_ID):
+        """The session's written turns plus its records that are not written
+        yet, as messages, oldest first: at most the newest max_turns turns,
+        and of those the newest that fit in max_tokens."""
+        while True:
+            with self._cond:
+                written = self.records_written
+            rows = get_chat_turns(session_id, max_turns=max_turns, tenant_id=tenant_id)
+            with self._cond:
+                if self.records_written != written:
+                    # A batch was committed meanwhile and may be in neither the rows nor the buffer
+                    continue
+                pending = list(self._buffer)
+                # The batch being written is in the rows already if its commit came first
+                newest_id = max((row[0] for row in rows), default=0)
+                if self._inflight_after_id is None or newest_id <= self._inflight_after_id:
+                    pending = self._inflight + pending
+            break
+        turns = [(user_query, gpt_response) for _, user_query, gpt_response in rows]
+        turns += [(r[1], r[2]) for r in pending if r[0] == session_id and r[6] == tenant_id]
+        if max_turns is not None:
+            turns = turns[-max_turns:]
+        if max_tokens is not None:
+            kept = []
+            used = 0
+            for user_query, gpt_response in reversed(turns):
+                used += estimate_tokens(user_query) + estimate_tokens(gpt_response)
+                if used > max_tokens:
+                    break
+                kept.append((user_query, gpt_response))
+            turns = kept[::-1]
+        messages = []
+        for user_query, gpt_response in turns:
+            messages.extend([
+                {"role": "human", "content": user_query},
+                {"role": "ai", "content": gpt_response}
+            ])
+        return messages
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval
+                while len(self._buffer) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._buffer:
+                    if self._stopping:
+                        return
+                    continue
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            if not self._buffer:
+                return
+            start = time.perf_counter()
+            try:
+                after_id = get_last_application_log_id()
+                with self._cond:
+                    self._inflight = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.batch_size))]
+                    self._inflight_after_id = after_id
+                    self._cond.notify_all()
+                insert_application_logs_batch(self._inflight)
+            except Exception as e:
+                self.failed_flushes += 1
+                logging.error(f"Chat log flush of {len(self._inflight)} records failed: {e}")
+                with self._cond:
+                    self._buffer.extendleft(reversed(self._inflight))
+                    self._inflight = []
+                    self._inflight_after_id = None
+                time.sleep(self.interval)
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self.records_written += len(self._inflight)
+                self._inflight = []
+                self._inflight_after_id = None
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    def stop(self, timeout: float = 10.0):
+        """Drain everything that is buffered, then stop the background thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        for _ in range(3):
+            if not self._buffer:
+                break
+            self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._buffer),
+            "max_queue_depth": self.max_queue_depth,
+            "records_written": self.records_written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "avg_batch_size": self.records_written / self.flushes if self.flushes else 0.0,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": self._total_flush_ms / self.flushes if self.flushes else 0.0,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+
+chat_log_writer = ChatLogWriter()
@@ -1,98 +1,518 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from pydantic_models import QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest
-from langchain_utils import get_rag_chain
+from fastapi import FastAPI, File, Form, Query, Request, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager, contextmanager
+from pydantic_models import (
+    QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest, IngestionJobStatus, IngestionBatchStatus,
+    AnswerSource, ModelName, DEFAULT_TENANT_ID, TENANT_ID_PATTERN
+)
+from langchain_utils import get_rag_chain, aclose_llm_clients, routing_stats, answer_cache, llm_clients_ready
 
 from db_utils import (
-    insert_application_logs,
-    get_chat_history,
     get_all_documents,
     insert_document_record,
-    delete_document_record
+    get_document_record,
+    get_document_by_sha256,
+    update_document_record,
+    delete_document_record,
+    get_ingestion_job,
+    get_latest_ingestion_job,
+    get_ingestion_jobs_by_batch,
+    init_db,
+    db_ready
+)
+from chroma_utils import (
+    update_document_in_chroma, delete_doc_from_chroma, embedding_function, retrieval_cache,
+    embedder_status, warm_up_retrieval, vectorstore_ready, bm25_ready, tenant_store_stats
+)
+from log_utils import setup_logging, chat_log_writer
+from search_utils import web_search_client
+from llm_utils import LLMOverloadedError, llm_dispatcher, hedge_stats
+from ingestion_utils import (
+    new_job_id,
+    save_upload,
+    UploadTooLargeError,
+    MAX_UPLOAD_BYTES,
+    submit_ingestion_job,
+    submit_bulk_ingestion,
+    start_ingestion,
+    resume_ingestion_jobs,
+    shutdown_ingestion
 )
-from chroma_utils import index_document_to_chroma, delete_doc_from_chroma
+from collections import Counter
+from typing import List
 import os
 import uuid
+import json
 import logging
-import shutil
+import threading
+import time
+import zipfile
 import uvicorn
 
-logging.basicConfig(filename='app.log', level=logging.INFO)
+# app.log is written by a background listener, not on the request path
+log_listener = setup_logging('app.log')
+
+# How much chat history is loaded for each /chat turn
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "4"))
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "0")) or None
+
+# Heavy components (vector store, BM25 index, embedding model, LLM clients)
+# are created on first use. With warm-up on, a background thread creates
+# them right after startup and /healthz reports ready once it is done.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+warmup_state = {"started_at": None, "finished_at": None, "error": None}
+
+
+def warm_up():
+    warmup_state["started_at"] = time.time()
+    try:
+        warm_up_retrieval()
+        for model in ModelName:
+            get_rag_chain(model.value)
+    except Exception as e:
+        warmup_state["error"] = str(e)
+        logging.error(f"Warm-up failed: {e}")
+    finally:
+        warmup_state["finished_at"] = time.time()
+    logging.info(f"Warm-up finished in {warmup_state['finished_at'] - warmup_state['started_at']:.2f}s")
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    chat_log_writer.start()
+    start_ingestion()
+    resume_ingestion_jobs()
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    shutdown_ingestion()
+    await aclose_llm_clients()
+    chat_log_writer.stop()
+    log_listener.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded(request: Request, exc: LLMOverloadedError):
+    """Fail fast when a model is saturated instead of queueing the request
+    until the LLM gateway times out."""
+    logging.warning(str(exc))
+    return JSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": str(exc.retry_after)})
 
 
 @app.post("/chat", response_model=QueryResponse)
-def chat(query_input: QueryInput):
+async def chat(query_input: QueryInput):
     session_id = query_input.session_id or str(uuid.uuid4())
     logging.info(
-        f"Session ID: {session_id}, User Query: {query_input.question}, Model: {query_input.model.value}"
+        f"Session ID: {session_id}, User Query: {query_input.question}, Model: {query_input.model.value}, "
+        f"Tenant: {query_input.tenant_id}"
     )
+    # A saturated model is turned away by the chain (429), once it is clear
+    # the question is neither a greeting nor a cached answer
 
-    chat_history = get_chat_history(session_id)
+    chat_history = await run_in_threadpool(
+        chat_log_writer.history, session_id, max_turns=CHAT_HISTORY_TURNS, max_tokens=CHAT_HISTORY_MAX_TOKENS,
+        tenant_id=query_input.tenant_id
+    )
     rag_chain = get_rag_chain(query_input.model.value)
 
-    result = rag_chain.invoke({
+    result = await rag_chain.ainvoke({
         "input": query_input.question,
-        "chat_history": chat_history
+        "chat_history": chat_history,
+        "tenant_id": query_input.tenant_id
     })
 
     answer = result["answer"]
 
-    insert_application_logs(session_id, query_input.question, answer, query_input.model.value)
+    route = routing_record(result)
+    # submit() blocks while the writer is behind (backpressure); keep that off the event loop
+    await run_in_threadpool(chat_log_writer.submit, session_id, query_input.question, answer,
+                            query_input.model.value, route, query_input.tenant_id)
     logging.info(f"Session ID: {session_id}, AI Response: {answer}")
+    if route:
+        logging.info(f"Session ID: {session_id}, Route: {route}")
 
     return QueryResponse(
         answer=answer,
         session_id=session_id,
-        model=query_input.model
+        model=query_input.model,
+        source=result.get("source", AnswerSource.LLM),
+        cached=result.get("cached", False),
+        answered_by=result.get("model")
     )
 
 
-@app.post("/upload-doc")
-def upload_and_index_document(file: UploadFile = File(...)):
-    allowed_extensions = ['.pdf', '.docx', '.html']
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    if file_extension not in allowed_extensions:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type. Allowed types are: {', '.join(allowed_extensions)}"
-        )
+def routing_record(done: dict) -> dict:
+    """How an answer was routed, as stored with its chat log row: the
+    speculative routing timings, the relevance gate's scores and decision,
+    and whether a backup model was asked."""
+    return {key: done[key] for key in ("route", "retrieval", "hedge") if key in done}
+
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(query_input: QueryInput):
+    """Same as /chat, but answer tokens are sent as server-sent events while
+    they are generated: "start", "source", "token"... then "done"."""
+    session_id = query_input.session_id or str(uuid.uuid4())
+    logging.info(
+        f"Session ID: {session_id}, User Query: {query_input.question}, Model: {query_input.model.value}, "
+        f"Tenant: {query_input.tenant_id}"
+    )
+    chat_history = await run_in_threadpool(
+        chat_log_writer.history, session_id, max_turns=CHAT_HISTORY_TURNS, max_tokens=CHAT_HISTORY_MAX_TOKENS,
+        tenant_id=query_input.tenant_id
+    )
+    rag_chain = get_rag_chain(query_input.model.value)
+
+    async def events():
+        yield sse_event({"type": "start", "session_id": session_id, "model": query_input.model.value})
+        try:
+            async for event in rag_chain.astream({
+                "input": query_input.question,
+                "chat_history": chat_history,
+                "tenant_id": query_input.tenant_id
+            }):
+                if event["type"] == "done":
+                    answer = event["answer"]
+                    route = routing_record(event)
+                    await run_in_threadpool(chat_log_writer.submit, session_id, query_input.question, answer,
+                                            query_input.model.value, route, query_input.tenant_id)
+                    logging.info(f"Session ID: {session_id}, AI Response: {answer}")
+                    if route:
+                        logging.info(f"Session ID: {session_id}, Route: {route}")
+                yield sse_event(event)
+        except LLMOverloadedError as e:
+            logging.warning(f"Session ID: {session_id}, {e}")
+            yield sse_event({"type": "error", "detail": str(e), "status": 429, "retry_after": e.retry_after})
+        except Exception as e:
+            logging.error(f"Session ID: {session_id}, streaming failed: {e}")
+            yield sse_event({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+ALLOWED_EXTENSIONS = ['.pdf', '.docx', '.html']
+# Documents per /upload-docs request, counting the members of zip archives
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "1000"))
+
+
+def extension_error(filename: str):
+    file_extension = os.path.splitext(filename)[1].lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        return f"Unsupported file type. Allowed types are: {', '.join(ALLOWED_EXTENSIONS)}"
+    return None
+
+
+def validate_extension(filename: str):
+    error = extension_error(filename)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=error)
+
+
+def spool_upload(file: UploadFile):
+    try:
+        return save_upload(file.file, file.filename)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+# Serializes the duplicate check with the insert of a new document row, and
+# document_change() checks with marking a document busy
+upload_lock = threading.Lock()
+# Documents whose ingestion job is not recorded yet, or that are being
+# re-indexed or deleted
+busy_file_ids = set()
+
+
+def tenant_document(file_id: int, tenant_id: str):
+    """The document record, or 404 if it does not exist for this tenant."""
+    document = get_document_record(file_id)
+    if document is None or document["tenant_id"] != tenant_id:
+        raise HTTPException(status_code=404, detail=f"Document with file_id {file_id} not found.")
+    return document
+
 
-    temp_file_path = f"temp_{file.filename}"
+def unfinished_job_id(file_id: int):
+    """The id of the job still indexing a document, if any; a duplicate upload
+    reports it so the caller can follow that job (and upload again should it
+    fail, since a failed job drops its document record)."""
+    job = get_latest_ingestion_job(file_id)
+    if job is not None and job["status"] in ("queued", "running"):
+        return job["id"]
+    return None
+
+
+@contextmanager
+def document_change(file_id: int):
+    """Run a change to an indexed document, or answer 409 while its ingestion
+    job (which may still write chunks) or another change is unfinished."""
+    with upload_lock:
+        job_id = unfinished_job_id(file_id)
+        if job_id is not None or file_id in busy_file_ids:
+            detail = f"Document with file_id {file_id} is still being indexed or changed; try again later."
+            raise HTTPException(status_code=409, detail=detail)
+        busy_file_ids.add(file_id)
     try:
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        yield
+    finally:
+        with upload_lock:
+            busy_file_ids.discard(file_id)
+
+
+@app.post("/upload-doc", status_code=202)
+def upload_and_index_document(file: UploadFile = File(...),
+                              tenant_id: str = Form(DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)):
+    validate_extension(file.filename)
+    upload_path, content_sha256, _ = spool_upload(file)
 
-        file_id = insert_document_record(file.filename)
-        success = index_document_to_chroma(temp_file_path, file_id)
+    with upload_lock:
+        existing = get_document_by_sha256(content_sha256, tenant_id)
+        if existing is None:
+            file_id = insert_document_record(file.filename, content_sha256, tenant_id)
+            busy_file_ids.add(file_id)
 
-        if success:
+    if existing is not None:
+        os.remove(upload_path)
+        job_id = unfinished_job_id(existing["id"])
+        state = "still being indexed" if job_id else "already indexed"
+        return {
+            "message": f"File {file.filename} is identical to {existing['filename']}, which is {state}.",
+            "file_id": existing["id"],
+            "job_id": job_id,
+            "status": "duplicate"
+        }
+
+    job_id = new_job_id()
+    try:
+        submit_ingestion_job(job_id, file_id, file.filename, upload_path, tenant_id)
+    finally:
+        with upload_lock:
+            busy_file_ids.discard(file_id)
+    return {
+        "message": f"File {file.filename} has been uploaded and queued for indexing.",
+        "file_id": file_id,
+        "job_id": job_id,
+        "status": "queued"
+    }
+
+
+def expand_uploads(files: List[UploadFile]):
+    """Yield (filename, stream, error) for every uploaded document; zip
+    archives are replaced by their members (nested archives are not opened)."""
+    for file in files:
+        if os.path.splitext(file.filename)[1].lower() != ".zip":
+            yield file.filename, file.file, None
+            continue
+        try:
+            archive = zipfile.ZipFile(file.file)
+        except zipfile.BadZipFile:
+            yield file.filename, None, "Not a valid zip archive."
+            continue
+        with archive:
+            for member in archive.infolist():
+                name = os.path.basename(member.filename)
+                if member.is_dir() or not name or name.startswith(".") or member.filename.startswith("__MACOSX/"):
+                    continue
+                if member.file_size > MAX_UPLOAD_BYTES:
+                    # save_upload() enforces the limit as well, whatever the archive claims
+                    yield name, None, f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit."
+                    continue
+                with archive.open(member) as source:
+                    yield name, source, None
+
+
+@app.post("/upload-docs", status_code=202)
+def upload_documents(files: List[UploadFile] = File(...),
+                     tenant_id: str = Form(DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)):
+    """Bulk upload of several documents and/or zip archives of documents.
+
+    Every document gets its own result (queued, duplicate or rejected) and,
+    when queued, its own ingestion job; the jobs of one request share a
+    batch_id that /batches/{batch_id} reports on."""
+    results = []
+    accepted = []
+    try:
+        for filename, source, error in expand_uploads(files):
+            result = {"filename": filename, "status": "rejected", "file_id": None, "job_id": None, "error": error}
+            results.append(result)
+            if error is not None:
+                continue
+            if len(results) > BULK_MAX_FILES:
+                result["error"] = f"A bulk upload is limited to {BULK_MAX_FILES} documents."
+                continue
+            result["error"] = extension_error(filename)
+            if result["error"] is not None:
+                continue
+            try:
+                upload_path, content_sha256, size = save_upload(source, filename)
+            except (UploadTooLargeError, zipfile.BadZipFile) as e:
+                result["error"] = str(e)
+                continue
+
+            with upload_lock:
+                existing = get_document_by_sha256(content_sha256, tenant_id)
+                if existing is None:
+                    file_id = insert_document_record(filename, content_sha256, tenant_id)
+                    busy_file_ids.add(file_id)
+
+            if existing is not None:
+                os.remove(upload_path)
+                result.update(status="duplicate", file_id=existing["id"], job_id=unfinished_job_id(existing["id"]))
+                continue
+            result.update(status="queued", file_id=file_id, job_id=new_job_id())
+            accepted.append((result["job_id"], file_id, filename, upload_path, size))
+
+        batch_id = None
+        if accepted:
+            batch_id = new_job_id()
+            submit_bulk_ingestion(batch_id, accepted, tenant_id)
+    finally:
+        with upload_lock:
+            busy_file_ids.difference_update(file_id for _, file_id, _, _, _ in accepted)
+    counts = Counter(result["status"] for result in results)
+    return {
+        "message": f"{counts['queued']} of {len(results)} files queued for indexing.",
+        "batch_id": batch_id,
+        "queued": counts["queued"],
+        "duplicate": counts["duplicate"],
+        "rejected": counts["rejected"],
+        "files": results
+    }
+
+
+@app.get("/batches/{batch_id}", response_model=IngestionBatchStatus)
+def get_batch_status(batch_id: str, tenant_id: str = Query(DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)):
+    # Another tenant's batch is reported as missing, like its documents
+    jobs = get_ingestion_jobs_by_batch(batch_id, tenant_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found.")
+    return {
+        "batch_id": batch_id,
+        "tenant_id": tenant_id,
+        "counts": Counter(job["status"] for job in jobs),
+        "jobs": jobs
+    }
+
+
+@app.get("/jobs/{job_id}", response_model=IngestionJobStatus)
+def get_job_status(job_id: str, tenant_id: str = Query(DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)):
+    job = get_ingestion_job(job_id, tenant_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+
+@app.put("/docs/{file_id}")
+def update_document(file_id: int, file: UploadFile = File(...),
+                    tenant_id: str = Form(DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)):
+    tenant_document(file_id, tenant_id)
+    validate_extension(file.filename)
+
+    temp_file_path, content_sha256, _ = spool_upload(file)
+    try:
+        with document_change(file_id):
+            # Read again: the document may have changed while the upload was spooled
+            document = tenant_document(file_id, tenant_id)
+            if content_sha256 == document["content_sha256"]:
+                return {
+                    "message": f"File {file.filename} is unchanged.",
+                    "file_id": file_id,
+                    "added": 0,
+                    "deleted": 0,
+                    "unchanged": None
+                }
+
+            diff = update_document_in_chroma(temp_file_path, file_id, tenant_id)
+            if diff is None:
+                raise HTTPException(status_code=500, detail=f"Failed to re-index {file.filename}.")
+
+            update_document_record(file_id, file.filename, content_sha256)
             return {
-                "message": f"File {file.filename} has been successfully uploaded and indexed.",
-                "file_id": file_id
+                "message": f"File {file.filename} has been re-indexed.",
+                "file_id": file_id,
+                **diff
             }
-        else:
-            delete_document_record(file_id)
-            raise HTTPException(status_code=500, detail=f"Failed to index {file.filename}.")
     finally:
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
 
 
 @app.get("/list-docs", response_model=list[DocumentInfo])
-def list_documents():
-    return get_all_documents()
+def list_documents(tenant_id: str = Query(DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)):
+    return get_all_documents(tenant_id)
 
 
 @app.post("/delete-doc")
 def delete_document(request: DeleteFileRequest):
-    chroma_delete_success = delete_doc_from_chroma(request.file_id)
-    if chroma_delete_success:
-        db_delete_success = delete_document_record(request.file_id)
-        if db_delete_success:
-            return {"message": f"Successfully deleted document with file_id {request.file_id} from the system."}
-        return {"error": f"Deleted from Chroma but failed to delete document with file_id {request.file_id} from the database."}
-    return {"error": f"Failed to delete document with file_id {request.file_id} from Chroma."}
+    document = get_document_record(request.file_id)
+    if document is not None and document["tenant_id"] != request.tenant_id:
+        raise HTTPException(status_code=404, detail=f"Document with file_id {request.file_id} not found.")
+    with document_change(request.file_id):
+        chroma_delete_success = delete_doc_from_chroma(request.file_id, request.tenant_id)
+        if chroma_delete_success:
+            db_delete_success = delete_document_record(request.file_id)
+            if db_delete_success:
+                return {"message": f"Successfully deleted document with file_id {request.file_id} from the system."}
+            return {"error": f"Deleted from Chroma but failed to delete document with file_id {request.file_id} from the database."}
+        return {"error": f"Failed to delete document with file_id {request.file_id} from Chroma."}
+
+
+@app.get("/metrics")
+def get_metrics():
+    return {
+        "chat_log_writer": chat_log_writer.stats(),
+        "embedding_cache": embedding_function.stats(),
+        "embedder": embedder_status(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "tenant_stores": tenant_store_stats(),
+        "routing": routing_stats.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "web_search": web_search_client.stats(),
+        "llm_dispatch": llm_dispatcher.stats(),
+        "llm_hedging": hedge_stats.stats(),
+    }
+
+
+@app.get("/healthz")
+def healthz():
+    """Readiness probe: 200 once the heavy components are warm (or, with
+    warm-up off, once the database is), 503 while starting up."""
+    embedder = embedder_status()
+    components = {
+        "database": db_ready(),
+        "vectorstore": vectorstore_ready(),
+        "bm25_index": bm25_ready(),
+        "embedder": embedder["loaded"],
+        "llm_clients": llm_clients_ready(),
+    }
+    if WARMUP_ON_STARTUP:
+        ready = warmup_state["finished_at"] is not None and warmup_state["error"] is None
+    else:
+        ready = components["database"]
+    ready = ready and not embedder["mismatch"]
+    warmup_seconds = None
+    if warmup_state["finished_at"] is not None:
+        warmup_seconds = warmup_state["finished_at"] - warmup_state["started_at"]
+    body = {
+        "status": "ready" if ready else "starting",
+        "components": components,
+        "warmup": {"enabled": WARMUP_ON_STARTUP, "seconds": warmup_seconds, "error": warmup_state["error"]},
+        "embedder_mismatch": embedder["mismatch"],
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import datetime
+from typing import Dict, List, Optional
+
+# Tenants (or workspaces) each get their own Chroma collection and document
+# list; requests without a tenant_id use the default one. Ids become part of
+# a collection name, hence the restricted alphabet.
+DEFAULT_TENANT_ID = "default"
+TENANT_ID_PATTERN = r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$"
 
 
 class ModelName(str, Enum):
@@ -9,6 +16,20 @@ class ModelName(str, Enum):
     DEEPSEEK_R1 = "deepseek/deepseek-r1-0528:free"
     MISTRAL_SMALL = "mistralai/mistral-small-3.1-24b-instruct:free"
 
+    @property
+    def prompt_token_budget(self) -> int:
+        """Tokens of instructions, history and retrieved context sent per prompt."""
+        return PROMPT_TOKEN_BUDGETS[self]
+
+
+# Well inside each context window; small models answer better (and faster) on shorter prompts
+PROMPT_TOKEN_BUDGETS = {
+    ModelName.NEMOTRON_NANO: 6000,
+    ModelName.QWEN3_4B: 3000,
+    ModelName.DEEPSEEK_R1: 8000,
+    ModelName.MISTRAL_SMALL: 8000,
+}
+
 
 class AnswerSource(str, Enum):
     DOCUMENT = "document"
@@ -21,6 +42,7 @@ class QueryInput(BaseModel):
     question: str
     session_id: str = Field(default=None)
     model: ModelName = Field(default=ModelName.NEMOTRON_NANO)
+    tenant_id: str = Field(default=DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)
 
 
 class QueryResponse(BaseModel):
@@ -28,6 +50,10 @@ class QueryResponse(BaseModel):
     session_id: str
     model: ModelName
     source: AnswerSource = Field(default=AnswerSource.LLM)
+    cached: bool = False
+    # Model that produced the answer: `model`, or its backup when hedging
+    # or failover kicked in (None for greetings and cached answers)
+    answered_by: Optional[str] = None
 
 
 class DocumentInfo(BaseModel):
@@ -36,5 +62,36 @@ class DocumentInfo(BaseModel):
     upload_timestamp: datetime
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class IngestionJobStatus(BaseModel):
+    id: str
+    file_id: int
+    filename: str
+    tenant_id: str = DEFAULT_TENANT_ID
+    batch_id: Optional[str] = None
+    status: JobStatus
+    pages_parsed: int = 0
+    chunks_embedded: int = 0
+    chunks_written: int = 0
+    error: Optional[str] = None
+    peak_rss_bytes: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class IngestionBatchStatus(BaseModel):
+    batch_id: str
+    tenant_id: str = DEFAULT_TENANT_ID
+    counts: Dict[str, int]
+    jobs: List[IngestionJobStatus]
+
+
 class DeleteFileRequest(BaseModel):
-    file_id: int
\ No newline at end of file
+    file_id: int
+    tenant_id: str = Field(default=DEFAULT_TENANT_ID, pattern=TENANT_ID_PATTERN)
\ No newline at end of file
@@ -0,0 +1,158 @@
+from concurrent.futures import Future
+from typing import Callable, Dict
+from cache_utils import LRUCache, normalize_question
+import os
+import threading
+import time
+
+# Which search provider web_search uses: "serpapi" (needs SERPAPI_API_KEY) or
+# "stub" (local canned results, for tests and benchmarks)
+WEB_SEARCH_PROVIDER = os.getenv("WEB_SEARCH_PROVIDER", "serpapi")
+# Results are reused for this many seconds (0 disables the cache; identical
+# searches in flight at the same time are still coalesced)
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "300"))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "1000"))
+# Simulated latency (seconds) of the stub provider
+WEB_SEARCH_STUB_LATENCY = float(os.getenv("WEB_SEARCH_STUB_LATENCY", "0"))
+
+
+class SerpAPIProvider:
+    """Google results through SerpAPI. The wrapper (and the serpapi client
+    behind it) is created on the first search and reused."""
+
+    name = "serpapi"
+
+    def __init__(self):
+        self._wrapper = None
+        self._lock = threading.Lock()
+
+    def search(self, query: str) -> str:
+        with self._lock:
+            if self._wrapper is None:
+                from langchain_community.utilities import SerpAPIWrapper
+
+                self._wrapper = SerpAPIWrapper()
+        result = self._wrapper.run(query)
+        # SerpAPIWrapper can return non-string results in some setups
+        return result if isinstance(result, str) else str(result)
+
+
+class StubSearchProvider:
+    """Offline provider returning canned results after a fixed delay."""
+
+    name = "stub"
+
+    def __init__(self, latency: float = WEB_SEARCH_STUB_LATENCY):
+        self.latency = latency
+        self.calls = 0
+
+    def search(self, query: str) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return f"Stub web results for '{query}': nothing live is known offline."
+
+
+SEARCH_PROVIDERS: Dict[str, Callable[[], object]] = {
+    "serpapi": SerpAPIProvider,
+    "stub": StubSearchProvider,
+}
+
+
+def register_search_provider(name: str, factory: Callable[[], object]):
+    """Make another provider selectable with WEB_SEARCH_PROVIDER=name. The
+    factory returns an object with a search(query) -> str method."""
+    SEARCH_PROVIDERS[name] = factory
+
+
+def create_search_provider(name: str = None):
+    name = name or WEB_SEARCH_PROVIDER
+    if name not in SEARCH_PROVIDERS:
+        raise ValueError(f"Unknown WEB_SEARCH_PROVIDER {name!r}; choose from {', '.join(SEARCH_PROVIDERS)}")
+    return SEARCH_PROVIDERS[name]()
+
+
+class CoalescingSearch:
+    """TTL cache and single-flight in front of a search provider.
+
+    Results are keyed by the normalized query. While a query is being
+    fetched, identical queries wait for that fetch instead of starting their
+    own; errors are passed to every waiter and not cached."""
+
+    def __init__(self, provider, ttl: float = WEB_SEARCH_CACHE_TTL,
+                 max_entries: int = WEB_SEARCH_CACHE_MAX_ENTRIES):
+        self.provider = provider
+        self.ttl = ttl
+        self.cache = LRUCache(max_entries)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self._upstream_ms = 0.0
+        self._upstream_done = 0
+
+    def search(self, query: str) -> str:
+        key = normalize_question(query)
+        with self._lock:
+            self.requests += 1
+            cached = self.cache.get(key)
+            if cached is not None:
+                expires_at, result = cached
+                if expires_at > time.monotonic():
+                    self.hits += 1
+                    return result
+                self.cache.pop(key)
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.upstream_calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        start = time.perf_counter()
+        try:
+            result = self.provider.search(query)
+        except BaseException as e:
+            with self._lock:
+                self.upstream_errors += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._upstream_ms += (time.perf_counter() - start) * 1000
+            self._upstream_done += 1
+            if self.ttl > 0:
+                self.cache.put(key, (time.monotonic() + self.ttl, result))
+            del self._inflight[key]
+        future.set_result(result)
+        return result
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            avoided = self.hits + self.coalesced
+            return {
+                "provider": getattr(self.provider, "name", type(self.provider).__name__),
+                "ttl_seconds": self.ttl,
+                "entries": len(self.cache),
+                "requests": self.requests,
+                "cache_hits": self.hits,
+                "coalesced": self.coalesced,
+                "hit_ratio": avoided / self.requests if self.requests else 0.0,
+                "upstream_calls": self.upstream_calls,
+                "upstream_calls_avoided": avoided,
+                "upstream_errors": self.upstream_errors,
+                "avg_upstream_ms": self._upstream_ms / self._upstream_done if self._upstream_done else 0.0,
+            }
+
+
+web_search_client = CoalescingSearch(create_search_provider())
@@ -0,0 +1,127 @@
+"""Benchmark ingesting many small documents: one /upload-doc request (and one
+ingestion job) per file versus a single /upload-docs bulk request, optionally
+as a zip archive. Reports wall time until every file is indexed and the
+number of Chroma writes (corpus generation bumps) each approach needed.
+
+    python benchmarks/bench_bulk.py --files 200 --paragraphs 8 --workers 2
+"""
+import argparse
+import io
+import os
+import sqlite3
+import time
+import zipfile
+
+from common import use_scratch_dir, start_backend, free_port, report
+from corpus import make_docx
+
+
+def make_documents(count, paragraphs):
+    return [(f"doc-{i}.docx", make_docx([f"Document {i} section {j} covers topic-{i}-{j} in detail. " * 12
+                                         for j in range(paragraphs)]))
+            for i in range(count)]
+
+
+def make_zip(documents):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in documents:
+            archive.writestr(f"docs/{name}", data)
+    return buffer.getvalue()
+
+
+def wait_for(client, paths, timeout):
+    """Poll job or batch status URLs until none is queued or running."""
+    deadline = time.time() + timeout
+    pending = list(paths)
+    while pending and time.time() < deadline:
+        still = []
+        for path in pending:
+            body = client.get(path).json()
+            statuses = [job["status"] for job in body["jobs"]] if "jobs" in body else [body["status"]]
+            if any(status in ("queued", "running") for status in statuses):
+                still.append(path)
+        pending = still
+        if pending:
+            time.sleep(0.1)
+    if pending:
+        raise RuntimeError(f"{len(pending)} ingestion jobs did not finish within {timeout}s")
+
+
+def chroma_writes(db_path):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT SUM(generation) FROM corpus_generations").fetchone()
+    conn.close()
+    return row[0] or 0
+
+
+def run(mode, documents, env, timeout):
+    import httpx
+
+    scratch = use_scratch_dir(prefix=f"documind-bench-bulk-{mode}-")
+    port = free_port()
+    backend = start_backend(port, env=env)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+            start = time.perf_counter()
+            if mode == "single":
+                paths = []
+                for name, data in documents:
+                    response = client.post("/upload-doc", files={"file": (name, data)})
+                    response.raise_for_status()
+                    paths.append(f"/jobs/{response.json()['job_id']}")
+                requests = len(documents)
+            else:
+                if mode == "bulk_zip":
+                    files = [("files", ("documents.zip", make_zip(documents)))]
+                else:
+                    files = [("files", (name, data)) for name, data in documents]
+                response = client.post("/upload-docs", files=files)
+                response.raise_for_status()
+                paths = [f"/batches/{response.json()['batch_id']}"]
+                requests = 1
+            upload_s = time.perf_counter() - start
+            wait_for(client, paths, timeout)
+            total_s = time.perf_counter() - start
+            chunks = 0
+            for path in paths:
+                body = client.get(path).json()
+                chunks += sum(job["chunks_written"] for job in body.get("jobs", [body]))
+    finally:
+        backend.terminate()
+        backend.wait()
+    return {
+        "requests": requests,
+        "upload_s": upload_s,
+        "total_s": total_s,
+        "files_per_sec": len(documents) / total_s,
+        "chunks": chunks,
+        "chroma_writes": chroma_writes(os.path.join(scratch, "rag_app.db")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--modes", default="single,bulk,bulk_zip")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    documents = make_documents(args.files, args.paragraphs)
+    env = {
+        "WARMUP_ON_STARTUP": "false",
+        "OPENROUTER_API_KEY": os.getenv("OPENROUTER_API_KEY", "bench"),
+        "INGESTION_WORKERS": str(args.workers),
+    }
+    results = {"files": args.files, "paragraphs": args.paragraphs, "workers": args.workers,
+               "bytes": sum(len(data) for _, data in documents)}
+    for mode in args.modes.split(","):
+        results[mode] = run(mode, documents, env, args.timeout)
+    report("bulk", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
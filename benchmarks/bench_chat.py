@@ -0,0 +1,88 @@
+"""Load test /chat against a local OpenAI-compatible stub: p50/p99 latency
+and requests/sec, with cached long-lived LLM clients versus a fresh client
+per request (the previous behaviour). The stub and the backend run as
+separate processes.
+
+    python benchmarks/bench_chat.py --requests 400 --concurrency 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import time
+
+from common import use_scratch_dir, start_stub_llm, start_backend, free_port, percentile, report
+
+
+async def run_load(url, total, concurrency, question="Tell me about topic {i}"):
+    import httpx
+
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=180, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json={"question": question.format(i=i % 20),
+                                                             "session_id": f"bench-{i % 100}"})
+                    ok = response.status_code == 200
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "requests_per_sec": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def measure_backend(stub_url, total, concurrency, extra_args=()):
+    port = free_port()
+    # The answer cache would serve the repeated questions without the LLM
+    env = {"OPENROUTER_API_BASE": stub_url, "OPENROUTER_API_KEY": "stub", "ANSWER_CACHE_ENABLED": "false"}
+    backend = start_backend(port, env=env, extra_args=extra_args)
+    try:
+        url = f"http://127.0.0.1:{port}/chat"
+        asyncio.run(run_load(url, concurrency, concurrency))  # warm-up
+        return asyncio.run(run_load(url, total, concurrency))
+    finally:
+        backend.terminate()
+        backend.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    stub_port = free_port()
+    stub = start_stub_llm(stub_port, latency=args.latency)
+    stub_url = f"http://127.0.0.1:{stub_port}/v1"
+    try:
+        results = {"stub_latency_s": args.latency, "concurrency": args.concurrency}
+        results["cached_clients"] = measure_backend(stub_url, args.requests, args.concurrency)
+        results["fresh_client_per_request"] = measure_backend(stub_url, args.requests, args.concurrency,
+                                                              ["--fresh-clients"])
+    finally:
+        stub.terminate()
+    report("chat", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
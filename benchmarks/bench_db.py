@@ -0,0 +1,113 @@
+"""Benchmark chat-log inserts/sec and history reads/sec under N concurrent
+writers, comparing the original connect-per-call SQLite access with the
+pooled WAL layer in db_utils.
+
+    python benchmarks/bench_db.py --writers 8 --readers 4 --seconds 5
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from common import use_scratch_dir, report
+
+
+def legacy_insert(db_name, session_id, user_query, gpt_response, model):
+    conn = sqlite3.connect(db_name)
+    conn.execute(
+        'INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
+        (session_id, user_query, gpt_response, model)
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_history(db_name, session_id):
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        'SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at',
+        (session_id,)
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def run_load(insert, history, writers, readers, seconds):
+    stop = time.perf_counter() + seconds
+    counts = {"inserts": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def writer(n):
+        done = errors = 0
+        while time.perf_counter() < stop:
+            try:
+                insert(f"session-{n % 50}", "What does the manual say about pumps?", "The answer. " * 20, "bench")
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+        with lock:
+            counts["inserts"] += done
+            counts["errors"] += errors
+
+    def reader(n):
+        done = errors = 0
+        while time.perf_counter() < stop:
+            try:
+                history(f"session-{n % 50}")
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+        with lock:
+            counts["reads"] += done
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {
+        "inserts_per_sec": counts["inserts"] / seconds,
+        "reads_per_sec": counts["reads"] / seconds,
+        "locked_errors": counts["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    import db_utils
+
+    results = {"writers": args.writers, "readers": args.readers, "seconds": args.seconds}
+
+    legacy_db = os.path.abspath("legacy.db")
+    conn = sqlite3.connect(legacy_db)
+    conn.execute('''CREATE TABLE application_logs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, user_query TEXT,
+                     gpt_response TEXT, model TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.close()
+    results["legacy"] = run_load(
+        lambda *a: legacy_insert(legacy_db, *a),
+        lambda s: legacy_history(legacy_db, s),
+        args.writers, args.readers, args.seconds
+    )
+
+    results["pooled"] = run_load(
+        db_utils.insert_application_logs,
+        db_utils.get_chat_history,
+        args.writers, args.readers, args.seconds
+    )
+    report("db", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Burst test of per-model LLM admission control. A burst of /chat requests,
+some asking the same question, hits a stub model that rate-limits (HTTP 429)
+beyond a few concurrent calls, the way OpenRouter free-tier models do.
+
+Compared: effectively unbounded dispatch (every request goes upstream at
+once and retries on its own), the dispatcher capped at the stub's limit,
+and the same with a short queue that sheds the excess with fast 429s.
+Reports answered/failed/rejected requests, latency, upstream calls and
+rate-limit hits, and the dispatcher's per-model queue metrics.
+
+    python benchmarks/bench_dispatch.py --requests 200 --distinct 50 --stub-limit 4
+"""
+import argparse
+import asyncio
+import time
+
+from common import use_scratch_dir, start_stub_llm, start_backend, free_port, percentile, report
+
+
+async def burst(url, total, distinct):
+    import httpx
+
+    outcomes = []
+    async with httpx.AsyncClient(timeout=300, limits=httpx.Limits(max_connections=total)) as client:
+        async def one(i):
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json={"question": f"Tell me about topic {i % distinct}",
+                                                         "session_id": f"bench-dispatch-{i}"})
+                if response.status_code == 429:
+                    outcome = "rejected"
+                elif response.status_code == 200 and not response.json()["answer"].startswith("Sorry"):
+                    outcome = "answered"
+                else:
+                    outcome = "failed"
+            except Exception:
+                outcome = "failed"
+            outcomes.append((outcome, (time.perf_counter() - start) * 1000))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    def latencies(kind):
+        return [ms for outcome, ms in outcomes if outcome == kind]
+
+    answered, rejected = latencies("answered"), latencies("rejected")
+    return {
+        "seconds": elapsed,
+        "answered": len(answered),
+        "failed": len(latencies("failed")),
+        "rejected_429": len(rejected),
+        "answered_p50_ms": percentile(answered, 50) if answered else None,
+        "answered_p99_ms": percentile(answered, 99) if answered else None,
+        "rejected_p50_ms": percentile(rejected, 50) if rejected else None,
+    }
+
+
+def run(name, stub_url, stub_port, args, dispatch_env):
+    import httpx
+
+    port = free_port()
+    env = {"OPENROUTER_API_BASE": stub_url, "OPENROUTER_API_KEY": "stub", "ANSWER_CACHE_ENABLED": "false",
+           "WARMUP_ON_STARTUP": "false", **dispatch_env}
+    before = httpx.get(f"http://127.0.0.1:{stub_port}/stats").json()
+    backend = start_backend(port, env=env)
+    try:
+        result = asyncio.run(burst(f"http://127.0.0.1:{port}/chat", args.requests, args.distinct))
+        dispatch = httpx.get(f"http://127.0.0.1:{port}/metrics").json()["llm_dispatch"]["models"]
+    finally:
+        backend.terminate()
+        backend.wait()
+    after = httpx.get(f"http://127.0.0.1:{stub_port}/stats").json()
+    result.update(
+        settings=dispatch_env,
+        upstream_calls=after["calls"] - before["calls"],
+        upstream_rate_limited=after["rate_limited"] - before["rate_limited"],
+        dispatcher=next(iter(dispatch.values()), None),
+    )
+    print(f"{name}: {result['answered']} answered, {result['failed']} failed, {result['rejected_429']} rejected")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=50, help="distinct questions in the burst")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--stub-limit", type=int, default=4, help="concurrent calls the stub accepts")
+    parser.add_argument("--short-queue", type=int, default=16)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    stub_port = free_port()
+    stub = start_stub_llm(stub_port, latency=args.latency, max_concurrent=args.stub_limit)
+    stub_url = f"http://127.0.0.1:{stub_port}/v1"
+    limit = str(args.stub_limit)
+    try:
+        results = {"requests": args.requests, "distinct": args.distinct, "stub_latency_s": args.latency,
+                   "stub_limit": args.stub_limit}
+        results["unbounded"] = run("unbounded", stub_url, stub_port, args, {
+            "LLM_MAX_CONCURRENCY": str(args.requests), "LLM_MAX_QUEUE": str(args.requests)})
+        results["dispatched"] = run("dispatched", stub_url, stub_port, args, {
+            "LLM_MAX_CONCURRENCY": limit, "LLM_MAX_QUEUE": str(args.requests), "LLM_QUEUE_TIMEOUT": "120"})
+        results["dispatched_short_queue"] = run("dispatched_short_queue", stub_url, stub_port, args, {
+            "LLM_MAX_CONCURRENCY": limit, "LLM_MAX_QUEUE": str(args.short_queue)})
+    finally:
+        stub.terminate()
+    report("dispatch", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark a local embedding backend: construction (lazy) versus first-call
+model load, and chunks/sec across batch sizes and thread counts.
+
+    python benchmarks/bench_embedding_backends.py --backend onnx --model-path ./models/all-MiniLM-L6-v2 \
+        --batch-sizes 1 8 32 64 --threads 1 2 4
+"""
+import argparse
+import os
+
+from common import use_scratch_dir, timed, report
+from bench_embeddings import make_chunks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default="hash")
+    parser.add_argument("--model-path", default="")
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--threads", type=int, nargs="+", default=[0])
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_MODEL_PATH"] = os.path.abspath(args.model_path) if args.model_path else ""
+    use_scratch_dir()
+    import embedding_utils
+
+    chunks = make_chunks(args.chunks, args.chunk_size)
+    results = {"backend": args.backend, "chunks": len(chunks), "chunk_size": args.chunk_size}
+
+    factory = embedding_utils.EMBEDDING_BACKENDS[args.backend]
+    seconds, embeddings = timed(factory)
+    results["construct_ms"] = seconds * 1000
+    seconds, _ = timed(embeddings.embed_query, "warm up")
+    results["first_call_ms"] = seconds * 1000
+    results["model_id"] = embeddings.model_id
+    results["dimensions"] = embeddings.dimensions
+
+    runs = []
+    for threads in args.threads:
+        for batch_size in args.batch_sizes:
+            embeddings.batch_size = batch_size
+            if hasattr(embeddings, "threads") and threads != embeddings.threads:
+                embeddings = factory()
+                embeddings.threads = threads
+                embeddings.embed_query("warm up")
+                embeddings.batch_size = batch_size
+            seconds, _ = timed(embeddings.embed_documents, chunks, repeat=2)
+            runs.append({"threads": threads, "batch_size": batch_size, "chunks_per_sec": len(chunks) / seconds})
+    results["runs"] = runs
+    report("embedding_backends", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Micro-benchmark for SimpleHashEmbeddings: chunks/sec before and after
+the batched engine.
+
+    python benchmarks/bench_embeddings.py --chunks 2000
+"""
+import argparse
+import hashlib
+import random
+import string
+
+import numpy as np
+
+from common import use_scratch_dir, timed, report
+
+
+def legacy_hash_text(text, dimensions=384):
+    """The original per-chunk implementation, kept as the baseline."""
+    vector = []
+    for i in range(dimensions):
+        h = hashlib.md5(f"{text}_{i}".encode()).hexdigest()
+        value = (int(h[:8], 16) / (2**32)) * 2 - 1
+        vector.append(value)
+    magnitude = sum(v**2 for v in vector) ** 0.5
+    if magnitude > 0:
+        vector = [v / magnitude for v in vector]
+    return vector
+
+
+def make_chunks(n, size=1000, seed=0):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + "      "
+    return ["".join(rng.choices(alphabet, k=size)) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    from chroma_utils import SimpleHashEmbeddings
+
+    chunks = make_chunks(args.chunks, args.chunk_size)
+    results = {"chunks": len(chunks), "chunk_size": args.chunk_size}
+
+    seconds, legacy = timed(lambda: [legacy_hash_text(c) for c in chunks])
+    results["legacy_chunks_per_sec"] = len(chunks) / seconds
+
+    v1 = SimpleHashEmbeddings(version=1)
+    seconds, matrix = timed(v1.embed_documents, chunks, repeat=3)
+    results["v1_chunks_per_sec"] = len(chunks) / seconds
+    results["v1_bit_compatible"] = bool(np.array_equal(np.array(legacy), np.array(matrix)))
+
+    v2 = SimpleHashEmbeddings(version=2)
+    seconds, _ = timed(v2.embed_batch, chunks, repeat=3)
+    results["v2_chunks_per_sec"] = len(chunks) / seconds
+
+    results["v1_speedup"] = results["v1_chunks_per_sec"] / results["legacy_chunks_per_sec"]
+    results["v2_speedup"] = results["v2_chunks_per_sec"] / results["legacy_chunks_per_sec"]
+    report("embeddings", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Count the document-check LLM calls the relevance gate saves on a labeled
+query set: questions the indexed documents answer ("document", with the
+phrase that answers them) and ones they do not ("web"/"general"). Runs
+AgentRAGChain in-process with a stub web search and a fake LLM that answers
+a document prompt only if its extract holds the answering phrase (and says
+NOT FOUND otherwise).
+
+For every policy it reports LLM calls, document checks skipped, and false
+skips (skipped checks whose extract did hold the answer). It also sweeps the
+thresholds over the scores recorded with the gate off, which is how they
+are meant to be tuned from the route column of application_logs.
+
+    python benchmarks/bench_gate.py --policies off,keyword,vector,either
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import use_scratch_dir, report
+
+DOCUMENTS = [
+    "Employees must submit travel expense reports within 30 days of the trip. Receipts are required for meals, "
+    "lodging and airfare. Mileage for private cars is reimbursed at the standard rate.",
+    "New hires complete security awareness training during their first week. Laptops are issued by the IT "
+    "service desk and must use full-disk encryption and a password manager.",
+    "The Orion API rate limit is 600 requests per minute per key. Requests above the limit receive HTTP 429 "
+    "and should be retried with exponential backoff. Keys are rotated every 90 days.",
+    "Quarterly revenue grew 12 percent, driven by cloud subscriptions in Europe. Operating margin improved to "
+    "18 percent while hardware sales declined.",
+    "Parental leave is 16 weeks at full pay for all parents. Leave can be split into two blocks within the "
+    "first year after the birth or adoption.",
+    "The warehouse robot fleet is charged overnight. Battery packs are replaced after 1500 charge cycles and "
+    "recycled through the certified vendor program.",
+]
+
+# (question, label, phrase of the answering chunk)
+QUERIES = [
+    ("When are travel expense reports due?", "document", "30 days"),
+    ("Do I need receipts for lodging?", "document", "Receipts are required"),
+    ("How is mileage for a private car reimbursed?", "document", "standard rate"),
+    ("What training do new hires complete in their first week?", "document", "security awareness"),
+    ("Who issues laptops to new employees?", "document", "service desk"),
+    ("Is full-disk encryption required on laptops?", "document", "full-disk encryption"),
+    ("What is the Orion API rate limit?", "document", "600 requests"),
+    ("What happens when requests exceed the rate limit?", "document", "HTTP 429"),
+    ("How often are API keys rotated?", "document", "90 days"),
+    ("How much did quarterly revenue grow?", "document", "12 percent"),
+    ("What drove the revenue growth in Europe?", "document", "cloud subscriptions"),
+    ("What was the operating margin?", "document", "18 percent"),
+    ("How long is parental leave?", "document", "16 weeks"),
+    ("Can parental leave be split into blocks?", "document", "two blocks"),
+    ("When are warehouse robot batteries replaced?", "document", "1500 charge cycles"),
+    ("How are old battery packs recycled?", "document", "certified vendor"),
+    ("Tell me a joke about cats", "general", None),
+    ("Explain quantum gravity in simple terms", "general", None),
+    ("What is the capital of Australia?", "general", None),
+    ("Write a haiku about autumn leaves", "general", None),
+    ("How do I bake sourdough bread?", "general", None),
+    ("Who painted the Mona Lisa?", "general", None),
+    ("What is the difference between a virus and bacteria?", "general", None),
+    ("Recommend a good science fiction novel", "general", None),
+    ("Translate good morning into Spanish", "general", None),
+    ("How many planets are in the solar system?", "general", None),
+    ("What's the weather in Paris today?", "web", None),
+    ("Latest news about the football world cup", "web", None),
+    ("Current price of bitcoin", "web", None),
+    ("What is today's date?", "web", None),
+    ("Breaking news on the elections", "web", None),
+    ("Temperature in Karachi right now", "web", None),
+]
+
+
+class FakeLLM:
+    """Counts calls by prompt kind. A document prompt is answered only when its
+    extract holds the question's answering phrase, as a model would."""
+
+    def __init__(self, evidence):
+        self.evidence = evidence
+        self.calls = {}
+
+    async def ainvoke(self, prompt):
+        from langchain_core.messages import AIMessage
+
+        question = prompt.rsplit("User question: ", 1)[1].split("\n", 1)[0].strip()
+        kind = "document" if "Document Extract:" in prompt else "web" if "Web results" in prompt else "fallback"
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        if kind == "document" and not (self.evidence.get(question) and self.evidence[question] in prompt):
+            return AIMessage(content="NOT FOUND")
+        return AIMessage(content=f"Answer to: {question}")
+
+
+def run_policy(langchain_utils, policy, queries):
+    langchain_utils.RELEVANCE_GATE = policy
+    llm = FakeLLM({question: evidence for question, _, evidence in queries})
+    chain = langchain_utils.AgentRAGChain(llm, speculative=False)
+    records = []
+
+    async def ask_all():
+        for question, label, evidence in queries:
+            found = langchain_utils.document_search.invoke({"q": question})
+            start = time.perf_counter()
+            result = await chain.ainvoke({"input": question, "chat_history": []})
+            records.append({"label": label, "source": result["source"], "ms": (time.perf_counter() - start) * 1000,
+                            "retrieved_answer": bool(evidence) and any(evidence in chunk for chunk in found["chunks"]),
+                            **result.get("retrieval", {})})
+
+    asyncio.run(ask_all())
+    skipped = [r for r in records if r.get("decision") == "skipped"]
+    return {
+        "llm_calls": sum(llm.calls.values()),
+        "llm_calls_by_kind": dict(llm.calls),
+        "document_checks": llm.calls.get("document", 0),
+        "checks_skipped": len(skipped),
+        "false_skips": sum(1 for r in skipped if r["retrieved_answer"]),
+        "document_answers": sum(1 for r in records if r["source"] == "document"),
+        "answerable": sum(1 for r in records if r["retrieved_answer"]),
+        "avg_ms": sum(r["ms"] for r in records) / len(records),
+    }, records
+
+
+def sweep(records, field, thresholds):
+    """Skips and false skips per threshold, from the scores recorded with the
+    gate off; "answered" (whether the LLM found the answer) is the label."""
+    rows = []
+    for threshold in thresholds:
+        skipped = [r for r in records if r.get(field) is not None and r[field] < threshold]
+        rows.append({"threshold": threshold, "skipped": len(skipped),
+                     "false_skips": sum(1 for r in skipped if r.get("answered"))})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--policies", default="off,keyword,vector,either")
+    parser.add_argument("--k", type=int, default=None, help="chunks retrieved per question (RETRIEVER_K)")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    os.environ["WEB_SEARCH_PROVIDER"] = "stub"
+    import chroma_utils
+    import langchain_utils
+
+    if args.k:
+        langchain_utils.RETRIEVER_K = args.k
+    texts = [sentence.strip() + "." for document in DOCUMENTS for sentence in document.split(". ") if sentence]
+    metadatas = [{"file_id": 1} for _ in texts]
+    chroma_utils.write_embedded_chunks([f"chunk-{i}" for i in range(len(texts))], texts, metadatas,
+                                       chroma_utils.embedding_function.embed_documents(texts))
+
+    results = {"queries": len(QUERIES), "chunks": len(texts), "k": langchain_utils.RETRIEVER_K, "embedder": chroma_utils.embedder_status()["embedder"],
+               "thresholds": {"relevance": langchain_utils.RELEVANCE_THRESHOLD,
+                              "keyword_coverage": langchain_utils.KEYWORD_COVERAGE_THRESHOLD}}
+    baseline_records = None
+    for policy in args.policies.split(","):
+        results[policy], records = run_policy(langchain_utils, policy, QUERIES)
+        if policy == "off":
+            baseline_records = records
+    if baseline_records is not None:
+        baseline = results["off"]["llm_calls"]
+        for policy in args.policies.split(","):
+            results[policy]["llm_calls_saved"] = baseline - results[policy]["llm_calls"]
+        grid = [0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+        results["sweep_keyword_coverage"] = sweep(baseline_records, "keyword_coverage", grid)
+        results["sweep_relevance"] = sweep(baseline_records, "relevance", grid)
+    report("relevance_gate", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Tail latency of /chat with and without hedged requests. The stub LLM
+gives the primary model a long tail (an extra --tail-latency seconds on a
+fraction of calls) and occasional 503s, while the backup model is healthy.
+
+Reports p50/p95/p99 latency, failed answers, how often each model answered
+and the backend's hedging metrics (trigger rate, failovers, deadline).
+
+    python benchmarks/bench_hedge.py --requests 300 --tail-probability 0.04 --tail-latency 4
+"""
+import argparse
+import asyncio
+import time
+
+from common import use_scratch_dir, start_stub_llm, start_backend, free_port, percentile, report
+
+PRIMARY = "nvidia/nemotron-nano-9b-v2:free"
+BACKUP = "qwen/qwen3-4b:free"
+
+
+async def run_load(url, total, concurrency):
+    import httpx
+
+    latencies, answered_by = [], {}
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=300) as client:
+        async def one(i):
+            nonlocal failed
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, json={"question": f"Tell me about topic {i}", "model": PRIMARY,
+                                                         "session_id": f"bench-hedge-{i}"})
+                latencies.append((time.perf_counter() - start) * 1000)
+                body = response.json() if response.status_code == 200 else {}
+                if not body or body["answer"].startswith("Sorry"):
+                    failed += 1
+                model = body.get("answered_by")
+                answered_by[model] = answered_by.get(model, 0) + 1
+
+        await asyncio.gather(*(one(i) for i in range(total)))
+    return {
+        "requests": total,
+        "failed": failed,
+        "answered_by": answered_by,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+    }
+
+
+def run(stub_url, args, hedging):
+    import httpx
+
+    port = free_port()
+    env = {"OPENROUTER_API_BASE": stub_url, "OPENROUTER_API_KEY": "stub", "ANSWER_CACHE_ENABLED": "false",
+           "WARMUP_ON_STARTUP": "false", "LLM_HEDGING": str(hedging).lower(), "LLM_BACKUP_MODELS": BACKUP,
+           "LLM_HEDGE_MIN_SAMPLES": str(args.min_samples)}
+    backend = start_backend(port, env=env)
+    try:
+        result = asyncio.run(run_load(f"http://127.0.0.1:{port}/chat", args.requests, args.concurrency))
+        result["hedging"] = httpx.get(f"http://127.0.0.1:{port}/metrics").json()["llm_hedging"]["models"].get(PRIMARY)
+    finally:
+        backend.terminate()
+        backend.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub LLM latency in seconds")
+    parser.add_argument("--tail-probability", type=float, default=0.04)
+    parser.add_argument("--tail-latency", type=float, default=4.0)
+    parser.add_argument("--error-probability", type=float, default=0.03)
+    parser.add_argument("--min-samples", type=int, default=20, help="LLM_HEDGE_MIN_SAMPLES")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    stub_port = free_port()
+    stub = start_stub_llm(stub_port, latency=args.latency, extra_args=[
+        "--tail-probability", str(args.tail_probability), "--tail-latency", str(args.tail_latency),
+        "--error-probability", str(args.error_probability), "--flaky-models", PRIMARY])
+    stub_url = f"http://127.0.0.1:{stub_port}/v1"
+    try:
+        results = {"requests": args.requests, "concurrency": args.concurrency, "stub_latency_s": args.latency,
+                   "tail_probability": args.tail_probability, "tail_latency_s": args.tail_latency,
+                   "error_probability": args.error_probability}
+        results["primary_only"] = run(stub_url, args, hedging=False)
+        results["hedged"] = run(stub_url, args, hedging=True)
+        results["p99_improvement_ms"] = results["primary_only"]["p99_ms"] - results["hedged"]["p99_ms"]
+    finally:
+        stub.terminate()
+    report("hedge", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
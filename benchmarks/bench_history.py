@@ -0,0 +1,74 @@
+"""Benchmark chat history reads on a large application_logs table: the
+original unindexed full-history query versus the indexed, LIMITed one.
+
+    python benchmarks/bench_history.py --rows 1000000 --sessions 20000
+"""
+import argparse
+import random
+import sqlite3
+import time
+
+from common import use_scratch_dir, report
+
+
+def legacy_history(conn, session_id):
+    rows = conn.execute(
+        'SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at',
+        (session_id,)
+    ).fetchall()
+    return rows[-4:]
+
+
+def measure(fn, session_ids, seconds):
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn(session_ids[done % len(session_ids)])
+        done += 1
+    elapsed = time.perf_counter() - start
+    return {"reads_per_sec": done / elapsed, "avg_latency_ms": elapsed / done * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    import db_utils
+
+    db_utils.init_db()
+    conn = sqlite3.connect(db_utils.DB_NAME)
+    conn.execute('DROP INDEX IF EXISTS idx_application_logs_session_created')
+    rng = random.Random(0)
+    batch = []
+    for i in range(args.rows):
+        batch.append((f"session-{rng.randrange(args.sessions)}", f"question {i}", f"answer {i} " * 10, "bench",
+                      f"2026-01-01 00:{(i // 60) % 60:02d}:{i % 60:02d}"))
+        if len(batch) == 50_000:
+            conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at) '
+                             'VALUES (?, ?, ?, ?, ?)', batch)
+            batch.clear()
+    if batch:
+        conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at) '
+                         'VALUES (?, ?, ?, ?, ?)', batch)
+    conn.commit()
+
+    session_ids = [f"session-{rng.randrange(args.sessions)}" for _ in range(1000)]
+    results = {"rows": args.rows, "sessions": args.sessions}
+    results["legacy_unindexed"] = measure(lambda s: legacy_history(conn, s), session_ids, args.seconds)
+
+    start = time.perf_counter()
+    db_utils.create_application_logs()
+    results["index_build_seconds"] = time.perf_counter() - start
+
+    results["legacy_indexed"] = measure(lambda s: legacy_history(conn, s), session_ids, args.seconds)
+    results["indexed_limit"] = measure(lambda s: db_utils.get_chat_history(s, max_turns=4), session_ids, args.seconds)
+    report("history", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
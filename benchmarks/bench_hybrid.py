@@ -0,0 +1,77 @@
+"""Recall@k and queries/sec for vector-only, BM25-only and hybrid (RRF)
+retrieval on a synthetic corpus where each chunk documents one part number.
+
+    python benchmarks/bench_hybrid.py --chunks 5000 --queries 500 --k 2
+"""
+import argparse
+import random
+import time
+
+from common import use_scratch_dir, report
+
+WORDS = ("pump valve seal torque pressure flow bearing motor shaft housing gasket filter "
+         "inlet outlet voltage current sensor bracket bolt coupling impeller rotor stator").split()
+
+
+def make_corpus(n, rng):
+    chunks = []
+    for i in range(n):
+        part = f"PN-{10000 + i}"
+        body = " ".join(rng.choices(WORDS, k=120))
+        chunks.append((part, f"Part {part} specification. {body}. Maximum torque for {part} is {rng.randint(5, 90)} Nm."))
+    return chunks
+
+
+def evaluate(search, queries, k):
+    hits = 0
+    start = time.perf_counter()
+    for question, expected_id in queries:
+        if expected_id in [doc.id for doc in search(question, k)]:
+            hits += 1
+    elapsed = time.perf_counter() - start
+    return {f"recall_at_{k}": hits / len(queries), "queries_per_sec": len(queries) / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    import chroma_utils
+    from langchain_core.documents import Document
+
+    rng = random.Random(0)
+    corpus = make_corpus(args.chunks, rng)
+    ids = [f"chunk-{i}" for i in range(len(corpus))]
+    vectorstore = chroma_utils.get_vectorstore()
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), 1000):
+        batch = corpus[offset:offset + 1000]
+        vectorstore.add_texts([text for _, text in batch], metadatas=[{"file_id": 1}] * len(batch),
+                              ids=ids[offset:offset + len(batch)])
+    vector_index_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    bm25 = chroma_utils.get_bm25_index()  # built from the Chroma collection
+    bm25_build_seconds = time.perf_counter() - start
+
+    picks = rng.sample(range(len(corpus)), args.queries)
+    queries = [(f"What is the maximum torque for {corpus[i][0]}?", ids[i]) for i in picks]
+
+    def bm25_only(question, k):
+        return [Document(page_content="", id=chunk_id) for chunk_id, _ in bm25.search(question, k)]
+
+    results = {"chunks": args.chunks, "queries": args.queries, "k": args.k,
+               "vector_index_seconds": vector_index_seconds, "bm25_build_seconds": bm25_build_seconds,
+               "bm25": bm25.stats()}
+    results["vector"] = evaluate(lambda q, k: vectorstore.similarity_search(q, k=k), queries, args.k)
+    results["bm25_only"] = evaluate(bm25_only, queries, args.k)
+    results["hybrid_rrf"] = evaluate(chroma_utils.hybrid_search, queries, args.k)
+    report("hybrid", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
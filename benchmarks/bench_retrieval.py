@@ -0,0 +1,60 @@
+"""Benchmark document_search retrieval: uncached similarity search versus the
+query-embedding and top-k result caches, on a Zipf-distributed stream of
+popular questions.
+
+    python benchmarks/bench_retrieval.py --chunks 20000 --queries 5000 --distinct 200
+"""
+import argparse
+import random
+import time
+
+from common import use_scratch_dir, percentile, report
+from bench_embeddings import make_chunks
+
+
+def measure(search, questions):
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        search(question)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "queries_per_sec": len(latencies) / sum(latencies),
+        "p50_us": percentile(latencies, 50) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=200, help="number of distinct questions")
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    import chroma_utils
+
+    texts = make_chunks(args.chunks, size=300)
+    for start in range(0, len(texts), 1000):
+        batch = texts[start:start + 1000]
+        chroma_utils.get_vectorstore().add_texts(batch, metadatas=[{"file_id": 1}] * len(batch),
+                                                 ids=[f"bench-{start + i}" for i in range(len(batch))])
+
+    rng = random.Random(0)
+    weights = [1 / (rank + 1) for rank in range(args.distinct)]
+    questions = [f"question number {i} about the manual" for i in
+                 rng.choices(range(args.distinct), weights=weights, k=args.queries)]
+
+    results = {"chunks": args.chunks, "queries": args.queries, "distinct": args.distinct}
+    results["uncached"] = measure(lambda q: chroma_utils.get_vectorstore().similarity_search(q, k=args.k), questions)
+    results["cached"] = measure(lambda q: chroma_utils.search_documents(q, k=args.k), questions)
+    results["retrieval_cache"] = chroma_utils.retrieval_cache.stats()
+    results["query_embedding_cache"] = chroma_utils.embedding_function.queries.stats()
+    report("retrieval", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
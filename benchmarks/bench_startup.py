@@ -0,0 +1,77 @@
+"""Profile backend startup: `import main` wall time, the packages that
+dominate it (python -X importtime), and how long a fresh server takes to
+accept connections and to report ready on /healthz.
+
+    python benchmarks/bench_startup.py --runs 3 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from common import use_scratch_dir, start_backend, free_port, BACKEND_DIR, report
+
+
+def import_main(extra_args=()):
+    """Import main in a fresh interpreter; returns (wall seconds, stderr)."""
+    code = f"import sys; sys.path.insert(0, {os.path.abspath(BACKEND_DIR)!r}); import main"
+    start = time.perf_counter()
+    done = subprocess.run([sys.executable, *extra_args, "-c", code], capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, done.stderr
+
+
+def import_profile(stderr, top):
+    """Self time per top-level package, from -X importtime output."""
+    by_package = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us)
+    ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"package": name, "self_ms": us / 1000} for name, us in ranked]
+
+
+def time_to_ready(env, timeout=120):
+    import httpx
+
+    port = free_port()
+    start = time.perf_counter()
+    backend = start_backend(port, env=env)
+    listening = time.perf_counter() - start
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=5).status_code == 200:
+                    return {"listening_s": listening, "ready_s": time.perf_counter() - start}
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        return {"listening_s": listening, "ready_s": None}
+    finally:
+        backend.terminate()
+        backend.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    results = {"runs": args.runs}
+    results["import_main_s"] = min(import_main()[0] for _ in range(args.runs))
+    results["import_profile"] = import_profile(import_main(["-X", "importtime"])[1], args.top)
+    # Warm-up builds the LLM clients, which need an API key (any value will do)
+    env = {"ANSWER_CACHE_ENABLED": "false", "OPENROUTER_API_KEY": os.getenv("OPENROUTER_API_KEY", "bench")}
+    results["startup"] = [time_to_ready(env) for _ in range(args.runs)]
+    results["startup_no_warmup"] = [time_to_ready({**env, "WARMUP_ON_STARTUP": "false"}) for _ in range(args.runs)]
+    report("startup", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare time-to-first-token on /chat/stream with the full /chat latency,
+against a local stub LLM that streams tokens at a fixed rate.
+
+    python benchmarks/bench_stream.py --requests 50 --ttft 0.3 --token-latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from common import use_scratch_dir, start_stub_llm, start_backend, free_port, percentile, report
+
+
+async def measure(base_url, total, concurrency, stream):
+    import httpx
+
+    first_token, complete = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=180) as client:
+        async def one(i):
+            body = {"question": f"Explain subject number {i % 20} in detail", "session_id": f"bench-{i}"}
+            async with semaphore:
+                start = time.perf_counter()
+                if not stream:
+                    response = await client.post(f"{base_url}/chat", json=body)
+                    response.raise_for_status()
+                    complete.append(time.perf_counter() - start)
+                    return
+                seen_token = False
+                async with client.stream("POST", f"{base_url}/chat/stream", json=body) as response:
+                    async for line in response.aiter_lines():
+                        if seen_token or not line.startswith("data: "):
+                            continue
+                        if json.loads(line[len("data: "):])["type"] == "token":
+                            first_token.append(time.perf_counter() - start)
+                            seen_token = True
+                complete.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(i) for i in range(total)))
+
+    results = {"p50_complete_ms": percentile(complete, 50) * 1000, "p99_complete_ms": percentile(complete, 99) * 1000}
+    if stream:
+        results["p50_first_token_ms"] = percentile(first_token, 50) * 1000
+        results["p99_first_token_ms"] = percentile(first_token, 99) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--ttft", type=float, default=0.3, help="stub time to first token in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="stub delay between tokens")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    stub_port = free_port()
+    # Non-streaming replies take as long as a full streamed reply would
+    stub = start_stub_llm(stub_port, latency=args.ttft + 12 * args.token_latency, ttft=args.ttft,
+                          token_latency=args.token_latency)
+    port = free_port()
+    backend = start_backend(port, env={"OPENROUTER_API_BASE": f"http://127.0.0.1:{stub_port}/v1",
+                                       "OPENROUTER_API_KEY": "stub", "ANSWER_CACHE_ENABLED": "false"})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        results = {"stub_ttft_s": args.ttft, "stub_token_latency_s": args.token_latency}
+        results["chat"] = asyncio.run(measure(base_url, args.requests, args.concurrency, stream=False))
+        results["chat_stream"] = asyncio.run(measure(base_url, args.requests, args.concurrency, stream=True))
+    finally:
+        backend.terminate()
+        stub.terminate()
+    report("stream", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
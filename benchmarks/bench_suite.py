@@ -0,0 +1,322 @@
+"""End-to-end benchmark of the whole backend, fully offline: a synthetic
+PDF/DOCX/HTML corpus is uploaded through /upload-docs, then /chat is load
+tested with document, live (web) and general questions, against the local
+OpenAI-compatible stub LLM and the stub web search provider. Finally the
+persisted index is searched in-process to time retrieval on its own.
+
+Reports ingestion throughput, retrieval latency and recall, /chat latency
+percentiles under concurrent load, and peak memory of the backend, the
+ingestion workers and the retrieval process, as one JSON document (appended
+to --output), together with the settings and the git commit it ran on.
+--baseline compares the numbers with a previous run's JSON.
+
+    python benchmarks/bench_suite.py --docs 200 --chat-requests 400 --concurrency 32 --output suite.jsonl
+    python benchmarks/bench_suite.py --docs 200 --output suite.jsonl --baseline suite.jsonl
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import time
+
+from common import (
+    use_scratch_dir, start_stub_llm, start_backend, free_port, percentile, report, BENCH_DIR
+)
+from corpus import make_corpus
+from bench_bulk import wait_for
+
+LIVE_QUESTIONS = ["What's the latest news about the {name} project?", "Weather today at the {name} warehouse?"]
+GENERAL_QUESTIONS = ["Explain the difference between a budget and a forecast",
+                     "Write a short haiku about quarterly planning",
+                     "What makes a good onboarding checklist?",
+                     "How do I prioritise a backlog of support tickets?"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def process_peak_rss(pid):
+    """Peak resident memory of a running process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def wait_until_ready(client, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if client.get("/healthz").status_code == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"backend was not ready within {timeout}s")
+
+
+def ingest(client, documents, upload_batch, timeout):
+    start = time.perf_counter()
+    batches = []
+    for offset in range(0, len(documents), upload_batch):
+        files = [("files", (name, data)) for name, data in documents[offset:offset + upload_batch]]
+        response = client.post("/upload-docs", files=files)
+        response.raise_for_status()
+        batches.append(f"/batches/{response.json()['batch_id']}")
+    upload_s = time.perf_counter() - start
+    wait_for(client, batches, timeout)
+    total_s = time.perf_counter() - start
+
+    jobs = [job for path in batches for job in client.get(path).json()["jobs"]]
+    completed = [job for job in jobs if job["status"] == "completed"]
+    chunks = sum(job["chunks_written"] for job in jobs)
+    megabytes = sum(len(data) for _, data in documents) / 2**20
+    worker_peaks = [job["peak_rss_bytes"] for job in jobs if job.get("peak_rss_bytes")]
+    return {
+        "documents": len(documents),
+        "completed": len(completed),
+        "failed": len(jobs) - len(completed),
+        "upload_s": upload_s,
+        "total_s": total_s,
+        "documents_per_sec": len(documents) / total_s,
+        "megabytes_per_sec": megabytes / total_s,
+        "chunks": chunks,
+        "chunks_per_sec": chunks / total_s,
+        "worker_peak_rss_bytes": max(worker_peaks) if worker_peaks else None,
+    }
+
+
+def chat_questions(questions, total, doc_share, live_share, rng):
+    """A shuffled mix of questions about the planted facts, live questions
+    (routed to web search) and general ones (LLM fallback)."""
+    names = sorted({filename.split("-")[0].capitalize() for _, filename, _ in questions})
+    mix = []
+    for i in range(total):
+        roll = rng.random()
+        if roll < doc_share:
+            mix.append(("document", rng.choice(questions)[0]))
+        elif roll < doc_share + live_share:
+            mix.append(("web", rng.choice(LIVE_QUESTIONS).format(name=rng.choice(names))))
+        else:
+            mix.append(("general", rng.choice(GENERAL_QUESTIONS)))
+    return mix
+
+
+async def chat_load(base_url, mix, concurrency):
+    import httpx
+
+    latencies = {}
+    sources = {}
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(i, kind, question):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json={"question": question,
+                                                                "session_id": f"bench-suite-{i}"})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if not ok:
+                    errors += 1
+                    return
+                latencies.setdefault(kind, []).append(elapsed_ms)
+                latencies.setdefault("all", []).append(elapsed_ms)
+                source = response.json()["source"]
+                sources[source] = sources.get(source, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i, kind, question) for i, (kind, question) in enumerate(mix)))
+        elapsed = time.perf_counter() - start
+
+    def summary(values):
+        return {"requests": len(values), "p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99)}
+
+    return {
+        "requests": len(mix),
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_sec": len(mix) / elapsed,
+        "sources": sources,
+        **summary(latencies.get("all", [])),
+        "by_kind": {kind: summary(values) for kind, values in latencies.items() if kind != "all"},
+    }
+
+
+def measure_retrieval(questions, k, repeat):
+    """Search the index the backend built, in this process, the way
+    document_search does: every question once with cold caches, then again
+    `repeat` times through the retrieval cache."""
+    import chroma_utils
+
+    def run(search):
+        latencies, hits = [], 0
+        for question, _, answer in questions:
+            start = time.perf_counter()
+            found = search(question)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            hits += any(answer in doc.page_content for doc, _ in found)
+        return {"queries": len(questions), "p50_us": percentile(latencies, 50), "p99_us": percentile(latencies, 99),
+                "queries_per_sec": len(latencies) / (sum(latencies) / 1e6), "recall_at_k": hits / len(questions)}
+
+    chroma_utils.warm_up_retrieval()
+    search = lambda q: chroma_utils.search_documents_with_scores(q, k=k)
+    uncached = run(search)
+    for _ in range(repeat):
+        cached = run(search)
+    return {"k": k, "hybrid": chroma_utils.HYBRID_RETRIEVAL, "uncached": uncached, "cached": cached,
+            "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix[:-1], value
+
+
+def load_baseline(path):
+    """The last suite run in a JSON lines file written with --output."""
+    with open(path) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return next((run for run in reversed(runs) if run.get("benchmark") == "suite"), None)
+
+
+def compare(baseline, results):
+    """Print every numeric metric next to the baseline run's."""
+    before = dict(flatten(baseline["results"]))
+    print(f"\nCompared with the run of {time.ctime(baseline['timestamp'])} "
+          f"(commit {baseline['results']['environment'].get('commit')}):")
+    for metric, value in flatten(results):
+        if metric.startswith(("settings.", "environment.")) or metric not in before:
+            continue
+        old = before[metric]
+        change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {metric:55} {old:>14.2f} -> {value:>14.2f}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=200, help="documents in the synthetic corpus")
+    parser.add_argument("--paragraphs", type=int, default=8, help="paragraphs per document")
+    parser.add_argument("--words", type=int, default=60, help="words per paragraph")
+    parser.add_argument("--formats", default="pdf,docx,html")
+    parser.add_argument("--upload-batch", type=int, default=100, help="files per /upload-docs request")
+    parser.add_argument("--workers", type=int, default=2, help="INGESTION_WORKERS")
+    parser.add_argument("--chat-requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--doc-share", type=float, default=0.6, help="share of /chat questions about the documents")
+    parser.add_argument("--live-share", type=float, default=0.2, help="share of live (web search) questions")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="stub LLM latency in seconds")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="stub web search latency in seconds")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on during /chat load")
+    parser.add_argument("--retrieval-k", type=int, default=2)
+    parser.add_argument("--retrieval-repeat", type=int, default=2, help="passes over the questions through the cache")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds to wait for ingestion")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None, help="JSON lines file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    import httpx
+
+    # Read before this run is appended, in case --output is the same file
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    if args.baseline and baseline is None:
+        print(f"No suite run in {args.baseline} to compare with")
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    skipped = []
+    if "html" in formats and importlib.util.find_spec("unstructured") is None:
+        # UnstructuredHTMLLoader needs the optional unstructured package
+        formats.remove("html")
+        skipped.append("html")
+        print("unstructured is not installed: leaving HTML out of the corpus")
+    documents, questions = make_corpus(args.docs, args.paragraphs, args.words, tuple(formats), args.seed)
+    rng = random.Random(args.seed)
+    mix = chat_questions(questions, args.chat_requests, args.doc_share, args.live_share, rng)
+
+    results = {
+        "settings": {**{key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+                     "formats": formats, "skipped_formats": skipped},
+        "environment": {"commit": git_commit(), "python": platform.python_version(),
+                        "platform": platform.platform(), "cpus": os.cpu_count()},
+        "corpus": {"documents": len(documents), "bytes": sum(len(data) for _, data in documents),
+                   "by_format": {f: sum(1 for name, _ in documents if name.endswith(f".{f}")) for f in formats},
+                   "questions": len(questions)},
+    }
+
+    use_scratch_dir(prefix="documind-bench-suite-")
+    stub_port = free_port()
+    stub = start_stub_llm(stub_port, latency=args.llm_latency, ttft=args.llm_latency)
+    port = free_port()
+    env = {
+        "OPENROUTER_API_BASE": f"http://127.0.0.1:{stub_port}/v1",
+        "OPENROUTER_API_KEY": "stub",
+        "WEB_SEARCH_PROVIDER": "stub",
+        "WEB_SEARCH_STUB_LATENCY": str(args.search_latency),
+        "INGESTION_WORKERS": str(args.workers),
+        "ANSWER_CACHE_ENABLED": str(args.answer_cache).lower(),
+        "RETRIEVER_K": str(args.retrieval_k),
+    }
+    try:
+        start = time.perf_counter()
+        backend = start_backend(port, env=env)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            with httpx.Client(base_url=base_url, timeout=600) as client:
+                wait_until_ready(client)
+                results["startup_s"] = time.perf_counter() - start
+                print(f"Ingesting {len(documents)} documents...")
+                results["ingestion"] = ingest(client, documents, args.upload_batch, args.timeout)
+                print(f"Sending {len(mix)} /chat requests, {args.concurrency} at a time...")
+                warm_up = [("general", question) for question in GENERAL_QUESTIONS]
+                asyncio.run(chat_load(base_url, warm_up, args.concurrency))
+                results["chat"] = asyncio.run(chat_load(base_url, mix, args.concurrency))
+                metrics = client.get("/metrics").json()
+                results["backend"] = {
+                    "peak_rss_bytes": process_peak_rss(backend.pid),
+                    "embedder": metrics["embedder"],
+                    "llm_dispatch": metrics["llm_dispatch"]["models"],
+                    "web_search": metrics["web_search"],
+                    "relevance_gate": metrics["routing"]["relevance_gate"],
+                }
+        finally:
+            backend.terminate()
+            backend.wait()
+    finally:
+        stub.terminate()
+
+    # The backend has exited, so its index can be opened here
+    print("Timing retrieval...")
+    results["retrieval"] = measure_retrieval(questions, args.retrieval_k, args.retrieval_repeat)
+    results["peak_memory_bytes"] = {
+        "backend": results["backend"]["peak_rss_bytes"],
+        "ingestion_worker": results["ingestion"]["worker_peak_rss_bytes"],
+        "retrieval_process": results["retrieval"]["process_peak_rss_bytes"],
+    }
+    report("suite", results, args.output)
+    if baseline is not None:
+        compare(baseline, results)
+
+
+if __name__ == "__main__":
+    main()
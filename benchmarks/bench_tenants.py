@@ -0,0 +1,75 @@
+"""Per-query retrieval latency as the number of tenants grows: each tenant's
+own collection (sharded) versus all tenants' chunks in one shared
+collection, as before tenants had their own.
+
+    python benchmarks/bench_tenants.py --tenants 1 10 50 100 --chunks-per-tenant 200 --queries 300
+"""
+import argparse
+import random
+import time
+
+from common import use_scratch_dir, percentile, report
+from bench_hybrid import WORDS
+
+SHARED_TENANT = "shared"
+
+
+def make_chunks(tenant, n, rng):
+    return [f"{tenant} section {i}. " + " ".join(rng.choices(WORDS, k=120)) for i in range(n)]
+
+
+def measure(search, tenants, queries, rng):
+    latencies = []
+    for _ in range(queries):
+        tenant = rng.choice(tenants)
+        question = " ".join(rng.choices(WORDS, k=6))
+        start = time.perf_counter()
+        search(question, tenant)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries_per_sec": len(latencies) / sum(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--chunks-per-tenant", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    import chroma_utils
+
+    rng = random.Random(0)
+    tenants = []
+    results = {"chunks_per_tenant": args.chunks_per_tenant, "store_cache_size": chroma_utils.TENANT_STORE_CACHE_SIZE,
+               "runs": []}
+    for count in sorted(args.tenants):
+        while len(tenants) < count:
+            tenant = f"tenant-{len(tenants)}"
+            texts = make_chunks(tenant, args.chunks_per_tenant, rng)
+            ids = [f"{tenant}-{i}" for i in range(len(texts))]
+            metadatas = [{"file_id": len(tenants) + 1} for _ in texts]
+            embeddings = chroma_utils.embedding_function.embed_documents(texts)
+            chroma_utils.write_embedded_chunks(ids, texts, metadatas, embeddings, tenant_id=tenant)
+            chroma_utils.write_embedded_chunks(ids, texts, metadatas, embeddings, tenant_id=SHARED_TENANT)
+            tenants.append(tenant)
+
+        # hybrid_search bypasses the retrieval cache, so every query hits the index
+        run = {"tenants": count, "total_chunks": count * args.chunks_per_tenant}
+        run["sharded"] = measure(lambda q, t: chroma_utils.hybrid_search(q, args.k, tenant_id=t),
+                                 tenants, args.queries, rng)
+        run["shared"] = measure(lambda q, t: chroma_utils.hybrid_search(q, args.k, tenant_id=SHARED_TENANT),
+                                tenants, args.queries, rng)
+        results["runs"].append(run)
+    results["tenant_stores"] = chroma_utils.tenant_store_stats()
+    report("tenants", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
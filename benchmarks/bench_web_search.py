@@ -0,0 +1,80 @@
+"""Benchmark web search under concurrent, repetitive traffic (many users asking
+about the weather or the same news story): every request going upstream
+versus the TTL cache with single-flight coalescing. Uses the local stub
+provider with a fixed latency, so no SerpAPI quota is spent.
+
+    python benchmarks/bench_web_search.py --requests 2000 --distinct 50 --concurrency 32
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import use_scratch_dir, percentile, report
+
+
+def make_queries(requests, distinct, rng):
+    """Zipf-like popularity: a few queries make up most of the traffic, and
+    casing/punctuation vary the way users type them."""
+    topics = [f"weather in city {i} today" if i % 2 else f"latest news about story {i}" for i in range(distinct)]
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    queries = []
+    for topic in rng.choices(topics, weights=weights, k=requests):
+        variant = rng.randrange(3)
+        queries.append(topic.title() + "?" if variant == 1 else f"  {topic.upper()} " if variant == 2 else topic)
+    return queries
+
+
+def run(search, queries, concurrency):
+    latencies = []
+
+    def one(query):
+        start = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "requests_per_sec": len(queries) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--distinct", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub provider latency (seconds)")
+    parser.add_argument("--ttl", type=float, default=300)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    use_scratch_dir()
+    from search_utils import CoalescingSearch, StubSearchProvider
+
+    queries = make_queries(args.requests, args.distinct, random.Random(0))
+    results = {"requests": args.requests, "distinct": args.distinct, "concurrency": args.concurrency,
+               "provider_latency_ms": args.latency * 1000}
+
+    provider = StubSearchProvider(latency=args.latency)
+    results["uncached"] = {**run(provider.search, queries, args.concurrency), "upstream_calls": provider.calls}
+
+    provider = StubSearchProvider(latency=args.latency)
+    coalescing_only = CoalescingSearch(provider, ttl=0)
+    results["coalescing_only"] = {**run(coalescing_only.search, queries, args.concurrency),
+                                  **coalescing_only.stats()}
+
+    provider = StubSearchProvider(latency=args.latency)
+    cached = CoalescingSearch(provider, ttl=args.ttl)
+    results["cached_coalescing"] = {**run(cached.search, queries, args.concurrency), **cached.stats()}
+    report("web_search", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
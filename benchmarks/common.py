@@ -0,0 +1,111 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks import the backend modules directly, so they run from a scratch
+directory: the backend creates ./chroma_db and rag_app.db relative to the
+working directory and must never touch the real ones.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def use_scratch_dir(prefix="documind-bench-"):
+    """Make the backend importable and chdir into a fresh temp directory."""
+    sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+    scratch = tempfile.mkdtemp(prefix=prefix)
+    os.chdir(scratch)
+    return scratch
+
+
+def timed(fn, *args, repeat=1, **kwargs):
+    """Run fn repeat times and return (best_seconds, last_result)."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, results, output=None):
+    """Print results as JSON (and append them to output if given)."""
+    payload = {"benchmark": name, "timestamp": time.time(), "results": results}
+    print(json.dumps(payload, indent=2))
+    if output:
+        with open(output, "a") as f:
+            f.write(json.dumps(payload) + "\n")
+    return payload
+
+
+def serve_in_thread(app, port, host="127.0.0.1"):
+    """Run an ASGI app with uvicorn on a background thread; returns the server."""
+    import threading
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(args, port, env=None, cwd=None, timeout=60):
+    """Start a server subprocess and wait until it accepts connections on port."""
+    import socket
+    import subprocess
+
+    process = subprocess.Popen(args, env={**os.environ, **(env or {})}, cwd=cwd,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{args} exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{args} did not start listening on port {port}")
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_stub_llm(port, latency=0.2, ttft=None, token_latency=0.01, max_concurrent=None, extra_args=()):
+    """extra_args: more stub_openai.py options (tail latency, errors)."""
+    args = [sys.executable, os.path.join(BENCH_DIR, "stub_openai.py"), "--port", str(port),
+            "--latency", str(latency), "--token-latency", str(token_latency), *extra_args]
+    if ttft is not None:
+        args += ["--ttft", str(ttft)]
+    if max_concurrent is not None:
+        args += ["--max-concurrent", str(max_concurrent)]
+    return start_process(args, port)
+
+
+def start_backend(port, env=None, extra_args=()):
+    """Run the FastAPI backend (via serve_backend.py) from the current scratch directory."""
+    args = [sys.executable, os.path.join(BENCH_DIR, "serve_backend.py"), "--port", str(port), *extra_args]
+    return start_process(args, port, env=env, cwd=os.getcwd(), timeout=120)
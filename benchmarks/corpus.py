@@ -0,0 +1,146 @@
+"""Synthetic document corpora for the benchmarks: PDF, DOCX and HTML files
+built from a fixed vocabulary, each holding a few facts that questions can
+be asked about. Generated without any document library, so the benchmarks
+need nothing beyond the backend's own dependencies.
+
+    from corpus import make_corpus
+    documents, questions = make_corpus(100, paragraphs=8, formats=("pdf", "docx", "html"))
+"""
+import html
+import io
+import random
+import zipfile
+
+VOCABULARY = (
+    "account action agreement analysis annual approval asset audit balance benefit board budget capacity "
+    "change claim client committee compliance contract control cost customer data deadline delivery "
+    "department design device document employee energy equipment estimate expense facility finance "
+    "forecast goal growth guideline hardware incident income inventory invoice issue laptop lease "
+    "license maintenance manager margin market meeting metric network office operation order partner "
+    "payment performance period plan policy portfolio price priority process product program project "
+    "proposal purchase quality quarter rate record region release report request requirement resource "
+    "revenue review risk role safety sales schedule security server service shipment software staff "
+    "standard strategy supplier support system target team training travel update vendor version "
+    "warehouse warranty workflow approved reviewed quarterly annual internal external regional global "
+    "monthly weekly critical standard required optional shared secure remote local primary secondary"
+).split()
+SYLLABLES = ["ka", "lo", "mi", "ra", "te", "zu", "no", "vi", "sa", "re", "da", "po", "qu", "fe", "xi", "bo"]
+
+# Facts planted in every document: (sentence, question) with {name} and {value}
+FACTS = [
+    ("The {name} project budget is {value} thousand dollars.", "What is the budget of the {name} project?"),
+    ("The {name} service desk is open {value} hours a week.", "How many hours a week is the {name} service desk open?"),
+    ("The {name} warehouse ships {value} orders per day.", "How many orders per day does the {name} warehouse ship?"),
+]
+
+DOCX_CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8"?>'
+                      '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                      '<Default Extension="xml" ContentType="application/xml"/></Types>')
+DOCX_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def make_docx(paragraphs):
+    """A minimal .docx (just word/document.xml) that Docx2txtLoader can read."""
+    body = "".join(f"<w:p><w:r><w:t>{html.escape(text)}</w:t></w:r></w:p>" for text in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        archive.writestr("word/document.xml", f'<?xml version="1.0" encoding="UTF-8"?>'
+                                              f'<w:document xmlns:w="{DOCX_NAMESPACE}"><w:body>{body}</w:body>'
+                                              f'</w:document>')
+    return buffer.getvalue()
+
+
+def make_html(title, paragraphs):
+    body = "".join(f"<p>{html.escape(text)}</p>" for text in paragraphs)
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head>"
+            f"<body><h1>{html.escape(title)}</h1>{body}</body></html>").encode("utf-8")
+
+
+def wrap(text, width=90):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def make_pdf(paragraphs, lines_per_page=50):
+    """A plain PDF (Helvetica text, one object per page and content stream)
+    that PyPDFLoader can extract the text from."""
+    lines = []
+    for text in paragraphs:
+        lines.extend(wrap(text))
+        lines.append("")
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, page in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        operations = ["BT /F1 10 Tf 14 TL 40 760 Td"]
+        for line in page:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            operations.append(f"({escaped}) Tj T*")
+        operations.append("ET")
+        stream = "\n".join(operations).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def codename(rng, taken):
+    while True:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+        if name not in taken:
+            taken.add(name)
+            return name
+
+
+def make_corpus(count, paragraphs=8, words=60, formats=("pdf", "docx", "html"), seed=0):
+    """`count` documents cycling through `formats`, each `paragraphs`
+    paragraphs of about `words` words with the FACTS planted among them.
+
+    Returns (documents, questions): documents as (filename, bytes), questions
+    as (question, filename, answer) about the planted facts."""
+    rng = random.Random(seed)
+    taken = set()
+    documents, questions = [], []
+    for i in range(count):
+        name = codename(rng, taken)
+        texts = [" ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+                 for _ in range(paragraphs)]
+        extension = formats[i % len(formats)]
+        filename = f"{name.lower()}-{i}.{extension}"
+        for sentence, question in FACTS:
+            value = str(rng.randrange(10, 1000))
+            slot = rng.randrange(len(texts))
+            texts[slot] = f"{texts[slot]} {sentence.format(name=name, value=value)}"
+            questions.append((question.format(name=name), filename, value))
+        if extension == "pdf":
+            data = make_pdf(texts)
+        elif extension == "docx":
+            data = make_docx(texts)
+        elif extension == "html":
+            data = make_html(f"{name} operations handbook", texts)
+        else:
+            raise ValueError(f"Unknown format {extension!r}")
+        documents.append((filename, data))
+    return documents, questions
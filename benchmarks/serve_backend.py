@@ -0,0 +1,38 @@
+"""Run the backend app on a given port from the current directory.
+
+--fresh-clients builds a new ChatOpenAI (and connection pool) for every
+request, which is how /chat behaved before clients were cached.
+"""
+import argparse
+import os
+import sys
+
+from common import BACKEND_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--fresh-clients", action="store_true")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+    import uvicorn
+    import main as backend
+
+    if args.fresh_clients:
+        import langchain_utils
+        from langchain_openai import ChatOpenAI
+
+        backend.get_rag_chain = lambda model: langchain_utils.AgentRAGChain(ChatOpenAI(
+            model=model,
+            openai_api_key=os.getenv("OPENROUTER_API_KEY"),
+            openai_api_base=langchain_utils.OPENROUTER_API_BASE,
+            request_timeout=langchain_utils.LLM_REQUEST_TIMEOUT
+        ))
+
+    uvicorn.run(backend.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""A local OpenAI-compatible chat completions stub with configurable latency.
+
+Point ChatOpenAI at it with OPENROUTER_API_BASE=http://127.0.0.1:<port>/v1.
+Run standalone with:
+
+    python benchmarks/stub_openai.py --port 9100 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def answer_from_extract(prompt):
+    """For a document prompt: the extract's sentence sharing the most words
+    with the question, if it shares at least two, as a model would answer."""
+    try:
+        extract = prompt.split("Document Extract:\n'''", 1)[1].split("'''", 1)[0]
+        question = prompt.rsplit("User question: ", 1)[1].split("\n", 1)[0]
+    except IndexError:
+        return None
+    words = {word.strip("?.,").lower() for word in question.split() if len(word) > 3}
+    best, overlap = None, 1
+    for sentence in extract.replace("\n", " ").split(". "):
+        shared = len(words & {word.strip("?.,").lower() for word in sentence.split()})
+        if shared > overlap:
+            best, overlap = sentence.strip(), shared
+    return f"According to the documents: {best.rstrip('.')}." if best else None
+
+
+def create_stub_app(latency=0.2, reply=None, ttft=None, token_latency=0.01, max_concurrent=None,
+                    tail_probability=0.0, tail_latency=5.0, error_probability=0.0, flaky_models=None, seed=0):
+    """latency: seconds before a non-streaming reply; ttft/token_latency
+    shape streaming replies (ttft defaults to latency). With max_concurrent,
+    requests beyond that many at once get HTTP 429, like a free-tier model.
+
+    Requests for flaky_models (all models if None) are delayed by another
+    tail_latency seconds with tail_probability, and fail with HTTP 503 with
+    error_probability, for long-tail and failover tests."""
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.calls = 0
+    app.state.calls_by_model = {}
+    app.state.tail_delays = 0
+    app.state.errors = 0
+    app.state.latency = latency
+    app.state.active = 0
+    app.state.peak_active = 0
+    app.state.rate_limited = 0
+    ttft = latency if ttft is None else ttft
+
+    def make_reply(messages):
+        if reply is not None:
+            return reply
+        question = messages[-1]["content"] if messages else ""
+        if "Document Extract:" in question:
+            return answer_from_extract(question) or "NOT FOUND"
+        if "NOT FOUND" in question:
+            return "NOT FOUND"
+        return "This is a stub answer. " + " ".join(question.split()[-8:])
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": app.state.calls, "rate_limited": app.state.rate_limited,
+                "peak_active": app.state.peak_active, "calls_by_model": app.state.calls_by_model,
+                "tail_delays": app.state.tail_delays, "errors": app.state.errors}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        model = body.get("model", "stub")
+        app.state.calls_by_model[model] = app.state.calls_by_model.get(model, 0) + 1
+        if max_concurrent is not None and app.state.active >= max_concurrent:
+            app.state.rate_limited += 1
+            return JSONResponse({"error": {"message": "Rate limit exceeded", "code": 429}}, status_code=429)
+        flaky = flaky_models is None or model in flaky_models
+        if flaky and rng.random() < error_probability:
+            app.state.errors += 1
+            return JSONResponse({"error": {"message": "Provider unavailable", "code": 503}}, status_code=503)
+        delay = 0.0
+        if flaky and rng.random() < tail_probability:
+            app.state.tail_delays += 1
+            delay = tail_latency
+        app.state.active += 1
+        app.state.peak_active = max(app.state.peak_active, app.state.active)
+        try:
+            return await respond(body, delay)
+        finally:
+            if not body.get("stream"):
+                app.state.active -= 1
+
+    async def respond(body, delay=0.0):
+        text = make_reply(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            await asyncio.sleep(app.state.latency + delay)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(text.split()), "total_tokens": 10},
+            })
+
+        async def events():
+            try:
+                await asyncio.sleep(ttft + delay)
+                for i, word in enumerate(text.split(" ")):
+                    if i:
+                        await asyncio.sleep(token_latency)
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                     "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(done)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                app.state.active -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--ttft", type=float, default=None)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    parser.add_argument("--tail-probability", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=5.0)
+    parser.add_argument("--error-probability", type=float, default=0.0)
+    parser.add_argument("--flaky-models", default=None, help="comma-separated; default all models")
+    args = parser.parse_args()
+    app = create_stub_app(args.latency, ttft=args.ttft, token_latency=args.token_latency,
+                          max_concurrent=args.max_concurrent, tail_probability=args.tail_probability,
+                          tail_latency=args.tail_latency, error_probability=args.error_probability,
+                          flaky_models=args.flaky_models.split(",") if args.flaky_models else None)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,32 @@
+import json
+import os
 import requests
 
 API_URL = "http://127.0.0.1:8000"
 # For deployment, set for example:
 # API_URL = "https://your-backend-url.onrender.com"
 
-def upload_document(file):
-    files = {"file": (file.name, file.getvalue())}
-    response = requests.post(f"{API_URL}/upload-doc", files=files, timeout=120)
+# Workspace whose documents this UI uploads, lists and searches
+TENANT_ID = os.getenv("DOCUMIND_TENANT_ID", "default")
+
+def upload_documents(files):
+    """Upload several files (or zip archives of files) in one bulk request."""
+    payload = [("files", (file.name, file.getvalue())) for file in files]
+    response = requests.post(f"{API_URL}/upload-docs", files=payload, data={"tenant_id": TENANT_ID}, timeout=600)
     return response
 
+def get_batch_status(batch_id):
+    try:
+        response = requests.get(f"{API_URL}/batches/{batch_id}", params={"tenant_id": TENANT_ID}, timeout=10)
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except requests.exceptions.ConnectionError:
+        return None
+
 def get_all_documents():
     try:
-        response = requests.get(f"{API_URL}/list-docs", timeout=10)
+        response = requests.get(f"{API_URL}/list-docs", params={"tenant_id": TENANT_ID}, timeout=10)
         if response.status_code == 200:
             return response.json()
         return []
@@ -19,7 +34,7 @@ def get_all_documents():
         return None
 
 def delete_document(file_id):
-    response = requests.post(f"{API_URL}/delete-doc", json={"file_id": file_id}, timeout=30)
+    response = requests.post(f"{API_URL}/delete-doc", json={"file_id": file_id, "tenant_id": TENANT_ID}, timeout=30)
     return response
 
 def send_chat_message(question, model, session_id):
@@ -28,8 +43,29 @@ def send_chat_message(question, model, session_id):
         json={
             "question": question,
             "model": model,
-            "session_id": session_id
+            "session_id": session_id,
+            "tenant_id": TENANT_ID
         },
         timeout=120
     )
-    return response
\ No newline at end of file
+    return response
+
+def stream_chat_message(question, model, session_id):
+    """Yield the events sent by /chat/stream as dicts, as they arrive."""
+    with requests.post(
+        f"{API_URL}/chat/stream",
+        json={
+            "question": question,
+            "model": model,
+            "session_id": session_id,
+            "tenant_id": TENANT_ID
+        },
+        stream=True,
+        timeout=120
+    ) as response:
+        if response.status_code != 200:
+            yield {"type": "error", "detail": response.text}
+            return
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
\ No newline at end of file
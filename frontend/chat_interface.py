@@ -25,9 +25,15 @@ def render_chat(model):
                         session_id=st.session_state.session_id
                     )
                     if response.status_code == 200:
-                        answer = response.json().get("answer", "No response received.")
+                        body = response.json()
+                        answer = body.get("answer", "No response received.")
                         st.markdown(answer)
+                        if body.get("answered_by") and body["answered_by"] != model:
+                            st.caption(f"Answered by the backup model {body['answered_by']}")
                         st.session_state.messages.append({"role": "assistant", "content": answer})
+                    elif response.status_code == 429:
+                        retry_after = response.headers.get("Retry-After", "a few")
+                        st.warning(f"The model is busy right now. Please try again in {retry_after} seconds.")
                     else:
                         st.error(f"Error: {response.text}")
                 except Exception as e:
@@ -1,5 +1,31 @@
 import streamlit as st
-from api_utils import upload_document, get_all_documents, delete_document
+import time
+from api_utils import upload_documents, get_all_documents, delete_document, get_batch_status
+
+
+def track_ingestion_batch(batch_id):
+    """Poll the ingestion jobs of a bulk upload until all have finished, showing their progress."""
+    progress = st.sidebar.progress(0.0)
+    status = st.sidebar.empty()
+    while True:
+        batch = get_batch_status(batch_id)
+        if batch is None:
+            progress.empty()
+            status.empty()
+            return None
+        jobs = batch["jobs"]
+        finished = sum(1 for job in jobs if job["status"] in ("completed", "failed"))
+        if finished == len(jobs):
+            progress.empty()
+            status.empty()
+            return batch
+        progress.progress(finished / len(jobs))
+        status.info(
+            f"⏳ {finished}/{len(jobs)} files indexed — {sum(job['pages_parsed'] for job in jobs)} pages parsed, "
+            f"{sum(job['chunks_embedded'] for job in jobs)} chunks embedded, "
+            f"{sum(job['chunks_written'] for job in jobs)} written"
+        )
+        time.sleep(1)
 
 
 def render_sidebar():
@@ -31,19 +57,36 @@ def render_sidebar():
     # Upload section
     st.sidebar.markdown("""
     <div style="background:#181a2f;border-radius:11px;padding:1.3rem;margin-bottom:0.8rem;">
-      <h4 style="color:#38bdf8;margin-bottom:0.7rem;font-weight:700;">📤 Upload Document</h4>
+      <h4 style="color:#38bdf8;margin-bottom:0.7rem;font-weight:700;">📤 Upload Documents</h4>
     """, unsafe_allow_html=True)
-    uploaded_file = st.sidebar.file_uploader(
-        "Select, drag or drop...", type=["pdf","docx","html"])
+    uploaded_files = st.sidebar.file_uploader(
+        "Select, drag or drop...", type=["pdf","docx","html","zip"], accept_multiple_files=True)
     upload_btn = st.sidebar.button("⬆️ Upload & Index", use_container_width=True)
     st.sidebar.markdown("</div>", unsafe_allow_html=True)
-    if uploaded_file and upload_btn:
-        with st.spinner("Processing document..."):
-            response = upload_document(uploaded_file)
-            if response.status_code == 200:
-                st.sidebar.success(f"✅ Indexed: {uploaded_file.name}", icon="✅")
-            else:
-                st.sidebar.error(f"❌ {response.text}", icon="🚫")
+    if uploaded_files and upload_btn:
+        with st.spinner(f"Uploading {len(uploaded_files)} file(s)..."):
+            response = upload_documents(uploaded_files)
+        if response.status_code in (200, 202):
+            result = response.json()
+            for file in result["files"]:
+                if file["status"] == "duplicate":
+                    state = "being indexed" if file["job_id"] else "indexed"
+                    st.sidebar.info(f"ℹ️ {file['filename']} is already {state}.")
+                elif file["status"] == "rejected":
+                    st.sidebar.error(f"❌ {file['filename']}: {file['error']}", icon="🚫")
+            if result["batch_id"]:
+                batch = track_ingestion_batch(result["batch_id"])
+                if batch is None:
+                    st.sidebar.error("❌ Lost track of the indexing jobs", icon="🚫")
+                else:
+                    completed = batch["counts"].get("completed", 0)
+                    if completed:
+                        st.sidebar.success(f"✅ Indexed {completed} of {len(batch['jobs'])} file(s)", icon="✅")
+                    for job in batch["jobs"]:
+                        if job["status"] == "failed":
+                            st.sidebar.error(f"❌ Failed to index {job['filename']}: {job['error']}", icon="🚫")
+        else:
+            st.sidebar.error(f"❌ {response.text}", icon="🚫")
 
     # Documents section
     st.sidebar.markdown("""
@@ -66,6 +109,8 @@ def render_sidebar():
                 delete_response = delete_document(doc["id"])
                 if delete_response.status_code == 200:
                     st.rerun()
+                else:
+                    st.sidebar.error(f"❌ {delete_response.json().get('detail', delete_response.text)}", icon="🚫")
     else:
         st.sidebar.markdown("""
         <div style="background:#222238;border-radius:8px;padding:0.8rem;text-align:center;">
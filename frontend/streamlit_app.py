@@ -1,7 +1,7 @@
 import streamlit as st
 import uuid
 from sidebar import render_sidebar
-from api_utils import send_chat_message
+from api_utils import stream_chat_message
 
 st.set_page_config(
     page_title="DocuMind Nexus",
@@ -127,20 +127,23 @@ if prompt := st.chat_input("Ask anything about your documents..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
 
     with st.chat_message("assistant", avatar="🧠"):
-        with st.spinner("🧠 Thinking..."):
-            try:
-                response = send_chat_message(prompt, model, st.session_state.session_id)
-                if response.status_code == 200:
-                    payload = response.json()
+        errors = []
 
-                    returned_session_id = payload.get("session_id")
-                    if returned_session_id:
-                        st.session_state.session_id = returned_session_id
+        def answer_tokens():
+            # Tokens are rendered as they arrive; the other events update session state
+            for event in stream_chat_message(prompt, model, st.session_state.session_id):
+                if event["type"] == "start":
+                    st.session_state.session_id = event["session_id"]
+                elif event["type"] == "token":
+                    yield event["content"]
+                elif event["type"] == "error":
+                    errors.append(event["detail"])
 
-                    answer = payload.get("answer", "")
-                    st.markdown(answer)
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
-                else:
-                    st.error(f"❌ Error: {response.text}")
-            except Exception as e:
-                st.error(f"❌ {str(e)}")
\ No newline at end of file
+        try:
+            answer = st.write_stream(answer_tokens())
+            if errors:
+                st.error(f"❌ Error: {errors[0]}")
+            if isinstance(answer, str) and answer:
+                st.session_state.messages.append({"role": "assistant", "content": answer})
+        except Exception as e:
+            st.error(f"❌ {str(e)}")
\ No newline at end of file